@@ -0,0 +1,9 @@
+"""Loading of pluggable backends named by dotted path in settings."""
+from django.utils.importlib import import_module
+
+
+
+def get_backend(path):
+    """Return the backend class at dotted ``path``."""
+    module_name, name = path.rsplit('.', 1)
+    return getattr(import_module(module_name), name)
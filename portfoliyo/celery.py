@@ -1,17 +1,19 @@
 """Celery configuration."""
 from __future__ import absolute_import
 
-from collections import Sequence
+from collections import Sequence, Set
+from datetime import timedelta
 import logging
 import threading
+import time
 
-from celery import Celery, Task
+from celery import Celery, Task, signals
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.db import transaction, models
 from django.db.models import loading
 
-from portfoliyo import xact
+from portfoliyo import clients, idempotency, xact
 
 
 if 'raven.contrib.django' in settings.INSTALLED_APPS: # pragma: no cover
@@ -25,6 +27,12 @@ if 'raven.contrib.django' in settings.INSTALLED_APPS: # pragma: no cover
 logger = logging.getLogger(__name__)
 
 
+# task keyword argument carrying (enqueued, committed) timestamps of a call
+TIMESTAMPS_KWARG = '_timestamps'
+# task keyword argument carrying an explicit idempotency key for a call
+IDEMPOTENCY_KEY_KWARG = '_idempotency_key'
+
+
 
 _thread_data = threading.local()
 
@@ -57,13 +65,44 @@ class TransactionTask(Task):
     This implementation is inspired by
     https://github.com/chrisdoble/django-celery-transactions
 
+    When the transaction commits, pending calls of tasks that set
+    ``coalesce`` are coalesced (see ``coalesce_calls``) before being sent.
+
+    Each sent call is stamped with the times it was made (enqueued) and its
+    transaction committed; when it runs, the worker records how long it was
+    pending commit, waited in the queue, and ran (see ``queues.record_task``).
+
+    Tasks with side effects that mustn't be repeated set ``idempotent``: a
+    call of such a task is skipped if it was already done (see the
+    ``idempotency`` module). Calls are identified by their task ID, which is
+    kept when a message is redelivered or a task retried, unless an explicit
+    key is given in the ``_idempotency_key`` keyword argument. While running,
+    the call's key is available as ``task.request.idempotency_key``, for
+    deriving keys of individual side effects.
+
     """
+    # Identical pending calls of this task are sent only once.
+    coalesce = False
+
+    # If ``coalesce`` is set, pending calls differing only in this positional
+    # argument (a list, e.g. of IDs) are merged into one call. For tasks that
+    # dispatch on their first argument (like ``push_event``), a dict mapping
+    # first-argument values to the index to merge for that value.
+    merge_arg = None
+
+    # Calls already done are skipped; see above.
+    idempotent = False
+
+    # Base delay (doubled for each further retry) for ``retry_with_backoff``.
+    retry_backoff = 10
+
+
     def original_apply_async(self, *a, **kw):
         """Shortcut to reach original ``apply_async`` method."""
         return super(TransactionTask, self).apply_async(*a, **kw)
 
 
-    def apply_async(self, *args, **kw):
+    def apply_async(self, args=None, kwargs=None, **options):
         """
         If in transaction, push onto pending-tasks instead of sending to queue.
 
@@ -71,10 +110,96 @@ class TransactionTask(Task):
 
         """
         if _in_transaction():
-            _get_pending_tasks().append((self, args, kw))
+            _get_pending_tasks().append(
+                (self, tuple(args or ()), dict(kwargs or {}), options,
+                 time.time())
+                )
         else:
             # no transaction in progress, send to queue immediately
-            return self.original_apply_async(*args, **kw)
+            now = time.time()
+            return self.publish(args, kwargs, options, now, now)
+
+
+    def publish(self, args, kwargs, options, enqueued_at, committed_at, **kw):
+        """Send call to queue, stamped with its enqueue and commit times."""
+        if not self.app.conf.CELERY_ALWAYS_EAGER:
+            kwargs = dict(kwargs or {})
+            kwargs[TIMESTAMPS_KWARG] = (enqueued_at, committed_at)
+        return self.original_apply_async(args, kwargs, **dict(options, **kw))
+
+
+    def __call__(self, *args, **kwargs):
+        """Execute task; record its timing if the call was timestamped."""
+        timestamps = kwargs.pop(TIMESTAMPS_KWARG, None)
+        key = kwargs.pop(IDEMPOTENCY_KEY_KWARG, None)
+        started_at = time.time()
+        try:
+            return self._run_once(key, args, kwargs)
+        finally:
+            if timestamps is not None:
+                _record_timing(self.name, timestamps, started_at)
+
+
+    def _run_once(self, key, args, kwargs):
+        """Run task, unless ``idempotent`` and already done."""
+        # The worker has already pushed this call's request; unlike
+        # ``Task.__call__``, we call ``run`` directly so it sees that request
+        # (needed e.g. for ``retry``) rather than an empty one.
+        request = self.request
+        key = key or request.id
+        if not self.idempotent or request.is_eager or key is None:
+            return self.run(*args, **kwargs)
+        key = '%s:%s' % (self.name, key)
+        if idempotency.is_done(key):
+            logger.info("Skipping %s: already done." % key)
+            return None
+        request.idempotency_key = key
+        ret = self.run(*args, **kwargs)
+        idempotency.mark_done(key)
+        return ret
+
+
+    def retry_with_backoff(self, exc):
+        """Retry task after exponential backoff (raises ``RetryTaskError``)."""
+        return self.retry(
+            exc=exc, countdown=self.retry_backoff * 2 ** self.request.retries)
+
+
+    def merge_index(self, args):
+        """Return index of positional argument to merge calls on, or None."""
+        if isinstance(self.merge_arg, dict):
+            return self.merge_arg.get(args[0]) if args else None
+        return self.merge_arg
+
+
+    def coalesce_kind(self, args):
+        """
+        Return a key for the kind of call made with positional ``args``.
+
+        Only consecutive calls of the same kind are coalesced, so that e.g. a
+        ``student_removed`` event can't be coalesced into a preceding
+        ``student_added`` event for the same student.
+
+        """
+        if isinstance(self.merge_arg, dict):
+            return tuple(args[:1])
+        return ()
+
+
+
+def _record_timing(task_name, timestamps, started_at):
+    """Record timing of a task call; log (rather than raise) any failure."""
+    from portfoliyo import queues
+    enqueued_at, committed_at = timestamps
+    try:
+        queues.record_task(
+            task_name,
+            pending=committed_at - enqueued_at,
+            wait=started_at - committed_at,
+            run=time.time() - started_at,
+            )
+    except Exception as e:
+        logger.warning("Recording task timing failed: %r", e, exc_info=True)
 
 
 
@@ -93,15 +218,106 @@ xact.post_rollback.connect(_discard_tasks)
 
 
 def _send_tasks(**kw):
-    """Transaction is committed; send all pending tasks."""
+    """Transaction is committed; coalesce pending tasks and send them."""
     pending = _get_pending_tasks()
-    while pending:
-        task, a, kw = pending.pop(0)
-        task.original_apply_async(*a, **kw)
+    calls = coalesce_calls(pending)
+    pending[:] = []
+    if not calls:
+        return
+    committed_at = time.time()
+    if celery.conf.CELERY_ALWAYS_EAGER:
+        for task, args, kwargs, options, enqueued_at in calls:
+            task.publish(args, kwargs, options, enqueued_at, committed_at)
+        return
+    # publish all tasks with a single producer (and broker connection)
+    with celery.producer_or_acquire() as producer:
+        for task, args, kwargs, options, enqueued_at in calls:
+            task.publish(
+                args,
+                kwargs,
+                options,
+                enqueued_at,
+                committed_at,
+                producer=producer,
+                )
 
 xact.post_commit.connect(_send_tasks)
 
 
+
+def coalesce_calls(calls):
+    """
+    Coalesce list of (task, args, kwargs, options, enqueued_at) task calls.
+
+    For tasks that set ``coalesce``, a call identical to an earlier one is
+    dropped, and a call differing from an earlier one only in the task's merge
+    argument is merged into it: the merged call's list contains all items from
+    both calls, without duplicates.
+
+    A call is only coalesced with earlier calls of the same task and kind (see
+    ``TransactionTask.coalesce_kind``) made since the last call of that task
+    of a different kind. Coalesced calls take the place (and enqueue time) of
+    the earliest call; calls of other tasks may thus be reordered relative to
+    them.
+
+    Return list of remaining calls.
+
+    """
+    coalesced = []
+    # maps task name to (kind, indices in ``coalesced``) of the latest run of
+    # calls of that task and kind
+    runs = {}
+    for call in calls:
+        task, args = call[:2]
+        if not task.coalesce:
+            coalesced.append(call)
+            continue
+        kind = task.coalesce_kind(args)
+        run_kind, indices = runs.get(task.name, (None, []))
+        if run_kind != kind:
+            indices = []
+            runs[task.name] = (kind, indices)
+        for i in indices:
+            merged = _merge_call(coalesced[i], call)
+            if merged is not None:
+                coalesced[i] = merged
+                break
+        else:
+            indices.append(len(coalesced))
+            coalesced.append(call)
+    return coalesced
+
+
+
+def _merge_call(earlier, later):
+    """Return ``earlier`` task call merged with ``later``, or None if can't."""
+    task, args, kwargs, options, enqueued_at = earlier
+    if (kwargs, options) != later[2:4] or len(args) != len(later[1]):
+        return None
+    later_args = later[1]
+    if args == later_args:
+        return earlier
+    index = task.merge_index(args)
+    if index is None or index >= len(args):
+        return None
+    for i, (arg, later_arg) in enumerate(zip(args, later_args)):
+        if i != index and arg != later_arg:
+            return None
+    to_merge = args[index]
+    other = later_args[index]
+    if not (_is_mergeable(to_merge) and _is_mergeable(other)):
+        return None
+    merged = list(to_merge) + [v for v in other if v not in to_merge]
+    args = args[:index] + (type(to_merge)(merged),) + args[index + 1:]
+    return task, args, kwargs, options, enqueued_at
+
+
+
+def _is_mergeable(val):
+    """Return ``True`` if ``val`` is a sequence (not string) or set."""
+    return is_sequence(val) or isinstance(val, Set)
+
+
 class TransactionCelery(Celery):
     """Celery app class that uses TransactionTask task base by default."""
     def task(self, *a, **kw):
@@ -127,6 +343,20 @@ class ModelReference(object):
         return (self.app_label, self.model_name, self.pk)
 
 
+    def __eq__(self, other):
+        if not isinstance(other, ModelReference):
+            return NotImplemented
+        return self.as_tuple() == other.as_tuple()
+
+
+    def __ne__(self, other):
+        return not self == other
+
+
+    def __hash__(self):
+        return hash(self.as_tuple())
+
+
     @classmethod
     def from_instance(cls, instance):
         """
@@ -174,6 +404,61 @@ class ModelReference(object):
         return val
 
 
+    @classmethod
+    def load(cls, vals, cache, select_related=None, ignore_missing=False):
+        """
+        Load all instances referred to in ``vals`` into ``cache`` dict.
+
+        ``vals`` is a sequence of values that may be (or be sequences of)
+        ``ModelReference``s. Instances are fetched with one query per model
+        class. ``select_related`` may map "app_label.model_name" strings to a
+        sequence of fields to ``select_related`` when fetching that model.
+
+        Raise ``DereferenceFailed`` if any referenced instance can't be found,
+        unless ``ignore_missing`` is set (then it is just left out of
+        ``cache``).
+
+        """
+        pks_by_model = {}
+        for ref in cls._collect(vals):
+            if ref.as_tuple() not in cache:
+                pks_by_model.setdefault(
+                    (ref.app_label, ref.model_name), set()).add(ref.pk)
+
+        for (app_label, model_name), pks in pks_by_model.items():
+            model_class = loading.cache.get_model(app_label, model_name)
+            if model_class is None:
+                raise DereferenceFailed(
+                    "Model class %s.%s not found." % (app_label, model_name))
+            qs = model_class._default_manager.all()
+            related = (select_related or {}).get(
+                '%s.%s' % (app_label, model_name))
+            if related:
+                qs = qs.select_related(*related)
+            instances = qs.in_bulk(pks)
+            missing = pks.difference(instances)
+            if missing and not ignore_missing:
+                raise DereferenceFailed(
+                    "Instances of %s with pks %s not found." % (
+                        model_class, sorted(missing)))
+            logger.debug(
+                "ModelTask loaded %s %s.%s instances" % (
+                    len(instances), app_label, model_name))
+            for pk, instance in instances.items():
+                cache[(app_label, model_name, pk)] = instance
+
+
+    @classmethod
+    def _collect(cls, vals):
+        """Yield all ``ModelReference``s in (sequences in) ``vals``."""
+        for val in vals:
+            if is_sequence(val):
+                for ref in cls._collect(val):
+                    yield ref
+            elif isinstance(val, cls):
+                yield val
+
+
     def _dereference(self, cache):
         """Return referenced model instance, or raise ``DereferenceFailed``."""
         t = self.as_tuple()
@@ -222,9 +507,19 @@ class ModelTask(TransactionTask):
     At execution time, the ``ModelReference`` is re-hydrated into an actual
     model object, which is passed to the task function. If any model arguments
     cannot be re-hydrated (i.e. the row has disappeared from the database), the
-    task is not executed.
+    task is not executed; except that instances missing from the list argument
+    that calls of a coalescing task are merged on (see ``merge_arg``) are just
+    dropped from it, as a merged call stands for many independent calls.
+
+    All of a task call's references are re-hydrated with one query per model
+    class; a task may set ``select_related`` to a dict mapping
+    "app_label.model_name" strings to fields to ``select_related`` for that
+    model.
 
     """
+    select_related = None
+
+
     def apply_async(self, args=None, kwargs=None, **kw):
         """Dehydrate any model arguments to ``ModelReference`` instances."""
         args = [ModelReference.from_instance(a) for a in args]
@@ -243,6 +538,13 @@ class ModelTask(TransactionTask):
         """
         cache = {}
         try:
+            ModelReference.load(
+                list(args) + kw.values(),
+                cache,
+                self.select_related,
+                ignore_missing=True,
+                )
+            args = self._drop_missing_merged(args, cache)
             args = [ModelReference.dereference(a, cache) for a in args]
             kw = dict(
                 (k, ModelReference.dereference(v, cache))
@@ -254,6 +556,30 @@ class ModelTask(TransactionTask):
         return super(ModelTask, self).__call__(*args, **kw)
 
 
+    def _drop_missing_merged(self, args, cache):
+        """Drop references not loaded into ``cache`` from merged list arg."""
+        index = self.merge_index(args) if self.coalesce else None
+        if index is None or index >= len(args):
+            return args
+        refs = args[index]
+        if not _is_mergeable(refs):
+            return args
+        kept = [
+            ref for ref in refs
+            if not isinstance(ref, ModelReference) or ref.as_tuple() in cache
+            ]
+        if len(kept) == len(refs):
+            return args
+        logger.warning(
+            "ModelTask %s dropped %s missing instances.",
+            self.name,
+            len(refs) - len(kept),
+            )
+        args = list(args)
+        args[index] = type(refs)(kept)
+        return args
+
+
 
 if not settings.CELERY_ALWAYS_EAGER: # pragma: no cover
     if not settings.REDIS_URL:
@@ -271,4 +597,29 @@ celery.conf.update(
     CELERY_DISABLE_RATE_LIMITS=True,
     CELERY_TIMEZONE=settings.TIME_ZONE,
     CELERY_STORE_ERRORS_EVEN_IF_IGNORED=True,
+    BROKER_TRANSPORT_OPTIONS={
+        'visibility_timeout': settings.CELERY_VISIBILITY_TIMEOUT_SECONDS},
+    CELERY_ROUTES=dict(
+        (task_name, {'queue': queue})
+        for task_name, queue in settings.PORTFOLIYO_TASK_QUEUES.items()
+        ),
     )
+
+if settings.QUEUE_LATENCY_PROBE_SECONDS: # pragma: no cover
+    celery.conf.update(
+        CELERYBEAT_SCHEDULE={
+            'probe-queues': {
+                'task': 'portfoliyo.tasks.probe_queues',
+                'schedule': timedelta(
+                    seconds=settings.QUEUE_LATENCY_PROBE_SECONDS),
+                },
+            },
+        )
+
+
+
+def _reset_clients(**kw):
+    """Worker process forked; don't share parent's client connections."""
+    clients.reset()
+
+signals.worker_process_init.connect(_reset_clients)
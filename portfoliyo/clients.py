@@ -0,0 +1,245 @@
+"""
+Process-lifetime registry of API clients with persistent HTTP connections.
+
+Workers make many requests to the same few HTTP APIs (Twilio, Pusher). Rather
+than build a new client, and so pay for a new TLS handshake, for every
+request, clients are registered here by name and reused for the life of the
+process; their ``PersistentConnection`` is kept open between requests (HTTP
+keep-alive) and transparently reopened when the server closes it.
+
+A request is only ever retried if it failed while it was being written, so it
+provably never (completely) reached the server; that way (e.g.) an SMS is
+never sent twice. A failure while reading the response, even a reset or empty
+response, is not retried, nor is a timed-out request.
+
+Each connection keeps ``ConnectionStats`` of its requests, failures and
+latency; ``stats()`` returns them for all registered clients, and they are
+logged every ``STATS_LOG_INTERVAL`` requests.
+
+"""
+from __future__ import absolute_import
+
+import httplib
+import logging
+import select
+import socket
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+# log each connection's stats after this many requests over it
+STATS_LOG_INTERVAL = 1000
+
+# seconds to wait for connecting to, sending to or reading from a server
+TIMEOUT_SECONDS = 10
+
+
+
+_lock = threading.Lock()
+
+# maps client name to (key, client) tuple
+_clients = {}
+
+
+
+def get(name, factory, key=None):
+    """
+    Return the process's client registered as ``name``.
+
+    If there is none yet, or it was created with a different ``key`` (e.g.
+    because the settings it was created from have changed), create it by
+    calling ``factory()``.
+
+    """
+    with _lock:
+        registered = _clients.get(name)
+        if registered is None or registered[0] != key:
+            if registered is not None:
+                _close(registered[1])
+            registered = _clients[name] = (key, factory())
+        return registered[1]
+
+
+
+def reset():
+    """Close and forget all registered clients."""
+    with _lock:
+        for key, client in _clients.values():
+            _close(client)
+        _clients.clear()
+
+
+
+def stats():
+    """Return dict mapping client names to dict of their connection stats."""
+    with _lock:
+        return dict(
+            (name, client.stats.as_dict())
+            for name, (key, client) in _clients.items()
+            if getattr(client, 'stats', None) is not None
+            )
+
+
+
+def _close(client):
+    close = getattr(client, 'close', None)
+    if close is not None:
+        close()
+
+
+
+class ConnectionStats(object):
+    """Counts and latency of requests made over a connection."""
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.connects = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_error = None
+
+
+    def record(self, seconds, error=None):
+        """Record a request that took ``seconds``, and ``error`` if failed."""
+        self.requests += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        if error is not None:
+            self.failures += 1
+        self.last_error = error
+
+
+    @property
+    def healthy(self):
+        """The most recent request (if any) succeeded."""
+        return self.last_error is None
+
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'failures': self.failures,
+            'connects': self.connects,
+            'mean_seconds': (
+                self.total_seconds / self.requests if self.requests else 0.0),
+            'max_seconds': self.max_seconds,
+            'healthy': self.healthy,
+            'last_error': self.last_error and repr(self.last_error),
+            }
+
+
+
+class PersistentConnection(object):
+    """
+    An HTTP(S) connection to one host, kept open across requests.
+
+    Requests are serialized, so a connection may be shared between threads.
+    Before a request over a previously-used connection, the connection is
+    reopened if the server has closed it while idle. If sending a request
+    over a previously-used connection fails nonetheless (see
+    ``never_reached_server``), the connection is reopened and the request
+    retried once.
+
+    """
+    def __init__(self, host, port=443, timeout=TIMEOUT_SECONDS):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.stats = ConnectionStats()
+        self._connection = None
+        self._lock = threading.Lock()
+
+
+    def request(self, method, path, body=None, headers=None):
+        """Make request; return (status, response body) tuple."""
+        with self._lock:
+            start = time.time()
+            reused = self._connection is not None
+            try:
+                try:
+                    response = self._request(method, path, body, headers)
+                except (socket.error, httplib.HTTPException) as e:
+                    if not (reused and never_reached_server(e)):
+                        raise
+                    self.close()
+                    response = self._request(method, path, body, headers)
+            except Exception as e:
+                self.close()
+                self.stats.record(time.time() - start, e)
+                logger.warning(
+                    "Request to %s failed: %r", self.host, e, exc_info=True)
+                raise
+            self.stats.record(time.time() - start)
+            if not self.stats.requests % STATS_LOG_INTERVAL:
+                logger.info(
+                    "Connection to %s stats: %r",
+                    self.host,
+                    self.stats.as_dict(),
+                    )
+            return response
+
+
+    def close(self):
+        """Close the underlying connection (it reopens on next request)."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+    def _request(self, method, path, body, headers):
+        if self._connection is None:
+            connection_class = httplib.HTTPConnection
+            if self.port == 443:
+                connection_class = httplib.HTTPSConnection
+            self._connection = connection_class(
+                self.host, self.port, timeout=self.timeout)
+            self.stats.connects += 1
+        elif _closed_by_server(self._connection):
+            self.close()
+            return self._request(method, path, body, headers)
+        try:
+            self._connection.request(method, path, body, headers or {})
+        except socket.error as e:
+            # the request was not (completely) sent
+            e.unsent = True
+            raise
+        response = self._connection.getresponse()
+        # must read the entire response before the connection can be reused
+        content = response.read()
+        if response.will_close:
+            self.close()
+        return response.status, content
+
+
+
+def _closed_by_server(connection):
+    """
+    Return True if the server has closed idle ``connection``.
+
+    An idle keep-alive connection should have nothing to read; if it is
+    readable, the server has closed it (or reset it).
+
+    """
+    if connection.sock is None:
+        return False
+    readable, __, __ = select.select([connection.sock], [], [], 0)
+    return bool(readable)
+
+
+
+def never_reached_server(error):
+    """
+    Return True if ``error`` shows that a request never reached the server.
+
+    That is only the case if writing the request failed before it was
+    completely sent. A failure while reading the response (even a connection
+    reset or empty status line) may come after the server received and acted
+    on the request, and so may a timeout.
+
+    """
+    if isinstance(error, socket.timeout):
+        return False
+    return getattr(error, 'unsent', False)
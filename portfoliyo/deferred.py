@@ -0,0 +1,74 @@
+"""
+In-process calls deferred until the current transaction commits.
+
+Like transactional Celery tasks (see ``celery.TransactionTask``), but for
+cheap side effects run in the committing process, e.g. keeping Redis indexes
+and caches of database state up to date: applied only if and once the
+transaction commits, so they can't reflect changes that are rolled back, nor
+be undone by a concurrent reader before the changes are visible.
+
+"""
+import logging
+import threading
+
+from django.db import transaction
+
+from portfoliyo import xact
+
+
+logger = logging.getLogger(__name__)
+
+
+_thread_data = threading.local()
+
+
+
+def _get_pending_calls():
+    """Return calling thread's pending deferred calls."""
+    return _thread_data.__dict__.setdefault('pending_calls', [])
+
+
+
+def in_transaction():
+    """Return True if currently in a transaction."""
+    return transaction.is_managed()
+
+
+
+def on_commit(func, *args):
+    """
+    Call ``func(*args)`` when the current transaction commits.
+
+    If there is no transaction in progress, call it immediately. If the
+    transaction is rolled back, the call is discarded.
+
+    """
+    if in_transaction():
+        _get_pending_calls().append((func, args))
+    else:
+        func(*args)
+
+
+
+def _discard_calls(**kw):
+    """Transaction is rolled back; discard all pending calls."""
+    _get_pending_calls()[:] = []
+
+xact.post_rollback.connect(_discard_calls)
+
+
+
+def _run_calls(**kw):
+    """Transaction is committed; make pending calls, in order."""
+    pending = _get_pending_calls()
+    calls = pending[:]
+    pending[:] = []
+    for func, args in calls:
+        # the transaction is committed; failing now can't help anyone
+        try:
+            func(*args)
+        except Exception as e:
+            logger.warning(
+                "Deferred call %r failed: %r", func, e, exc_info=True)
+
+xact.post_commit.connect(_run_calls)
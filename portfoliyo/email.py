@@ -2,7 +2,7 @@
 Email-sending.
 
 """
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.template.loader import render_to_string
 from django.conf import settings
 
@@ -41,6 +41,19 @@ def send_multipart(subject, text_part, html_part, recipients,
     """
     Send a multi-part email with both HTML and text parts.
 
+    Arguments other than ``fail_silently`` are the same as for the
+    ``make_multipart`` function in this module.
+
+    """
+    msg = make_multipart(subject, text_part, html_part, recipients, sender)
+    return msg.send(fail_silently)
+
+
+
+def make_multipart(subject, text_part, html_part, recipients, sender=None):
+    """
+    Return a multi-part email message with both HTML and text parts.
+
     ``subject`` should be the email subject as a string (newlines will be
     replaced with spaces).
 
@@ -59,4 +72,33 @@ def send_multipart(subject, text_part, html_part, recipients,
     subject = u" ".join(subject.splitlines()).strip()
     msg = EmailMultiAlternatives(subject, text_part, sender, recipients)
     msg.attach_alternative(html_part, "text/html")
-    return msg.send(fail_silently)
+    return msg
+
+
+
+def send_messages(messages, fail_silently=False):
+    """
+    Send all given email messages over a single mail-server connection.
+
+    Return the list of messages sent. With ``fail_silently``, messages that
+    could not be sent (all of them, if no connection could be opened) are
+    left out of it.
+
+    """
+    if not messages:
+        return []
+    connection = get_connection(fail_silently=fail_silently)
+    opened = connection.open()
+    sent = []
+    try:
+        for message in messages:
+            result = connection.send_messages([message])
+            if result is None:
+                # no connection could be opened
+                break
+            if result:
+                sent.append(message)
+    finally:
+        if opened:
+            connection.close()
+    return sent
@@ -0,0 +1,50 @@
+"""
+Idempotency keys for side effects.
+
+A side effect (sending an SMS, email or Pusher event) identified by a
+deterministic key is recorded as done in Redis once it succeeds, and
+remembered for ``IDEMPOTENCY_TTL_SECONDS``; repeating it with the same key in
+that time is a cheap no-op. This makes it safe to redeliver or retry tasks
+with side effects (see ``TransactionTask.idempotent``).
+
+"""
+import logging
+
+from django.conf import settings
+
+from portfoliyo import redis
+
+
+logger = logging.getLogger(__name__)
+
+
+KEY_PATTERN = 'done:%s'
+
+
+
+def is_done(key):
+    """Return True if the side effect identified by ``key`` is done."""
+    return redis.client.get(KEY_PATTERN % key) is not None
+
+
+
+def mark_done(key):
+    """Record that the side effect identified by ``key`` is done."""
+    redis.client.setex(KEY_PATTERN % key, settings.IDEMPOTENCY_TTL_SECONDS, 1)
+
+
+
+def once(key, func, *args, **kwargs):
+    """
+    Call ``func`` with given args unless already done for ``key``.
+
+    If ``key`` is None, always call ``func``. Return True if it was called.
+
+    """
+    if key is not None and is_done(key):
+        logger.info("Skipping %s: already done.", key)
+        return False
+    func(*args, **kwargs)
+    if key is not None:
+        mark_done(key)
+    return True
@@ -0,0 +1,129 @@
+"""
+Index of teacher and group signup codes.
+
+Every inbound SMS is checked for a signup code (see ``sms.hook.parse_code``).
+The backend configured in the ``PORTFOLIYO_CODE_INDEX_BACKEND`` setting finds
+the owner of a code; it is kept up to date by ``Profile`` and ``Group`` save
+and delete signals (see ``index`` and ``unindex``), once their transaction
+commits: a code must never go missing from a complete index.
+
+"""
+from django.conf import settings
+
+from portfoliyo import deferred, redis
+from portfoliyo.backends import get_backend
+
+
+
+class DatabaseCodes(object):
+    """
+    Look codes up directly in the database; no index is kept.
+
+    Takes up to two queries (group, then teacher) per lookup.
+
+    """
+    def lookup(self, code):
+        """Return (teacher, group) owning ``code``; (None, None) if none."""
+        from .models import Group, Profile
+        try:
+            group = Group.objects.select_related('owner').get(code=code)
+        except Group.DoesNotExist:
+            try:
+                return (Profile.objects.get(code=code), None)
+            except Profile.DoesNotExist:
+                return (None, None)
+        return (group.owner, group)
+
+
+    def index(self, code, kind, pk):
+        pass
+
+
+    def unindex(self, code):
+        pass
+
+
+
+class RedisCodes(DatabaseCodes):
+    """
+    Keep a Redis hash mapping codes to their owners.
+
+    Values are e.g. ``group:3`` or ``profile:5``. A lookup takes a single
+    Redis query, plus a single database query only if the code exists. The
+    hash is (re)built from the database when first needed, e.g. after Redis
+    is flushed; a marker field records that it is complete.
+
+    """
+    KEY = 'codes'
+    # no code is empty, so this can't collide with one
+    COMPLETE_FIELD = ''
+
+
+    def lookup(self, code):
+        """Return (teacher, group) owning ``code``; (None, None) if none."""
+        from .models import Group, Profile
+        owner, complete = redis.client.hmget(
+            self.KEY, [code, self.COMPLETE_FIELD])
+        if complete is None:
+            owner = self.rebuild().get(code)
+        if owner is None:
+            return (None, None)
+        kind, pk = owner.split(':')
+        try:
+            if kind == 'group':
+                group = Group.objects.select_related('owner').get(
+                    pk=pk, code=code)
+                return (group.owner, group)
+            return (Profile.objects.get(pk=pk, code=code), None)
+        except (Group.DoesNotExist, Profile.DoesNotExist):
+            # stale entry (e.g. indexed in a rolled-back transaction)
+            redis.client.hdel(self.KEY, code)
+            return super(RedisCodes, self).lookup(code)
+
+
+    def index(self, code, kind, pk):
+        redis.client.hset(self.KEY, code, '%s:%s' % (kind, pk))
+
+
+    def unindex(self, code):
+        redis.client.hdel(self.KEY, code)
+
+
+    def rebuild(self):
+        """Index all codes in the database; return mapping of those indexed."""
+        from .models import Group, Profile
+        mapping = {}
+        profile_codes = Profile.objects.filter(
+            code__isnull=False).values_list('code', 'id')
+        for code, pk in profile_codes:
+            mapping[code] = 'profile:%s' % pk
+        # group codes take precedence, as in ``DatabaseCodes``
+        for code, pk in Group.objects.values_list('code', 'id'):
+            mapping[code] = 'group:%s' % pk
+        # entries indexed meanwhile are overwritten, not removed
+        fields = dict(mapping)
+        fields[self.COMPLETE_FIELD] = 1
+        redis.client.hmset(self.KEY, fields)
+        return mapping
+
+
+
+backend = get_backend(settings.PORTFOLIYO_CODE_INDEX_BACKEND)()
+
+
+
+def lookup(code):
+    """Return (teacher, group) owning ``code``; (None, None) if none."""
+    return backend.lookup(code)
+
+
+
+def index(code, kind, pk):
+    """Record that ``code`` is owned by ``kind`` (group or profile) ``pk``."""
+    deferred.on_commit(backend.index, code, kind, pk)
+
+
+
+def unindex(code):
+    """Record that ``code`` is no longer owned by anyone."""
+    deferred.on_commit(backend.unindex, code)
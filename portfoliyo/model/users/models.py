@@ -13,7 +13,7 @@ from django.utils import timezone
 from model_utils import Choices
 
 from portfoliyo import tasks
-from . import managers
+from . import codes, managers, sms_contexts
 
 
 # monkeypatch Django's User.email to be sufficiently long and unique/nullable
@@ -97,6 +97,9 @@ class Profile(models.Model):
     notify_added_to_village = models.BooleanField(default=True)
     notify_joined_my_village = models.BooleanField(default=True)
     notify_teacher_post = models.BooleanField(default=True)
+    # seconds to wait for more notifications before sending an email (null
+    # means use the NOTIFICATION_EMAIL_DELAY_SECONDS setting)
+    notification_delay = models.PositiveIntegerField(blank=True, null=True)
 
 
     objects = managers.ProfileManager()
@@ -245,6 +248,25 @@ class Profile(models.Model):
 
 
 
+def profile_saved(sender, instance, **kwargs):
+    if instance.code:
+        codes.index(instance.code, 'profile', instance.id)
+    sms_contexts.invalidate(instance.id)
+
+
+
+def profile_deleted(sender, instance, **kwargs):
+    if instance.code:
+        codes.unindex(instance.code)
+    sms_contexts.invalidate(instance.id)
+
+
+
+signals.post_save.connect(profile_saved, sender=Profile)
+signals.post_delete.connect(profile_deleted, sender=Profile)
+
+
+
 class TextSignup(models.Model):
     """An in-progress or completed family-member SMS signup."""
     # signup status; what are we awaiting?
@@ -259,6 +281,51 @@ class TextSignup(models.Model):
 
 
 
+def signup_changed(sender, instance, **kwargs):
+    sms_contexts.invalidate(instance.family_id)
+
+
+
+signals.post_save.connect(signup_changed, sender=TextSignup)
+signals.post_delete.connect(signup_changed, sender=TextSignup)
+
+
+
+class InboundSms(models.Model):
+    """
+    A received SMS, stored to be processed asynchronously.
+
+    Twilio retries a webhook that doesn't respond in time, so each message is
+    stored only once, keyed by its Twilio ``MessageSid``.
+
+    """
+    sid = models.CharField(max_length=64, unique=True)
+    source = models.CharField(max_length=20)
+    to = models.CharField(max_length=20)
+    body = models.TextField()
+    received = models.DateTimeField(default=timezone.now)
+    processed = models.DateTimeField(blank=True, null=True)
+
+
+    def __unicode__(self):
+        return u"%s from %s" % (self.sid, self.source)
+
+
+    @classmethod
+    def record(cls, sid, source, to, body):
+        """Store and return a received SMS; return None if a duplicate."""
+        savepoint = transaction.savepoint()
+        try:
+            inbound = cls.objects.create(
+                sid=sid, source=source, to=to, body=body)
+        except IntegrityError:
+            transaction.savepoint_rollback(savepoint)
+            return None
+        transaction.savepoint_commit(savepoint)
+        return inbound
+
+
+
 class GroupBase(object):
     """Common methods between Group and AllStudentsGroup."""
     def __unicode__(self):
@@ -353,11 +420,13 @@ class AllStudentsGroup(GroupBase):
 
 
 def group_deleted(sender, instance, **kwargs):
+    codes.unindex(instance.code)
     tasks.push_event.delay('group_removed', instance.id, instance.owner_id)
 
 
 
 def group_saved(sender, instance, created, **kwargs):
+    codes.index(instance.code, 'group', instance.id)
     if created:
         tasks.push_event.delay('group_added', instance.id, instance.owner_id)
 
@@ -561,12 +630,14 @@ class Relationship(models.Model):
 
 
 def relationship_saved(sender, instance, created, **kwargs):
+    sms_contexts.invalidate(instance.from_profile_id)
     if created:
         tasks.push_event.delay(
             'student_added', instance.to_profile_id, [instance.from_profile_id])
 
 
 def relationship_deleted(sender, instance, **kwargs):
+    sms_contexts.invalidate(instance.from_profile_id)
     # This relationship may be being deleted in cascade from its student or
     # elder being deleted, in which case it will already be gone.
     try:
@@ -652,6 +723,11 @@ class QuerySetWrapper(object):
         return self.__class__(self.queryset.order_by(*args))
 
 
+    def select_related(self, *args):
+        args = [self._mangle_fieldname(fn) for fn in args]
+        return self.__class__(self.queryset.select_related(*args))
+
+
     def values_list(self, *args, **kw):
         args = [self._mangle_fieldname(fn) for fn in args]
         return self.queryset.values_list(*args, **kw)
@@ -0,0 +1,122 @@
+"""
+Cached per-phone context for handling inbound SMS.
+
+Every inbound SMS needs the sender's profile, their students and their active
+signups (see ``sms.hook.receive_sms``). A small record of the IDs of these is
+cached in Redis per phone number for ``SMS_CONTEXT_CACHE_SECONDS`` (zero
+disables caching), so that a cached sender's profile and students are loaded
+together in a single query, and their signups only if they have any.
+
+Cached records are invalidated by ``Profile``, ``TextSignup`` and
+``Relationship`` save and delete signals (see ``invalidate``); a second key
+per profile remembers which phone its record is cached under. Records are
+invalidated both immediately and again once the transaction commits, as an
+inbound SMS handled concurrently may re-cache the old state in between.
+
+"""
+import json
+
+from django.conf import settings
+
+from portfoliyo import deferred, redis
+
+
+KEY_PATTERN = 'sms:context:%s'
+PHONE_KEY_PATTERN = 'sms:context-phone:%s'
+
+
+
+def load(phone):
+    """
+    Return (profile, students, active signups) for given phone.
+
+    ``profile`` (with its user) is None if no profile has this phone.
+    ``students`` is a list of the profile's students, ordered by name.
+    ``active signups`` is a list of the profile's signups not yet done.
+
+    """
+    if not settings.SMS_CONTEXT_CACHE_SECONDS:
+        return _query(phone)
+    data = redis.client.get(KEY_PATTERN % phone)
+    if data is None:
+        profile, students, signups = _query(phone)
+        if profile is not None:
+            _store(phone, profile, students, signups)
+        return (profile, students, signups)
+    context = json.loads(data)
+    loaded = _load_cached(phone, context)
+    if loaded is None:
+        # stale (e.g. phone moved to another profile)
+        redis.client.delete(KEY_PATTERN % phone)
+        return _query(phone)
+    return loaded
+
+
+
+def invalidate(profile_id):
+    """Discard the cached context of the profile with given ID, if any."""
+    if not settings.SMS_CONTEXT_CACHE_SECONDS:
+        return
+    _delete(profile_id)
+    if deferred.in_transaction():
+        deferred.on_commit(_delete, profile_id)
+
+
+
+def _delete(profile_id):
+    """Delete the cached context of the profile with given ID, if any."""
+    phone = redis.client.get(PHONE_KEY_PATTERN % profile_id)
+    if phone is not None:
+        redis.client.delete(KEY_PATTERN % phone)
+
+
+
+def _query(phone):
+    """Load (profile, students, active signups) for phone from database."""
+    from .models import Profile, TextSignup
+    try:
+        profile = Profile.objects.select_related('user').get(phone=phone)
+    except Profile.DoesNotExist:
+        return (None, [], [])
+    signups = list(profile.signups.exclude(state=TextSignup.STATE.done))
+    return (profile, profile.students, signups)
+
+
+
+def _load_cached(phone, context):
+    """Load profile, students and signups in ``context``; None if stale."""
+    from .models import Profile, TextSignup
+    profile_id = context['profile']
+    profiles = Profile.objects.select_related('user').filter(
+        pk__in=[profile_id] + context['students']).order_by('name')
+    students = []
+    profile = None
+    for p in profiles:
+        if p.id == profile_id:
+            profile = p
+        else:
+            students.append(p)
+    if profile is None or profile.phone != phone:
+        return None
+    signups = []
+    if context['signups']:
+        signups = list(
+            TextSignup.objects.filter(pk__in=context['signups']).exclude(
+                state=TextSignup.STATE.done)
+            )
+    return (profile, students, signups)
+
+
+
+def _store(phone, profile, students, signups):
+    """Cache context of ``profile`` under ``phone``."""
+    context = {
+        'profile': profile.id,
+        'students': [s.id for s in students],
+        'signups': [s.id for s in signups],
+        }
+    seconds = settings.SMS_CONTEXT_CACHE_SECONDS
+    p = redis.client.pipeline()
+    p.setex(KEY_PATTERN % phone, seconds, json.dumps(context))
+    p.setex(PHONE_KEY_PATTERN % profile.id, seconds, phone)
+    p.execute()
@@ -0,0 +1,30 @@
+from django.core.management import BaseCommand
+
+from portfoliyo.model import Relationship
+from portfoliyo.model.village.unread_backends import WatermarkBackend
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert unread-post sets (SetBackend) to watermarks "
+        "(WatermarkBackend). Run after switching PORTFOLIYO_UNREAD_BACKEND."
+        )
+
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        backend = WatermarkBackend()
+        pairs = Relationship.objects.filter(
+            kind=Relationship.KIND.elder).values_list(
+            'from_profile_id', 'to_profile_id')
+        num_pairs = 0
+        num_unread = 0
+        for profile_id, student_id in pairs.iterator():
+            num_unread += backend.migrate_from_sets(profile_id, student_id)
+            num_pairs += 1
+        if verbosity:
+            self.stdout.write(
+                "Migrated %s villages (%s unread posts).\n"
+                % (num_pairs, num_unread)
+                )
@@ -0,0 +1,34 @@
+from django.core.management import BaseCommand
+
+from portfoliyo.model import Relationship, unread
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute denormalized unread counts from unread-post storage. "
+        "Rebuilds counts for all elders, or only for the given profile IDs."
+        )
+    args = "[profile-id profile-id ...]"
+
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        rels = Relationship.objects.filter(kind=Relationship.KIND.elder)
+        if args:
+            rels = rels.filter(from_profile__in=[int(a) for a in args])
+        student_ids_by_profile_id = {}
+        for profile_id, student_id in rels.values_list(
+                'from_profile_id', 'to_profile_id'):
+            student_ids_by_profile_id.setdefault(profile_id, []).append(
+                student_id)
+        for profile_id, student_ids in student_ids_by_profile_id.items():
+            total = unread.rebuild_counts(profile_id, student_ids)
+            if verbosity > 1:
+                self.stdout.write(
+                    "  Profile %s: %s unread.\n" % (profile_id, total))
+        if verbosity:
+            self.stdout.write(
+                "Rebuilt unread counts for %s profiles.\n"
+                % len(student_ids_by_profile_id)
+                )
@@ -2,12 +2,13 @@
 from __future__ import absolute_import
 
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import connection, models
 from django.utils import html, timezone
 from jsonfield import JSONField
 from model_utils import Choices
 
 from portfoliyo import tasks
+from portfoliyo.sms import base as sms_base, encoding as sms_encoding
 from ..users import models as user_models
 from . import unread
 
@@ -86,7 +87,7 @@ class BasePost(models.Model):
 
         Sets self.to_sms to True if any texts were sent, False otherwise, and
         self.meta['sms'] to a list of dictionaries containing basic metadata
-        about each SMS sent.
+        about each SMS sent (including the number of SMS segments it took).
 
         """
         meta_sms = []
@@ -96,6 +97,7 @@ class BasePost(models.Model):
         else:
             suffix = u""
         sms_body = self.original_text + suffix
+        segments = sms_base.count_segments(sms_body)
 
         to_sms = sms_eligible(self.elders_in_context)
 
@@ -106,6 +108,7 @@ class BasePost(models.Model):
             to_sms = to_sms.filter(filters)
 
         to_mark_done = []
+        messages = []
 
         for elder in to_sms:
             sms_data = {
@@ -113,15 +116,20 @@ class BasePost(models.Model):
                 'role': elder.role_in_context,
                 'name': elder.name,
                 'phone': elder.phone,
+                'segments': segments,
                 }
             # with in_reply_to we assume caller sent SMS
             if elder.phone != in_reply_to:
-                elder.send_sms(sms_body)
+                messages.append((elder.phone, elder.source_phone, sms_body))
                 to_mark_done.append(elder)
             sms_sent = True
 
             meta_sms.append(sms_data)
 
+        # all texts go out in one task, which paces them per source number
+        if messages:
+            tasks.send_sms_batch.delay(messages)
+
         # when we send an elder who didn't finish answering their signup
         # questions an SMS, we can no longer assume their next reply is
         # answering the last question we asked. So we mark all in-process
@@ -228,17 +236,19 @@ class BulkPost(BasePost):
         students = list(group.students.all())
 
         relationships = user_models.Relationship.objects.filter(
-            from_profile=author, to_profile__in=students).select_related(
-            'to_profile')
-        rels_by_student = {}
+            from_profile=author, to_profile__in=students)
+        rels_by_student_id = {}
         for rel in relationships:
-            rels_by_student[rel.student] = rel
+            rels_by_student_id[rel.to_profile_id] = rel
 
-        for student in group.students.all():
-            sub = Post.objects.create(
+        # reserve IDs so that all sub-posts can be inserted in a single query
+        ids = _reserve_ids(Post, len(students))
+        subs = [
+            Post(
+                id=sub_id,
                 author=author,
                 student=student,
-                relationship=rels_by_student.get(student, None),
+                relationship=rels_by_student_id.get(student.id, None),
                 original_text=text,
                 html_text=html_text,
                 from_sms=from_sms,
@@ -246,20 +256,33 @@ class BulkPost(BasePost):
                 meta=post.meta,
                 from_bulk=post,
                 )
-            tasks.push_event.delay(
-                'posted',
-                sub.id,
-                author_sequence_id=sequence_id,
-                mark_read_url=reverse(
-                    'mark_post_read', kwargs={'post_id': sub.id}),
+            for sub_id, student in zip(ids, students)
+            ]
+        Post.objects.bulk_create(subs)
+
+        # mark each sub-post unread by all web users in village (not author)
+        web_elder_rels = user_models.Relationship.objects.filter(
+            kind=user_models.Relationship.KIND.elder,
+            to_profile__in=students,
+            from_profile__user__email__isnull=False,
+            ).exclude(from_profile__user__email='').select_related(
+            'from_profile')
+        if author is not None:
+            web_elder_rels = web_elder_rels.exclude(from_profile=author)
+        elders_by_student_id = {}
+        for rel in web_elder_rels:
+            elders_by_student_id.setdefault(rel.to_profile_id, []).append(
+                rel.from_profile)
+        unread.mark_many_unread(
+            dict(
+                (sub, elders_by_student_id.get(sub.student_id, []))
+                for sub in subs
                 )
-            # mark the subpost unread by all web users in village (not author)
-            for elder in student.elders:
-                if elder.user.email and elder != author:
-                    unread.mark_unread(sub, elder)
+            )
 
+        # one push task for the bulk post and all of its sub-posts
         tasks.push_event.delay(
-            'bulk_posted', post.id, author_sequence_id=sequence_id)
+            'bulk_posted_all', post.id, author_sequence_id=sequence_id)
 
         post.notify()
 
@@ -374,9 +397,11 @@ class Post(BasePost):
             post.attachments.create(attachment=uploaded_file)
 
         # mark the post unread by all web users in village (except the author)
-        for elder in student.elders:
-            if elder.user.email and elder != author:
-                unread.mark_unread(post, elder)
+        web_elders = student.elders.filter(
+            user__email__isnull=False).exclude(user__email='')
+        if author is not None:
+            web_elders = web_elders.exclude(pk=author.pk)
+        unread.mark_unread_for_profiles(post, web_elders)
 
         tasks.push_event.delay(
             'posted',
@@ -396,6 +421,109 @@ class Post(BasePost):
         return post
 
 
+    @classmethod
+    def create_many(cls, author, students, text, from_sms=False,
+                    in_reply_to=None, notifications=True):
+        """
+        Create/return a list of Posts of ``text`` in villages of ``students``.
+
+        Like calling ``create`` for each student (without ``profile_ids``, so
+        no SMSes are sent), but with a fixed number of queries, one push task
+        and one notification task however many students there are.
+
+        """
+        students = list(students)
+        if not students:
+            return []
+
+        html_text = text2html(text)
+
+        rels_by_student_id = {}
+        if author is not None:
+            relationships = user_models.Relationship.objects.filter(
+                from_profile=author, to_profile__in=students)
+            for rel in relationships:
+                rels_by_student_id[rel.to_profile_id] = rel
+
+        # relationship of SMS-eligible elder replied to, in each village (as
+        # recorded by ``send_sms``)
+        replied_by_student_id = {}
+        if in_reply_to:
+            replied_rels = user_models.Relationship.objects.filter(
+                kind=user_models.Relationship.KIND.elder,
+                to_profile__in=students,
+                from_profile__phone=in_reply_to,
+                from_profile__declined=False,
+                from_profile__user__is_active=True,
+                ).select_related('from_profile')
+            for rel in replied_rels:
+                replied_by_student_id[rel.to_profile_id] = rel
+
+        # reserve IDs so that all posts can be inserted in a single query
+        ids = _reserve_ids(cls, len(students))
+        posts = []
+        for post_id, student in zip(ids, students):
+            rel = rels_by_student_id.get(student.id)
+            meta_sms = []
+            replied = replied_by_student_id.get(student.id)
+            if replied is not None:
+                suffix = sms_suffix(rel or author) if author else u""
+                meta_sms.append(
+                    {
+                        'id': replied.from_profile_id,
+                        'role': replied.description_or_role,
+                        'name': replied.from_profile.name,
+                        'phone': replied.from_profile.phone,
+                        'segments': sms_base.count_segments(text + suffix),
+                        }
+                    )
+            posts.append(
+                cls(
+                    id=post_id,
+                    author=author,
+                    student=student,
+                    relationship=rel,
+                    original_text=text,
+                    html_text=html_text,
+                    from_sms=from_sms,
+                    to_sms=bool(meta_sms),
+                    meta={'sms': meta_sms},
+                    )
+                )
+        cls.objects.bulk_create(posts)
+
+        # mark each post unread by all web users in village (except author)
+        web_elder_rels = user_models.Relationship.objects.filter(
+            kind=user_models.Relationship.KIND.elder,
+            to_profile__in=students,
+            from_profile__user__email__isnull=False,
+            ).exclude(from_profile__user__email='').select_related(
+            'from_profile')
+        if author is not None:
+            web_elder_rels = web_elder_rels.exclude(from_profile=author)
+        elders_by_student_id = {}
+        for rel in web_elder_rels:
+            elders_by_student_id.setdefault(rel.to_profile_id, []).append(
+                rel.from_profile)
+        unread.mark_many_unread(
+            dict(
+                (post, elders_by_student_id.get(post.student_id, []))
+                for post in posts
+                )
+            )
+
+        tasks.push_event.delay('posted_many', [post.id for post in posts])
+
+        if notifications and author is not None:
+            tasks.record_notification.delay('posts_all', posts)
+
+        if author and not author.has_posted:
+            user_models.Profile.objects.filter(pk=author.pk).update(
+                has_posted=True)
+
+        return posts
+
+
     def get_relationship(self):
         """Return Relationship between author and student, or None."""
         return self.relationship
@@ -414,6 +542,18 @@ class PostAttachment(models.Model):
 
 
 
+def _reserve_ids(model_class, count):
+    """Return ``count`` new primary keys from ``model_class``'s sequence."""
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+        "FROM generate_series(1, %s)",
+        [model_class._meta.db_table, count],
+        )
+    return [row[0] for row in cursor.fetchall()]
+
+
+
 def text2html(text):
     """Process given post text to HTML."""
     return html.escape(text).replace('\n', '<br>')
@@ -425,6 +565,33 @@ def sms_suffix(elder_or_rel):
 
 
 
-def post_char_limit(elder_or_rel):
-    """Max length for posts from this elder or relationship."""
-    return 160 - len(sms_suffix(elder_or_rel))
+def post_char_limit(elder_or_rel, text=u'', encoding=None):
+    """
+    Max length for posts from this elder or relationship.
+
+    A post plus its SMS suffix must fit in one SMS segment, which is smaller if
+    the post ``text`` or the suffix requires UCS-2 encoding; ``encoding`` (if
+    given) overrides the encoding of ``text``. Post length should be measured
+    with ``post_length``.
+
+    """
+    suffix = sms_encoding.prepare(sms_suffix(elder_or_rel))
+    encoding = _post_encoding(suffix, text, encoding)
+    return (
+        sms_encoding.SEGMENT_LIMITS[encoding] -
+        sms_encoding.length(suffix, encoding)
+        )
+
+
+def post_length(elder_or_rel, text):
+    """Length of post ``text`` from this elder or relationship, for SMS."""
+    suffix = sms_encoding.prepare(sms_suffix(elder_or_rel))
+    text = sms_encoding.prepare(text)
+    return sms_encoding.length(text, _post_encoding(suffix, text))
+
+
+def _post_encoding(suffix, text, encoding=None):
+    """SMS encoding of post ``text`` with ``suffix``, or given ``encoding``."""
+    if sms_encoding.get_encoding(suffix) == sms_encoding.UCS2:
+        return sms_encoding.UCS2
+    return encoding or sms_encoding.get_encoding(sms_encoding.prepare(text))
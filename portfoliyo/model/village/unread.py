@@ -1,34 +1,103 @@
-"""Unread-counts data-model layer implementation."""
+"""
+Unread-counts data-model layer implementation.
+
+Which posts are unread by which profiles is stored by the unread-storage
+backend configured in the ``PORTFOLIYO_UNREAD_BACKEND`` setting (see the
+``unread_backends`` module). Alongside it, each profile has a Redis hash of
+denormalized unread counts, mapping student ID to unread count in that
+student's village (plus a ``total`` field), so all of a profile's unread counts
+can be fetched with a single ``HGETALL``. The counts are kept up to date by the
+functions in this module that modify unread state, in the same Redis
+transaction (or Lua script) as the backend's changes to unread state (see
+``_apply`` and ``mark_many_unread``), so the two can't drift apart;
+``rebuild_counts`` recomputes them from the backend.
+
+"""
+from django.conf import settings
+
 from portfoliyo import redis
+from portfoliyo.backends import get_backend
+
+
+COUNTS_KEY_PATTERN = 'unread:counts:%s'
+TOTAL_FIELD = 'total'
+
+
+
+backend = get_backend(settings.PORTFOLIYO_UNREAD_BACKEND)()
 
 
 
 def mark_unread(post, profile):
     """Mark given post unread by given profile."""
-    redis.client.sadd(make_key(post.student, profile), post.id)
+    mark_many_unread({post: [profile]})
+
+
+def mark_unread_for_profiles(post, profiles):
+    """Mark given post unread by all given profiles."""
+    mark_many_unread({post: profiles})
+
+
+def mark_many_unread(profiles_by_post):
+    """
+    Mark many posts unread by many profiles.
+
+    ``profiles_by_post`` is a dictionary mapping posts to an iterable of the
+    profiles who should see that post as unread.
+
+    With the default set backend, marks all posts and updates counts in a
+    single Redis round-trip (a Lua script); otherwise see ``_apply``.
+
+    """
+    posts_by_pair = {}
+    for post, profiles in profiles_by_post.items():
+        for profile in profiles:
+            posts_by_pair.setdefault(
+                (profile.id, post.student_id), []).append(post)
+    if not posts_by_pair:
+        return
+    mark_unread_counted = getattr(backend, 'mark_unread_counted', None)
+    if mark_unread_counted is not None:
+        counts_keys = dict(
+            (profile_id, COUNTS_KEY_PATTERN % profile_id)
+            for profile_id, student_id in posts_by_pair
+            )
+        mark_unread_counted(posts_by_pair, counts_keys, TOTAL_FIELD)
+    else:
+        _apply(backend.mark_unread, posts_by_pair)
 
 
 def mark_read(post, profile):
     """Mark given post read by given profile."""
-    redis.client.srem(make_key(post.student, profile), post.id)
+    mark_many_read([post], profile)
+
+
+def mark_many_read(posts, profile):
+    """Mark all given posts read by given profile."""
+    posts_by_pair = {}
+    for post in posts:
+        posts_by_pair.setdefault(
+            (profile.id, post.student_id), []).append(post)
+    _apply(backend.mark_read, posts_by_pair)
 
 
 
 def is_unread(post, profile):
     """Given post is unread by given profile (returns boolean)."""
-    return redis.client.sismember(make_key(post.student, profile), post.id)
+    return backend.is_unread(post, profile)
 
 
 
 def all_unread(student, profile):
     """Return set of post IDs in ``student`` village unread by ``profile``."""
-    return redis.client.smembers(make_key(student, profile))
+    return backend.all_unread(student, profile)
 
 
 
 def unread_count(student, profile):
     """Return count of profile's unread posts in given student's village."""
-    return redis.client.scard(make_key(student, profile))
+    count = redis.client.hget(make_counts_key(profile), student.id)
+    return _to_count(count)
 
 
 def unread_counts(students, profile):
@@ -38,19 +107,27 @@ def unread_counts(students, profile):
     Return dict mapping student to unread count.
 
     """
-    student = list(students)
-    p = redis.client.pipeline()
-    for student in students:
-        p.scard(make_key(student, profile))
-    return dict(zip(students, p.execute()))
+    counts = unread_counts_by_student_id(profile)
+    return dict((student, counts.get(student.id, 0)) for student in students)
+
+
+def unread_counts_by_student_id(profile):
+    """Return dict mapping student ID to count of profile's unread posts."""
+    counts = redis.client.hgetall(make_counts_key(profile))
+    counts.pop(TOTAL_FIELD, None)
+    return dict((int(sid), _to_count(c)) for sid, c in counts.items())
+
+
+def total_unread_count(profile):
+    """Return count of profile's unread posts in all villages."""
+    count = redis.client.hget(make_counts_key(profile), TOTAL_FIELD)
+    return _to_count(count)
 
 
 def group_unread_count(group, profile):
     """Return count of profile's unread posts in all villages in group."""
-    p = redis.client.pipeline()
-    for student in group.students.all():
-        p.scard(make_key(student, profile))
-    return sum(p.execute())
+    counts = unread_counts_by_student_id(profile)
+    return sum(counts.get(s.id, 0) for s in group.students.all())
 
 
 def group_unread_counts(groups, profile):
@@ -60,39 +137,107 @@ def group_unread_counts(groups, profile):
     Return a dictionary mapping groups to counts.
 
     """
-    p = redis.client.pipeline()
-
-    # track list of student IDs for each group
-    student_ids_by_group = {}
-    # we need an ordered list of student IDs to match them up with the pipeline
-    # results, but we also need the set for fast membership tests
-    student_ids_seen = set()
-    ordered_student_ids = []
-
-    for group in groups:
-        student_ids = student_ids_by_group.setdefault(group, set())
-        for student in group.students.all():
-            student_ids.add(student.id)
-            if student.id not in student_ids_seen:
-                ordered_student_ids.append(student.id)
-                student_ids_seen.add(student.id)
-                p.scard(make_key(student, profile))
-    unread_counts_by_student_id = dict(zip(ordered_student_ids, p.execute()))
+    counts = unread_counts_by_student_id(profile)
     return {
-        group: sum(
-            unread_counts_by_student_id[sid]
-            for sid in student_ids_by_group[group]
-            )
+        group: sum(counts.get(s.id, 0) for s in group.students.all())
         for group in groups
         }
 
 
 def mark_village_read(student, profile):
     """Mark all posts in given student's village as read by profile."""
-    redis.client.delete(make_key(student, profile))
+    pair = (profile.id, student.id)
+    counts_key = make_counts_key(profile)
+
+    def _mark(pipe):
+        count = _to_count(redis.client.hget(counts_key, student.id))
+        num_read = backend.mark_village_read(profile.id, student.id, pipe)
+        if num_read is None:
+            # backend doesn't know; zero out the count
+            num_read = count
+        _queue_count_changes(pipe, {pair: -num_read})
+
+    redis.client.transaction(_mark, counts_key, *backend.keys([pair]))
+
+
+
+def rebuild_counts(profile_id, student_ids):
+    """
+    Recompute profile's unread counts from the unread-storage backend.
+
+    ``student_ids`` should be the IDs of all students in whose villages the
+    profile might have unread posts. Return the new total unread count.
+
+    """
+    student_ids = list(student_ids)
+    counts_key = COUNTS_KEY_PATTERN % profile_id
+    totals = []
+
+    def _rebuild(pipe):
+        counts = dict(
+            (sid, c)
+            for sid, c in backend.count_unread(profile_id, student_ids).items()
+            if c
+            )
+        totals[:] = [sum(counts.values())]
+        pipe.multi()
+        pipe.delete(counts_key)
+        if counts:
+            counts[TOTAL_FIELD] = totals[0]
+            pipe.hmset(counts_key, counts)
+
+    pairs = [(profile_id, student_id) for student_id in student_ids]
+    redis.client.transaction(_rebuild, counts_key, *backend.keys(pairs))
+    return totals[0]
+
+
+
+def _apply(method, posts_by_pair):
+    """
+    Apply backend ``method`` to ``posts_by_pair``, and update unread counts.
+
+    The backend's changes to unread state and the resulting count changes are
+    made in a single MULTI transaction, watching the backend's keys for the
+    affected pairs; if those change before it executes (i.e. a concurrent
+    change might have been counted twice), it is retried. Takes three Redis
+    round-trips: WATCH, the backend's reads, and the transaction.
+
+    """
+    if not posts_by_pair:
+        return
+
+    def _transaction(pipe):
+        _queue_count_changes(pipe, method(posts_by_pair, pipe))
+
+    redis.client.transaction(
+        _transaction, *backend.keys(posts_by_pair.keys()))
+
+
+
+def _queue_count_changes(pipe, changes):
+    """
+    Queue given changes to denormalized unread counts on ``pipe``.
+
+    ``changes`` maps (profile ID, student ID) pairs to count deltas.
+
+    """
+    totals = {}
+    for (profile_id, student_id), delta in changes.items():
+        if not delta:
+            continue
+        pipe.hincrby(COUNTS_KEY_PATTERN % profile_id, student_id, delta)
+        totals[profile_id] = totals.get(profile_id, 0) + delta
+    for profile_id, delta in totals.items():
+        pipe.hincrby(COUNTS_KEY_PATTERN % profile_id, TOTAL_FIELD, delta)
+
+
+
+def _to_count(val):
+    """Convert a stored count to an integer; missing or negative is zero."""
+    return max(int(val or 0), 0)
 
 
 
-def make_key(student, profile):
-    """Construct Redis key for given profile and student."""
-    return 'unread:%s:%s' % (profile.id, student.id)
+def make_counts_key(profile):
+    """Construct Redis key for given profile's unread-counts hash."""
+    return COUNTS_KEY_PATTERN % profile.id
@@ -0,0 +1,445 @@
+"""
+Storage backends for unread-post state.
+
+A backend stores which posts are unread by which profiles; the ``unread``
+module wraps the configured backend (see ``PORTFOLIYO_UNREAD_BACKEND``
+setting) and maintains denormalized unread counts on top of it.
+
+Backend methods that take a ``posts_by_pair`` argument expect a dictionary
+mapping (profile ID, student ID) pairs to lists of posts in that student's
+village, and return a dictionary mapping pairs to the resulting change in
+unread count for that pair.
+
+Methods that change unread state also take a ``pipe``: a Redis pipeline
+watching the backend's ``keys`` for the affected pairs. They read the current
+state, then put ``pipe`` in MULTI mode and queue their writes on it, so that
+the ``unread`` module can queue the matching count changes in the same
+transaction (see ``unread._apply``).
+
+A backend may also provide ``mark_unread_counted(posts_by_pair, counts_keys,
+total_field)``, which marks posts unread and itself increments the counts
+(``counts_keys`` maps profile IDs to counts-hash keys) atomically in a single
+Redis round-trip; ``unread.mark_many_unread`` then uses it instead.
+
+"""
+import operator
+
+from django.db import models
+
+from portfoliyo import redis
+
+
+
+class SetBackend(object):
+    """
+    Store unread posts as one Redis set of post IDs per (profile, village).
+
+    Simple and exact, but memory use grows with the number of unread posts,
+    and sets are never cleaned up for users who never read them.
+
+    """
+    KEY_PATTERN = 'unread:%s:%s'
+
+
+    def keys(self, pairs):
+        """Return Redis keys storing unread state of given pairs."""
+        return [self.KEY_PATTERN % pair for pair in pairs]
+
+
+    def mark_unread(self, posts_by_pair, pipe):
+        return self._update_sets('sadd', posts_by_pair, pipe, 1)
+
+
+    def mark_unread_counted(self, posts_by_pair, counts_keys, total_field):
+        """Mark posts unread and increment counts, in one Lua script call."""
+        keys = []
+        args = [total_field]
+        for pair, posts in posts_by_pair.items():
+            profile_id, student_id = pair
+            post_ids = sorted(set(post.id for post in posts))
+            keys.extend([self.KEY_PATTERN % pair, counts_keys[profile_id]])
+            args.extend([student_id, len(post_ids)] + post_ids)
+        _mark_unread_counted(keys=keys, args=args)
+
+
+    def mark_read(self, posts_by_pair, pipe):
+        return self._update_sets('srem', posts_by_pair, pipe, -1)
+
+
+    def mark_village_read(self, profile_id, student_id, pipe):
+        """Mark all posts in village read; return number marked read."""
+        key = self.KEY_PATTERN % (profile_id, student_id)
+        num_read = redis.client.scard(key)
+        pipe.multi()
+        pipe.delete(key)
+        return num_read
+
+
+    def is_unread(self, post, profile):
+        key = self.KEY_PATTERN % (profile.id, post.student_id)
+        return redis.client.sismember(key, post.id)
+
+
+    def all_unread(self, student, profile):
+        """Return set of unread post IDs (as strings) in student's village."""
+        return redis.client.smembers(
+            self.KEY_PATTERN % (profile.id, student.id))
+
+
+    def count_unread(self, profile_id, student_ids):
+        """Return dict mapping given student IDs to profile's unread count."""
+        student_ids = list(student_ids)
+        p = redis.client.pipeline()
+        for student_id in student_ids:
+            p.scard(self.KEY_PATTERN % (profile_id, student_id))
+        return dict(zip(student_ids, p.execute()))
+
+
+    def _update_sets(self, method_name, posts_by_pair, pipe, sign):
+        """
+        Add (``sign`` 1) or remove (-1) posts to/from unread sets.
+
+        Only posts not yet in (or still in) their set are changed.
+
+        """
+        post_ids_by_pair = dict(
+            (pair, sorted(set(post.id for post in posts)))
+            for pair, posts in posts_by_pair.items()
+            )
+        p = redis.client.pipeline(transaction=False)
+        for pair, post_ids in post_ids_by_pair.items():
+            for post_id in post_ids:
+                p.sismember(self.KEY_PATTERN % pair, post_id)
+        is_member = iter(p.execute())
+        # adding changes non-members; removing changes members
+        changes_members = sign < 0
+        to_change = {}
+        for pair, post_ids in post_ids_by_pair.items():
+            changed = [
+                pid for pid in post_ids if next(is_member) == changes_members]
+            if changed:
+                to_change[pair] = changed
+        pipe.multi()
+        for pair, post_ids in to_change.items():
+            getattr(pipe, method_name)(self.KEY_PATTERN % pair, *post_ids)
+        return dict(
+            (pair, sign * len(post_ids))
+            for pair, post_ids in to_change.items()
+            )
+
+
+
+def _emulate_mark_unread_counted(client, keys, args):
+    """Python equivalent of ``_mark_unread_counted``, for the fake Redis."""
+    total_field = args[0]
+    i = 1
+    for k in range(0, len(keys), 2):
+        num_posts = int(args[i + 1])
+        added = client.sadd(keys[k], *args[i + 2:i + 2 + num_posts])
+        if added:
+            client.hincrby(keys[k + 1], args[i], added)
+            client.hincrby(keys[k + 1], total_field, added)
+        i += 2 + num_posts
+
+
+# KEYS are (unread set, counts hash) key pairs; ARGV is the counts total field,
+# then for each key pair its student ID, number of post IDs, and the post IDs.
+# Counts are incremented by the number of posts actually added to each set.
+_mark_unread_counted = redis.Script(
+    """
+    local total_field = ARGV[1]
+    local i = 2
+    for k = 1, #KEYS, 2 do
+      local num_posts = tonumber(ARGV[i + 1])
+      local added = 0
+      for j = i + 2, i + 1 + num_posts do
+        added = added + redis.call('SADD', KEYS[k], ARGV[j])
+      end
+      if added > 0 then
+        redis.call('HINCRBY', KEYS[k + 1], ARGV[i], added)
+        redis.call('HINCRBY', KEYS[k + 1], total_field, added)
+      end
+      i = i + 2 + num_posts
+    end
+    return 0
+    """,
+    _emulate_mark_unread_counted,
+    )
+
+
+
+class WatermarkBackend(object):
+    """
+    Store unread state as a per-village read watermark plus exceptions.
+
+    For each profile, a Redis hash maps student ID to a watermark post ID; all
+    posts in that student's village with IDs at or below the watermark are
+    read. Posts above the watermark are unread, except for the profile's own
+    posts and those in a small per-village set of posts individually marked
+    read. Marking a village read moves the watermark up to the latest post and
+    empties the exceptions set, so memory use scales with the number of
+    relationships rather than with post volume.
+
+    A village's watermark is initialized when a post in it is first marked
+    unread by the profile, so earlier posts are considered read.
+
+    Posts above the watermark are unread as soon as they exist, so to keep the
+    unread counts exact when a post is marked unread more than once (e.g. a
+    redelivered task), a second hash maps student ID to the highest post ID
+    counted so far. Marking a post unread only increments the count if it was
+    individually marked read or is above that mark; marking one read only
+    decrements it if it was counted. A post marked unread after a later post
+    in the same village (e.g. concurrently created) is not counted;
+    ``unread.rebuild_counts`` corrects that.
+
+    """
+    WATERMARK_KEY_PATTERN = 'unread:wm:%s'
+    COUNTED_KEY_PATTERN = 'unread:counted:%s'
+    READ_KEY_PATTERN = 'unread:read:%s:%s'
+
+
+    def keys(self, pairs):
+        """Return Redis keys storing unread state of given pairs."""
+        keys = set()
+        for profile_id, student_id in pairs:
+            keys.add(self.WATERMARK_KEY_PATTERN % profile_id)
+            keys.add(self.COUNTED_KEY_PATTERN % profile_id)
+            keys.add(self.READ_KEY_PATTERN % (profile_id, student_id))
+        return sorted(keys)
+
+
+    def mark_unread(self, posts_by_pair, pipe):
+        pairs = posts_by_pair.keys()
+        new_watermarks = {}
+        marks_by_pair = {}
+        above_by_pair = {}
+        for pair, (watermark, counted) in zip(pairs, self._get_marks(pairs)):
+            posts = posts_by_pair[pair]
+            if watermark is None:
+                watermark = counted = min(post.id for post in posts) - 1
+                new_watermarks[pair] = watermark
+            marks_by_pair[pair] = (watermark, counted)
+            posts = self._above(posts, pair[0], watermark)
+            above_by_pair[pair] = sorted(set(post.id for post in posts))
+        read_by_pair = self._read_ids(above_by_pair)
+        changes = {}
+        pipe.multi()
+        for pair, watermark in new_watermarks.items():
+            profile_id, student_id = pair
+            pipe.hset(
+                self.WATERMARK_KEY_PATTERN % profile_id, student_id, watermark)
+        for pair, post_ids in above_by_pair.items():
+            if not post_ids:
+                continue
+            profile_id, student_id = pair
+            counted = marks_by_pair[pair][1]
+            read = read_by_pair[pair]
+            pipe.srem(self.READ_KEY_PATTERN % pair, *post_ids)
+            if post_ids[-1] > counted:
+                pipe.hset(
+                    self.COUNTED_KEY_PATTERN % profile_id,
+                    student_id,
+                    post_ids[-1],
+                    )
+            # posts already counted as unread (and not since read) don't
+            # change the count
+            changed = len(
+                [pid for pid in post_ids if pid in read or pid > counted])
+            if changed:
+                changes[pair] = changed
+        return changes
+
+
+    def mark_read(self, posts_by_pair, pipe):
+        pairs = posts_by_pair.keys()
+        counted_by_pair = {}
+        above_by_pair = {}
+        for pair, (watermark, counted) in zip(pairs, self._get_marks(pairs)):
+            if watermark is None:
+                continue
+            counted_by_pair[pair] = counted
+            posts = self._above(posts_by_pair[pair], pair[0], watermark)
+            above_by_pair[pair] = sorted(set(post.id for post in posts))
+        read_by_pair = self._read_ids(above_by_pair)
+        changes = {}
+        pipe.multi()
+        for pair, post_ids in above_by_pair.items():
+            read = read_by_pair[pair]
+            to_mark = [pid for pid in post_ids if pid not in read]
+            if to_mark:
+                pipe.sadd(self.READ_KEY_PATTERN % pair, *to_mark)
+                # posts never counted as unread don't change the count
+                num_counted = len(
+                    [pid for pid in to_mark if pid <= counted_by_pair[pair]])
+                if num_counted:
+                    changes[pair] = -num_counted
+        return changes
+
+
+    def mark_village_read(self, profile_id, student_id, pipe):
+        """
+        Mark all posts in village read.
+
+        Return ``None``; the number of posts marked read is not known.
+
+        """
+        latest = _village_posts(student_id).aggregate(
+            latest=models.Max('id'))['latest']
+        pipe.multi()
+        pipe.hset(
+            self.WATERMARK_KEY_PATTERN % profile_id, student_id, latest or 0)
+        pipe.delete(self.READ_KEY_PATTERN % (profile_id, student_id))
+        return None
+
+
+    def is_unread(self, post, profile):
+        p = redis.client.pipeline()
+        p.hget(self.WATERMARK_KEY_PATTERN % profile.id, post.student_id)
+        p.sismember(
+            self.READ_KEY_PATTERN % (profile.id, post.student_id), post.id)
+        watermark, read = p.execute()
+        return bool(
+            watermark is not None and
+            not read and
+            self._above([post], profile.id, int(watermark))
+            )
+
+
+    def all_unread(self, student, profile):
+        """Return set of unread post IDs (as strings) in student's village."""
+        p = redis.client.pipeline()
+        p.hget(self.WATERMARK_KEY_PATTERN % profile.id, student.id)
+        p.smembers(self.READ_KEY_PATTERN % (profile.id, student.id))
+        watermark, read = p.execute()
+        if watermark is None:
+            return set()
+        post_ids = _village_posts(student.id).filter(
+            id__gt=int(watermark)).exclude(author=profile.id).values_list(
+            'id', flat=True)
+        return set(str(pid) for pid in post_ids) - set(read)
+
+
+    def count_unread(self, profile_id, student_ids):
+        """Return dict mapping given student IDs to profile's unread count."""
+        student_ids = list(student_ids)
+        p = redis.client.pipeline()
+        p.hgetall(self.WATERMARK_KEY_PATTERN % profile_id)
+        for student_id in student_ids:
+            p.smembers(self.READ_KEY_PATTERN % (profile_id, student_id))
+        results = p.execute()
+        watermarks = results[0]
+        read_by_student_id = dict(zip(student_ids, results[1:]))
+
+        counts = dict((student_id, 0) for student_id in student_ids)
+        filters = [
+            models.Q(student=student_id, id__gt=int(watermarks[str(student_id)]))
+            for student_id in student_ids
+            if str(student_id) in watermarks
+            ]
+        if not filters:
+            return counts
+        from .models import Post
+        post_ids = Post.objects.filter(
+            reduce(operator.or_, filters)).exclude(
+            author=profile_id).values_list('student_id', 'id')
+        for student_id, post_id in post_ids:
+            if str(post_id) not in read_by_student_id[student_id]:
+                counts[student_id] += 1
+        return counts
+
+
+    def migrate_from_sets(self, profile_id, student_id):
+        """
+        Convert an unread set from ``SetBackend`` into watermark form.
+
+        The watermark is set just below the oldest unread post, and any later
+        posts by others that aren't unread are recorded as exceptions. The
+        original set is removed. Return the number of unread posts.
+
+        """
+        set_key = SetBackend.KEY_PATTERN % (profile_id, student_id)
+        unread_ids = set(int(pid) for pid in redis.client.smembers(set_key))
+        posts = _village_posts(student_id)
+        latest = posts.aggregate(latest=models.Max('id'))['latest'] or 0
+        if unread_ids:
+            watermark = min(unread_ids) - 1
+            read_ids = set(
+                posts.filter(id__gt=watermark).exclude(
+                    author=profile_id).values_list('id', flat=True)
+                ) - unread_ids
+        else:
+            watermark = latest
+            read_ids = set()
+        read_key = self.READ_KEY_PATTERN % (profile_id, student_id)
+        p = redis.client.pipeline()
+        p.hset(self.WATERMARK_KEY_PATTERN % profile_id, student_id, watermark)
+        # all existing unread posts are counted
+        p.hset(
+            self.COUNTED_KEY_PATTERN % profile_id,
+            student_id,
+            max(latest, watermark),
+            )
+        p.delete(read_key)
+        if read_ids:
+            p.sadd(read_key, *read_ids)
+        p.delete(set_key)
+        p.execute()
+        return len(unread_ids)
+
+
+    def _get_marks(self, pairs):
+        """
+        Return list of (watermark, counted mark) tuples for given pairs.
+
+        Both are integers, or ``None`` if the watermark is not initialized.
+        The counted mark is never below the watermark (and is the watermark
+        for villages last marked unread before counted marks were kept).
+
+        """
+        p = redis.client.pipeline()
+        for profile_id, student_id in pairs:
+            p.hget(self.WATERMARK_KEY_PATTERN % profile_id, student_id)
+            p.hget(self.COUNTED_KEY_PATTERN % profile_id, student_id)
+        results = p.execute()
+        marks = []
+        for watermark, counted in zip(results[::2], results[1::2]):
+            if watermark is None:
+                marks.append((None, None))
+            else:
+                watermark = int(watermark)
+                marks.append((watermark, max(int(counted or 0), watermark)))
+        return marks
+
+
+    def _read_ids(self, post_ids_by_pair):
+        """
+        Return dict mapping pairs to set of given post IDs marked read.
+
+        ``post_ids_by_pair`` maps pairs to lists of post IDs.
+
+        """
+        items = post_ids_by_pair.items()
+        p = redis.client.pipeline(transaction=False)
+        for pair, post_ids in items:
+            for post_id in post_ids:
+                p.sismember(self.READ_KEY_PATTERN % pair, post_id)
+        is_read = iter(p.execute())
+        return dict(
+            (pair, set(pid for pid in post_ids if next(is_read)))
+            for pair, post_ids in items
+            )
+
+
+    def _above(self, posts, profile_id, watermark):
+        """Return those ``posts`` above ``watermark`` not by ``profile_id``."""
+        return [
+            post for post in posts
+            if post.id > watermark and post.author_id != profile_id
+            ]
+
+
+
+def _village_posts(student_id):
+    """Return queryset of all posts in given student's village."""
+    from .models import Post
+    return Post.objects.filter(student=student_id)
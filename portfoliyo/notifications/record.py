@@ -1,4 +1,7 @@
 """Record notifications."""
+from contextlib import contextmanager
+import threading
+
 from django.conf import settings
 
 from portfoliyo import tasks
@@ -6,13 +9,47 @@ from . import store, types
 
 
 
+_thread_data = threading.local()
+
+
+
 def post_all(p):
     """Send all appropriate notifications for creation of given post."""
     if not p.author:
         return
     record_func = bulk_post if p.is_bulk else post
-    for profile in p.elders_in_context.exclude(pk=p.author.pk):
-        record_func(profile, p)
+    with batched():
+        for profile in p.elders_in_context.exclude(
+                pk=p.author.pk).select_related('user'):
+            record_func(profile, p)
+
+
+
+def posts_all(posts):
+    """
+    Send all appropriate notifications for creation of given (non-bulk) posts.
+
+    Like ``post_all`` for each post, but finds the elders to notify in all the
+    posts' villages with a single query.
+
+    """
+    from portfoliyo import model
+    posts = [p for p in posts if p.author]
+    if not posts:
+        return
+    rels = model.Relationship.objects.filter(
+        kind=model.Relationship.KIND.elder,
+        to_profile__in=set(p.student_id for p in posts),
+        ).select_related('from_profile__user')
+    elders_by_student_id = {}
+    for rel in rels:
+        elders_by_student_id.setdefault(rel.to_profile_id, []).append(
+            rel.from_profile)
+    with batched():
+        for p in posts:
+            for profile in elders_by_student_id.get(p.student_id, []):
+                if profile.id != p.author_id:
+                    post(profile, p)
 
 
 
@@ -51,14 +88,16 @@ def village_additions(added_by, teachers, students):
     """Send appropriate notifications for ``teachers`` added to ``students``."""
     teachers = set(teachers)
     teachers.discard(added_by)
-    for student in students:
-        for existing_teacher_rel in student.elder_relationships.filter(
-                from_profile__school_staff=True).exclude(
-                from_profile__in=teachers):
+    with batched():
+        for student in students:
+            for existing_teacher_rel in student.elder_relationships.filter(
+                    from_profile__school_staff=True).exclude(
+                    from_profile__in=teachers).select_related(
+                    'from_profile__user'):
+                for teacher in teachers:
+                    new_teacher(existing_teacher_rel.elder, teacher, student)
             for teacher in teachers:
-                new_teacher(existing_teacher_rel.elder, teacher, student)
-        for teacher in teachers:
-            added_to_village(teacher, added_by, student)
+                added_to_village(teacher, added_by, student)
 
 
 def added_to_village(profile, added_by, student):
@@ -77,11 +116,82 @@ def new_teacher(profile, teacher, student):
 
 
 
+@contextmanager
+def batched():
+    """
+    Store all notifications recorded within the block together at the end.
+
+    Storing many notifications at once takes a fixed number of Redis
+    round-trips (see ``store.store_many``). If the block raises an exception,
+    nothing is recorded. Nested blocks are merged into the outermost.
+
+    """
+    if getattr(_thread_data, 'pending', None) is not None:
+        yield
+        return
+    _thread_data.pending = []
+    try:
+        yield
+        pending = _thread_data.pending
+    finally:
+        _thread_data.pending = None
+    _record_many(pending)
+
+
+
 def _record(profile, name, triggering=False, data=None):
     """Record a notification for the given profile."""
-    if profile.user.email is None or not profile.user.is_active:
+    notification = (profile, name, triggering, data)
+    pending = getattr(_thread_data, 'pending', None)
+    if pending is None:
+        _record_many([notification])
+    else:
+        pending.append(notification)
+
+
+
+def _record_many(notifications):
+    """Record (profile, name, triggering, data) notifications."""
+    notifications = [
+        n for n in notifications
+        if n[0].user.email is not None and n[0].user.is_active
+        ]
+    if not notifications:
         return
-    store.store(profile.id, name, triggering=triggering, data=data)
-    # @@@ later this will be only if user prefers instant notifications
-    if triggering and settings.NOTIFICATION_EMAILS:
-        tasks.send_notification_email.delay(profile.id)
+    store.store_many(
+        [
+            (profile.id, name, triggering, data)
+            for profile, name, triggering, data in notifications
+            ]
+        )
+    if settings.NOTIFICATION_EMAILS:
+        triggered = {}
+        for profile, name, triggering, data in notifications:
+            if triggering:
+                triggered.setdefault(profile.id, profile)
+        schedule_emails(triggered.values())
+
+
+
+def schedule_emails(profiles):
+    """
+    Schedule a notification email for each of the given profiles.
+
+    If a profile (or failing that, the ``NOTIFICATION_EMAIL_DELAY_SECONDS``
+    setting) specifies a delay, wait that long for further notifications to
+    accumulate before sending, and schedule at most one email per profile per
+    delay window. Otherwise send right away.
+
+    """
+    delays = {}
+    for profile in profiles:
+        delay = profile.notification_delay
+        if delay is None:
+            delay = settings.NOTIFICATION_EMAIL_DELAY_SECONDS
+        if delay:
+            delays[profile.id] = delay
+        else:
+            tasks.send_notification_email.delay(profile.id)
+    for profile_id in store.schedule_emails(delays):
+        tasks.send_notification_email.apply_async(
+            (profile_id,), countdown=delays[profile_id])
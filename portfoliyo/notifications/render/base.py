@@ -1,13 +1,19 @@
 """Rendering and sending of notifications."""
+import logging
 import re
+import time
 
 from django.conf import settings
 from django.template.loader import render_to_string
-import premailer
 
 from portfoliyo import email
 from portfoliyo import model
-from . import collect
+from .. import record, store
+from . import collect, inline
+
+
+logger = logging.getLogger(__name__)
+
 
 
 HTML_TEMPLATE = 'notifications/activity.html'
@@ -50,6 +56,67 @@ def send(profile_id, clear=True):
 
 
 
+def send_many(profile_ids, clear=True):
+    """
+    Send activity notifications to users with given profile IDs.
+
+    All emails are rendered first and then sent over a single mail-server
+    connection. A failure rendering or sending one email is logged and does not
+    prevent sending the others.
+
+    If ``clear`` is ``True`` (the default), clear the rendered notifications of
+    each profile whose email was sent; those of the others are kept, to be
+    sent later. If triggering notifications arrived for a profile while its
+    email was being sent, another email is scheduled for them.
+
+    Return tuple of (number of emails sent, number of failures).
+
+    """
+    start = time.time()
+    profiles = model.Profile.objects.select_related('user').filter(
+        pk__in=profile_ids)
+    messages = []
+    # maps message to (profile, timestamp its notifications were read)
+    rendered = {}
+    failed = 0
+    for profile in profiles:
+        user = profile.user
+        # skip users who can't receive notification emails anyway
+        if not (user.email and user.is_active):
+            continue
+        rendered_at = time.time()
+        try:
+            subject, text, html = render(profile, clear=False)
+        except NothingToDo:
+            continue
+        except Exception:
+            logger.exception(
+                "Failed to render notifications for profile %s", profile.id)
+            failed += 1
+            continue
+        message = email.make_multipart(subject, text, html, [user.email])
+        messages.append(message)
+        rendered[message] = (profile, rendered_at)
+
+    sent = email.send_messages(messages, fail_silently=True)
+    failed += len(messages) - len(sent)
+    if clear:
+        reschedule = []
+        for message in sent:
+            profile, rendered_at = rendered[message]
+            if store.clear(profile.id, rendered_at):
+                reschedule.append(profile)
+        record.schedule_emails(reschedule)
+
+    logger.info(
+        "Sent %s notification emails (%s failed) for %s profiles in %.2fs.",
+        len(sent), failed, len(profile_ids), time.time() - start,
+        )
+
+    return len(sent), failed
+
+
+
 def render(profile, clear=True):
     """
     Render notification email for given profile; return (subject, text, html).
@@ -72,10 +139,9 @@ def render(profile, clear=True):
 
     text = consecutive_newlines.sub(
         '\n\n', render_to_string(TEXT_TEMPLATE, context))
-    html = premailer.Premailer(
+    html = inline.inline_css(
         render_to_string(HTML_TEMPLATE, context),
         base_url=settings.PORTFOLIYO_BASE_URL,
-        output_xhtml=True,
-        ).transform()
+        )
 
     return subject, text, html
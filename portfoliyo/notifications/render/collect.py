@@ -2,7 +2,7 @@
 import logging
 
 from .. import store
-from .collectors import COLLECTOR_CLASSES
+from .collectors import COLLECTOR_CLASSES, base as collectors_base
 
 
 
@@ -78,23 +78,56 @@ class NotificationCollection(object):
         return subject_template
 
 
-    def _hydrate(self):
-        collectors = {}
-        for data in self.notification_data:
-            name = data.pop('name', None)
+    def _get_collector(self, collectors, name, objects):
+        """
+        Get or create collector for notification type ``name``.
+
+        Return ``None`` (and log a warning) if the type is unknown.
+
+        """
+        collector = collectors.get(name)
+        if collector is None:
             try:
                 collector_class = COLLECTOR_CLASSES[name]
             except KeyError:
                 logger.warning("Unknown notification type '%s'", name)
-                continue
-            collector = collectors.setdefault(
-                name, collector_class(self.profile))
-            try:
-                collector.add(data)
-            except SwitchType as switch:
-                data = switch.new_data
-                data['name'] = switch.new_type
-                self.notification_data.append(data)
+                return None
+            collector = collectors[name] = collector_class(
+                self.profile, objects)
+        return collector
+
+
+    def _hydrate(self):
+        collectors = {}
+        # lookup objects for all collectors, by model class and string pk
+        objects = {}
+        pending = []
+        for data in self.notification_data:
+            name = data.pop('name', None)
+            collector = self._get_collector(collectors, name, objects)
+            if collector is not None:
+                pending.append((collector, data))
+
+        # hydrate in rounds, prefetching all lookup objects for each round;
+        # notifications that switch type are hydrated in the next round
+        while pending:
+            collectors_base.prefetch_objects(pending, objects)
+            data_by_collector = {}
+            for collector, data in pending:
+                data_by_collector.setdefault(collector, []).append(data)
+            for collector, data_list in data_by_collector.items():
+                collector.prefetch(data_list)
+            switched = []
+            for collector, data in pending:
+                try:
+                    collector.add(data)
+                except SwitchType as switch:
+                    collector = self._get_collector(
+                        collectors, switch.new_type, objects)
+                    if collector is not None:
+                        self.notification_data.append(switch.new_data)
+                        switched.append((collector, switch.new_data))
+            pending = switched
 
         # - clear out any empty collectors (e.g. from invalid data)
         # - populate template-rendering context and set of affected students
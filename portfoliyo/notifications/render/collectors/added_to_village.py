@@ -20,6 +20,7 @@ class AddedToVillageCollector(base.NotificationTypeCollector):
         'added-by-id': (model.Profile, 'added_by'),
         'student-id': (model.Profile, 'student'),
         }
+    db_select_related = {'added-by-id': ['user']}
     notification_pref = 'notify_added_to_village'
 
 
@@ -38,6 +38,46 @@ class RehydrationFailed(Exception):
 
 
 
+def prefetch_objects(pending, objects):
+    """
+    Query for all lookup objects needed to hydrate ``pending`` notifications.
+
+    ``pending`` is an iterable of (collector, data) pairs. ``objects`` is a
+    dictionary mapping model classes to dictionaries of instances keyed by
+    string primary key (with ``None`` for IDs that weren't found); it is
+    updated in place. Makes at most one query per model class (plus any
+    ``db_prefetch_related`` queries).
+
+    """
+    ids_by_model = {}
+    related_by_model = {}
+    prefetch_by_model = {}
+    for collector, data in pending:
+        for src_key, (model_class, dest_key) in collector.db_lookup.items():
+            pk = str(data.get(src_key, ''))
+            if not pk.isdigit() or pk in objects.get(model_class, {}):
+                continue
+            ids_by_model.setdefault(model_class, set()).add(pk)
+            related_by_model.setdefault(model_class, set()).update(
+                collector.db_select_related.get(src_key, []))
+            prefetch_by_model.setdefault(model_class, set()).update(
+                collector.db_prefetch_related.get(src_key, []))
+
+    for model_class, ids in ids_by_model.items():
+        queryset = model_class.objects.all()
+        related = related_by_model[model_class]
+        if related:
+            queryset = queryset.select_related(*sorted(related))
+        prefetch = prefetch_by_model[model_class]
+        if prefetch:
+            queryset = queryset.prefetch_related(*sorted(prefetch))
+        found = queryset.in_bulk([int(pk) for pk in ids])
+        prefetched = objects.setdefault(model_class, {})
+        for pk in ids:
+            prefetched[pk] = found.get(int(pk))
+
+
+
 class NotificationTypeCollector(object):
     """
     Base class for collections of notifications of the same type.
@@ -58,14 +98,20 @@ class NotificationTypeCollector(object):
     subject_template = None
     #  mapping of source data ID keys to lookup model and hydrated data key
     db_lookup = {}
+    #  mapping of source data ID keys to related fields to select with lookup
+    db_select_related = {}
+    #  mapping of source data ID keys to related sets to prefetch with lookup
+    db_prefetch_related = {}
     #  what notification preference does this collector map to?
     notification_pref = None
 
 
     """Base class for notification types."""
-    def __init__(self, profile):
+    def __init__(self, profile, objects=None):
         self.profile = profile
         self.notifications = []
+        # prefetched lookup objects (see ``prefetch_objects``)
+        self.objects = {} if objects is None else objects
 
 
     def __nonzero__(self):
@@ -87,6 +133,18 @@ class NotificationTypeCollector(object):
         return True
 
 
+    def prefetch(self, data_list):
+        """
+        Prepare to hydrate all notification data in ``data_list``.
+
+        Called before ``add`` with all the data this collector is about to
+        hydrate; subclasses can override to fetch in bulk anything ``hydrate``
+        would otherwise query for once per notification.
+
+        """
+        pass
+
+
     def hydrate(self, data):
         """
         Rehydrate given notification data.
@@ -103,13 +161,30 @@ class NotificationTypeCollector(object):
         hydrated = {}
         for src_key, (model_class, dest_key) in self.db_lookup.items():
             try:
-                hydrated[dest_key] = model_class.objects.get(pk=data[src_key])
+                hydrated[dest_key] = self.get_object(model_class, data[src_key])
             except (KeyError, model_class.DoesNotExist):
                 raise RehydrationFailed()
 
         return hydrated
 
 
+    def get_object(self, model_class, pk):
+        """
+        Get ``model_class`` instance with given ``pk``.
+
+        Use prefetched objects if available, else query for it. Raise
+        ``model_class.DoesNotExist`` if there is no such instance.
+
+        """
+        prefetched = self.objects.get(model_class, {})
+        key = str(pk)
+        if key in prefetched:
+            if prefetched[key] is None:
+                raise model_class.DoesNotExist()
+            return prefetched[key]
+        return model_class.objects.get(pk=pk)
+
+
     def get_context(self):
         """Get template context for this notification type."""
         return {}
@@ -82,9 +82,30 @@ class BulkPostCollector(base.NotificationTypeCollector):
     type_name = types.BULK_POST
     subject_template = 'notifications/activity/_bulk_posts.subject.txt'
     db_lookup = {'bulk-post-id': (model.BulkPost, 'bulk-post')}
+    db_select_related = {'bulk-post-id': ['author__user']}
     notification_pref = 'notify_teacher_post'
 
 
+    def __init__(self, *args, **kw):
+        super(BulkPostCollector, self).__init__(*args, **kw)
+        # maps bulk-post ID to list of its triggered posts visible to me
+        self._visible = {}
+
+
+    def prefetch(self, data_list):
+        """Query visible triggered posts for all bulk posts at once."""
+        ids = set(
+            int(d['bulk-post-id']) for d in data_list
+            if str(d.get('bulk-post-id', '')).isdigit()
+            ) - set(self._visible)
+        if not ids:
+            return
+        for bulk_post_id in ids:
+            self._visible[bulk_post_id] = []
+        for post in self._visible_posts().filter(from_bulk__in=ids):
+            self._visible[post.from_bulk_id].append(post)
+
+
     def get_context(self):
         collection = BulkPostCollection()
         for n in self.notifications:
@@ -100,12 +121,9 @@ class BulkPostCollector(base.NotificationTypeCollector):
         """Determine how many villages I see this post in."""
         hydrated = super(BulkPostCollector, self).hydrate(data)
         bulk_post = hydrated['bulk-post']
-        # triggered individual posts that are in villages I am in
-        visible = list(
-            bulk_post.triggered.filter(
-                student__relationships_to__from_profile=self.profile).distinct(
-                ).select_related('student')
-            )
+        visible = self._visible.get(bulk_post.id)
+        if visible is None:
+            visible = list(self._visible_posts().filter(from_bulk=bulk_post))
         # if only one triggered post is visible, treat it as a non-bulk post
         if len(visible) == 1:
             from .. import collect
@@ -121,5 +139,12 @@ class BulkPostCollector(base.NotificationTypeCollector):
         return hydrated
 
 
+    def _visible_posts(self):
+        """Return queryset of individual posts in villages I am in."""
+        return model.Post.objects.filter(
+            student__relationships_to__from_profile=self.profile).distinct(
+            ).select_related('student')
+
+
     def get_students(self):
         return [s for n in self.notifications for s in n['students']]
@@ -17,16 +17,31 @@ class Signup(object):
     @classmethod
     def from_textsignup(cls, text_signup):
         """Instantiate from a ``TextSignup`` model instance."""
-        try:
-            rel = model.Relationship.objects.get(
-                from_profile=text_signup.family,
-                to_profile=text_signup.student)
-        except model.Relationship.DoesNotExist:
-            role = text_signup.family.role
-        else:
-            role = rel.description_or_role
-        return cls(
-            text_signup.student, text_signup.family, role, text_signup.group)
+        return cls.from_textsignups([text_signup])[0]
+
+
+    @classmethod
+    def from_textsignups(cls, text_signups):
+        """Instantiate list from ``TextSignup`` instances, in a single query."""
+        text_signups = list(text_signups)
+        if not text_signups:
+            return []
+        rels = model.Relationship.objects.filter(
+            from_profile__in=[ts.family_id for ts in text_signups],
+            to_profile__in=[
+                ts.student_id for ts in text_signups if ts.student_id],
+            ).select_related('from_profile')
+        rels_by_pair = dict(
+            ((r.from_profile_id, r.to_profile_id), r) for r in rels)
+        signups = []
+        for ts in text_signups:
+            rel = rels_by_pair.get((ts.family_id, ts.student_id))
+            if rel is None:
+                role = ts.family.role
+            else:
+                role = rel.description_or_role
+            signups.append(cls(ts.student, ts.family, role, ts.group))
+        return signups
 
 
 
@@ -42,15 +57,14 @@ class NewParentCollector(base.NotificationTypeCollector):
     type_name = types.NEW_PARENT
     subject_template = 'notifications/activity/_new_parents.subject.txt'
     db_lookup = {'signup-id': (model.TextSignup, 'signup')}
+    db_select_related = {'signup-id': ['family', 'student', 'group']}
     notification_pref = 'notify_new_parent'
 
 
     def get_context(self):
         return {
-            'signups': [
-                Signup.from_textsignup(n['signup'])
-                for n in self.notifications
-                ],
+            'signups': Signup.from_textsignups(
+                [n['signup'] for n in self.notifications]),
             'any_requested_new_parent': self.any_requested(),
             'any_nonrequested_new_parent': self.any_nonrequested(),
             }
@@ -20,6 +20,7 @@ class NewTeacherCollector(base.NotificationTypeCollector):
         'teacher-id': (model.Profile, 'teacher'),
         'student-id': (model.Profile, 'student'),
         }
+    db_select_related = {'teacher-id': ['user']}
     notification_pref = 'notify_joined_my_village'
 
 
@@ -1,6 +1,7 @@
 """Post notification collector."""
 from datetime import timedelta
 
+from django.db import connection
 from django.utils import timezone
 
 from portfoliyo import model, serializers
@@ -17,6 +18,53 @@ def serialize_post(post, **extra):
 
 
 
+def latest_posts(students, exclude_ids=None, num=5):
+    """
+    Return the latest ``num`` posts in each given student's village.
+
+    Posts with IDs in ``exclude_ids`` are skipped. A window function ranks
+    posts within each village, so all villages are queried at once. Return a
+    queryset of posts ordered newest first.
+
+    """
+    student_ids = [s.id for s in students]
+    exclude_ids = list(exclude_ids or [])
+    qn = connection.ops.quote_name
+    table = qn(model.Post._meta.db_table)
+    ranked = (
+        "SELECT id, row_number() OVER "
+        "(PARTITION BY student_id ORDER BY timestamp DESC) AS rank "
+        "FROM %s WHERE student_id IN (%s)" % (
+            table, ', '.join(['%s'] * len(student_ids)))
+        )
+    params = student_ids
+    if exclude_ids:
+        ranked += " AND id NOT IN (%s)" % ', '.join(['%s'] * len(exclude_ids))
+        params = params + exclude_ids
+    where = "%s.id IN (SELECT id FROM (%s) AS ranked WHERE rank <= %%s)" % (
+        table, ranked)
+    return model.Post.objects.filter(student__in=student_ids).extra(
+        where=[where], params=params + [num]).select_related(
+        'author__user', 'relationship').prefetch_related(
+        'attachments').order_by('-timestamp')
+
+
+
+def load_context_posts(villages):
+    """Load context posts for all given ``Village``s in a single query."""
+    villages = list(villages)
+    if not villages:
+        return
+    new_ids = [p['post_id'] for v in villages for p in v.new_posts]
+    latest_by_student_id = {}
+    for post in latest_posts([v.student for v in villages], new_ids):
+        latest_by_student_id.setdefault(post.student_id, []).append(post)
+    for village in villages:
+        village.set_context_posts(
+            latest_by_student_id.get(village.student.id, []))
+
+
+
 class Village(object):
     """
     Encapsulates a village with posts (some new, some context).
@@ -61,22 +109,24 @@ class Village(object):
     def context_posts(self):
         """List of context posts."""
         if self._context_posts is None:
-            cutoff = timezone.now() - timedelta(hours=48)
-            # get latest five posts in village, excluding the new ones
-            latest = list(
-                self.student.posts_in_village.exclude(
-                    pk__in=[p['post_id'] for p in self.new_posts]).order_by(
-                    '-timestamp')[:5]
-                )
-            # only keep those within last 48 hours
-            ctx = [p for p in latest if p.timestamp > cutoff]
-            # if there are posts but they are all old, keep one
-            if latest and not ctx:
-                ctx = list(latest)[-1:]
-            self._context_posts = [serialize_post(p, new=False) for p in ctx]
+            self.set_context_posts(
+                latest_posts(
+                    [self.student], [p['post_id'] for p in self.new_posts]))
         return self._context_posts
 
 
+    def set_context_posts(self, latest):
+        """Set context posts from ``latest`` posts in village, newest first."""
+        cutoff = timezone.now() - timedelta(hours=48)
+        latest = list(latest)
+        # only keep those within last 48 hours
+        ctx = [p for p in latest if p.timestamp > cutoff]
+        # if there are posts but they are all old, keep one
+        if latest and not ctx:
+            ctx = latest[-1:]
+        self._context_posts = [serialize_post(p, new=False) for p in ctx]
+
+
 
 class PostCollector(base.NotificationTypeCollector):
     """
@@ -97,6 +147,10 @@ class PostCollector(base.NotificationTypeCollector):
     type_name = types.POST
     subject_template = 'notifications/activity/_village_posts.subject.txt'
     db_lookup = {'post-id': (model.Post, 'post')}
+    db_select_related = {
+        'post-id': ['author__user', 'student', 'relationship'],
+        }
+    db_prefetch_related = {'post-id': ['attachments']}
 
 
     def __init__(self, *args, **kw):
@@ -118,6 +172,7 @@ class PostCollector(base.NotificationTypeCollector):
             village.add(notification)
 
         villages = villages.values()
+        load_context_posts(villages)
         requested = []
         nonrequested = []
         for village in villages:
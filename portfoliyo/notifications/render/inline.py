@@ -0,0 +1,42 @@
+"""
+Inlining of CSS styles into notification email HTML.
+
+Uses only premailer's public ``Premailer.transform()``. A configured
+``Premailer`` is kept per thread and base URL and reused for every email,
+rather than constructed for each one; only its ``html`` changes per call.
+
+Inlining into the ``notifications/activity.html`` template source once, ahead
+of time, would not give the same output: included templates build class
+attributes with template tags, the stylesheet uses sibling selectors (e.g.
+``h2 + .post``) that depend on the rendered structure, and lxml moves
+template tags that sit between table rows. So each rendered email is inlined.
+
+"""
+import threading
+
+from premailer import Premailer
+
+
+_local = threading.local()
+
+
+
+def inline_css(html, base_url=None):
+    """Return ``html`` with its <style> rules moved into style attributes."""
+    premailer = get_premailer(base_url)
+    premailer.html = html
+    try:
+        return premailer.transform()
+    finally:
+        premailer.html = None
+
+
+
+def get_premailer(base_url=None):
+    """Get this thread's (cached) ``Premailer`` for given base URL."""
+    premailers = _local.__dict__.setdefault('premailers', {})
+    premailer = premailers.get(base_url)
+    if premailer is None:
+        premailer = premailers[base_url] = Premailer(
+            None, base_url=base_url, output_xhtml=True)
+    return premailer
@@ -10,6 +10,7 @@ PENDING_PROFILES_KEY = 'notify:pending:profile-ids'
 NEXT_NOTIFICATION_ID_KEY_PATTERN = 'notify:profiles:%s:next-notification-id'
 PENDING_NOTIFICATIONS_KEY_PATTERN = 'notify:profiles:%s:pending'
 NOTIFICATION_KEY_PATTERN = 'notify:profiles:%s:notifications:%s'
+EMAIL_SCHEDULED_KEY_PATTERN = 'notify:profiles:%s:email-scheduled'
 
 
 
@@ -32,43 +33,84 @@ def store(profile_id, name, triggering=False, data=None):
     notification; all values should be strings.
 
     """
-    data = data or {}
-    data['triggering'] = '1' if triggering else '0'
-    data['name'] = name
+    store_many([(profile_id, name, triggering, data)])
 
-    pending_key = make_pending_notifications_key(profile_id)
-    notification_id = get_next_notification_id(profile_id)
-    key = make_notification_key(profile_id, notification_id)
 
-    expiry_timestamp = time.time() + settings.NOTIFICATION_EXPIRY_SECONDS
+
+def store_many(notifications):
+    """
+    Store many notifications, for any number of profiles.
+
+    ``notifications`` is a list of (profile_id, name, triggering, data) tuples;
+    see ``store`` for the meaning of each.
+
+    Makes two Redis round-trips: one to allocate notification IDs for all
+    profiles, and one to store all notifications.
+
+    """
+    if not notifications:
+        return
+
+    counts = {}
+    for profile_id, name, triggering, data in notifications:
+        counts[profile_id] = counts.get(profile_id, 0) + 1
+    profile_ids = counts.keys()
+
+    p = redis.client.pipeline()
+    for profile_id in profile_ids:
+        p.incr(
+            NEXT_NOTIFICATION_ID_KEY_PATTERN % profile_id, counts[profile_id])
+    # each profile's allocated IDs run from first_id up to the returned ID
+    next_ids = dict(
+        (profile_id, last_id - counts[profile_id] + 1)
+        for profile_id, last_id in zip(profile_ids, p.execute())
+        )
 
     p = redis.client.pipeline()
-    # add the notification ID to the list of pending notifications for this user
-    p.zadd(pending_key, expiry_timestamp, notification_id)
-    # Store data hash for the notification. Allow the data to exist for an
-    # extra minute so we don't ever try to query expired data
-    p.hmset(key, data).expireat(key, int(expiry_timestamp) + 60)
-    if triggering:
-        # Add user to the set of users with pending triggering notifications
-        p.sadd(PENDING_PROFILES_KEY, profile_id)
+    for profile_id, name, triggering, data in notifications:
+        data = data or {}
+        data['triggering'] = '1' if triggering else '0'
+        data['name'] = name
+
+        pending_key = make_pending_notifications_key(profile_id)
+        notification_id = next_ids[profile_id]
+        next_ids[profile_id] += 1
+        key = make_notification_key(profile_id, notification_id)
+
+        expiry_timestamp = time.time() + settings.NOTIFICATION_EXPIRY_SECONDS
+
+        # add the notification ID to the list of pending notifications
+        p.zadd(pending_key, expiry_timestamp, notification_id)
+        # Store data hash for the notification. Allow the data to exist for an
+        # extra minute so we don't ever try to query expired data
+        p.hmset(key, data).expireat(key, int(expiry_timestamp) + 60)
+        if triggering:
+            # Add user to the set of users with pending triggering notifications
+            p.sadd(PENDING_PROFILES_KEY, profile_id)
     p.execute()
 
 
 
 def get_all(profile_id, clear=False):
     """
-    Get all pending notifications for given profile ID.
+    Get list of all pending notifications for given profile ID.
 
     Do not return expired notifications (those older than
-    NOTIFICATION_EXPIRY_SECONDS).
+    NOTIFICATION_EXPIRY_SECONDS); their IDs are also removed from the profile's
+    pending notifications.
 
     If ``clear`` is ``True``, also clear all pending notifications.
 
+    Makes at most two Redis round-trips, regardless of the number of pending
+    notifications.
+
     """
     pending_key = make_pending_notifications_key(profile_id)
     now_ts = int(time.time())
 
     p = redis.client.pipeline()
+    # prune expired notification IDs; their data has expired (or soon will)
+    p.zremrangebyscore(pending_key, '-inf', '(%s' % now_ts)
     # get non-expired pending notifications for this user
     p.zrangebyscore(pending_key, now_ts, '+inf')
     if clear:
@@ -76,11 +118,109 @@ def get_all(profile_id, clear=False):
         p.delete(pending_key)
         # remove user from the set of users w/ pending triggering notifications
         p.srem(PENDING_PROFILES_KEY, profile_id)
+        # the next triggering notification should schedule a new email
+        p.delete(make_email_scheduled_key(profile_id))
         # don't clear out individual notification data; redis expiration will
-    ids = p.execute()[0]
+    ids = p.execute()[1]
+
+    if not ids:
+        return []
 
+    p = redis.client.pipeline()
     for notification_id in ids:
-        yield get(profile_id, notification_id)
+        p.hgetall(make_notification_key(profile_id, notification_id))
+    return p.execute()
+
+
+
+def clear(profile_id, stored_before):
+    """
+    Clear pending notifications stored for profile ID before given timestamp.
+
+    For clearing notifications only once they have been successfully emailed;
+    notifications stored meanwhile (after ``stored_before``) are kept, and if
+    any of them are triggering, the profile is kept pending as well.
+
+    The email-scheduled mark is removed either way, but a triggering
+    notification stored meanwhile could not schedule an email while it was
+    set; so return ``True`` if the caller should schedule another email.
+
+    Runs as a transaction watching the profile's pending notifications, so a
+    notification stored concurrently can't be missed.
+
+    """
+    pending_key = make_pending_notifications_key(profile_id)
+    # scores are expiry timestamps
+    max_score = stored_before + settings.NOTIFICATION_EXPIRY_SECONDS
+    reschedule = []
+
+    def _clear(pipe):
+        later_ids = pipe.zrangebyscore(pending_key, '(%s' % max_score, '+inf')
+        triggering = [
+            pipe.hget(make_notification_key(profile_id, nid), 'triggering')
+            for nid in later_ids
+            ]
+        reschedule[:] = ['1' in triggering]
+        pipe.multi()
+        pipe.zremrangebyscore(pending_key, '-inf', max_score)
+        if not reschedule[0]:
+            pipe.srem(PENDING_PROFILES_KEY, profile_id)
+        pipe.delete(make_email_scheduled_key(profile_id))
+
+    redis.client.transaction(_clear, pending_key)
+    return reschedule[0]
+
+
+
+def schedule_email(profile_id, delay):
+    """
+    Mark a notification email as scheduled for given profile ID.
+
+    Return ``True`` if the email was not already scheduled (so the caller
+    should schedule it to be sent in ``delay`` seconds), ``False`` otherwise.
+    The mark is removed when pending notifications are cleared, or (in case
+    the scheduled email never goes out) a minute after ``delay`` elapses.
+
+    """
+    return profile_id in schedule_emails({profile_id: delay})
+
+
+
+def schedule_emails(delays):
+    """
+    Mark notification emails as scheduled for many profiles.
+
+    ``delays`` is a dictionary mapping profile IDs to delay in seconds. Return
+    the set of those profile IDs whose emails were not already scheduled. See
+    ``schedule_email``.
+
+    """
+    profile_ids = delays.keys()
+    if not profile_ids:
+        return set()
+    # redis-py 2.7 has no SET NX EX, so SETNX and EXPIRE are separate calls; a
+    # mark left without expiry (e.g. if we died in between) is repaired here.
+    p = redis.client.pipeline()
+    for profile_id in profile_ids:
+        key = make_email_scheduled_key(profile_id)
+        p.setnx(key, 1)
+        p.ttl(key)
+    results = p.execute()
+    scheduled = set()
+    to_expire = []
+    for profile_id, is_new, ttl in zip(
+            profile_ids, results[::2], results[1::2]):
+        if is_new:
+            scheduled.add(profile_id)
+        if is_new or ttl is None:
+            to_expire.append(profile_id)
+    if to_expire:
+        p = redis.client.pipeline()
+        for profile_id in to_expire:
+            p.expire(
+                make_email_scheduled_key(profile_id), delays[profile_id] + 60)
+        p.execute()
+    return scheduled
 
 
 
@@ -106,3 +246,9 @@ def make_notification_key(profile_id, notification_id):
 def make_pending_notifications_key(profile_id):
     """Make Redis key for set of pending notifications."""
     return PENDING_NOTIFICATIONS_KEY_PATTERN % profile_id
+
+
+
+def make_email_scheduled_key(profile_id):
+    """Make Redis key for marker of a scheduled notification email."""
+    return EMAIL_SCHEDULED_KEY_PATTERN % profile_id
@@ -7,6 +7,7 @@ from django.http import HttpResponse, HttpResponseForbidden
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
+from . import occupancy
 from .base import get_pusher
 
 
@@ -41,6 +42,8 @@ def pusher_auth(request):
             allow(request.user.profile, channel)
             ):
         r = pusher[channel].authenticate(socket_id)
+        # in case we missed (or have yet to get) the occupied webhook
+        occupancy.mark_occupied(channel)
         return HttpResponse(json.dumps(r), mimetype="application/json")
 
     return HttpResponseForbidden("Not Authorized")
@@ -1,16 +1,115 @@
 """Code to get access to a Pusher API instance."""
 from __future__ import absolute_import
 
+import hashlib
+import hmac
+import json
+import time
+
 from django.conf import settings
 import pusher
 
+from portfoliyo import clients
+
+
+# maximum number of channels Pusher accepts in a single trigger request
+MAX_TRIGGER_CHANNELS = 10
+
 
 
 def get_pusher():
-    """Return a real pusher client if configured in settings, or None."""
+    """
+    Return a real pusher client if configured in settings, or None.
+
+    The client is created once per process, and sends all events over one
+    persistent connection.
+
+    """
     app_id = getattr(settings, 'PUSHER_APPID', None)
     key = getattr(settings, 'PUSHER_KEY', None)
     secret = getattr(settings, 'PUSHER_SECRET', None)
     if app_id and key and secret:
-       return pusher.Pusher(app_id=app_id, key=key, secret=secret, port=443)
+        return clients.get(
+            'pusher',
+            lambda: PooledPusher(
+                app_id=app_id, key=key, secret=secret, port=443),
+            key=(app_id, key, secret),
+            )
     return None
+
+
+
+class PooledPusher(pusher.Pusher):
+    """
+    Pusher client whose channels share a ``PersistentConnection``.
+
+    Can also trigger an event on multiple channels with a single request.
+
+    """
+    def __init__(self, *args, **kwargs):
+        super(PooledPusher, self).__init__(*args, **kwargs)
+        self.connection = clients.PersistentConnection(self.host, self.port)
+        self.stats = self.connection.stats
+
+
+    def trigger(self, channels, event, data, socket_id=None):
+        """
+        Trigger ``event`` with ``data`` on all given ``channels`` at once.
+
+        Makes a single API request; there can be at most
+        ``MAX_TRIGGER_CHANNELS`` channels.
+
+        """
+        body = {
+            'name': event,
+            'channels': list(channels),
+            'data': json.dumps(data),
+            }
+        if socket_id:
+            body['socket_id'] = socket_id
+        json_body = json.dumps(body)
+        path = '/apps/%s/events' % self.app_id
+        query = (
+            "auth_key=%s&auth_timestamp=%s&auth_version=1.0&body_md5=%s" % (
+                self.key, int(time.time()), hashlib.md5(json_body).hexdigest())
+            )
+        signature = hmac.new(
+            str(self.secret),
+            "POST\n%s\n%s" % (path, query),
+            hashlib.sha256,
+            ).hexdigest()
+        status, content = self.connection.request(
+            'POST',
+            '%s?%s&auth_signature=%s' % (path, query, signature),
+            json_body,
+            {'Content-Type': 'application/json'},
+            )
+        if status in (200, 202):
+            return True
+        elif status == 401:
+            raise pusher.AuthenticationError
+        elif status == 404:
+            raise pusher.NotFoundError
+        raise Exception("Unexpected return status %s" % status)
+
+
+    def _make_channel(self, name):
+        self._channels[name] = PooledChannel(name, self)
+        return self._channels[name]
+
+
+    def close(self):
+        self.connection.close()
+
+
+
+class PooledChannel(pusher.Channel):
+    """Pusher channel that sends events over its client's connection."""
+    def send_request(self, query_string, data_string):
+        status, content = self.pusher.connection.request(
+            'POST',
+            '%s?%s' % (self.path, query_string),
+            data_string,
+            {'Content-Type': 'application/json'},
+            )
+        return status
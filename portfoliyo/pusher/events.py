@@ -1,9 +1,12 @@
 """Pusher events."""
 import logging
 
+from django.core.urlresolvers import reverse
+
 from portfoliyo.api import resources
 from portfoliyo import model, serializers
-from portfoliyo.pusher import get_pusher
+from portfoliyo.pusher import get_pusher, occupancy
+from portfoliyo.pusher.base import MAX_TRIGGER_CHANNELS
 
 
 logger = logging.getLogger(__name__)
@@ -16,21 +19,63 @@ def posted(post_id, **extra_data):
 
 
 
+def posted_many(post_ids, author_sequence_id=None):
+    """Send ``message_posted`` events for all ``post_ids``, in order of ID."""
+    posts = model.Post.objects.filter(pk__in=post_ids).select_related(
+        'author__user', 'relationship').order_by('id')
+    for post in posts:
+        posted_event(
+            post,
+            author_sequence_id=author_sequence_id,
+            mark_read_url=reverse(
+                'mark_post_read', kwargs={'post_id': post.id}),
+            )
+
+
+
 def bulk_posted(bulk_post_id, **extra_data):
     """Send ``message_posted`` event for ``post_id`` with ``extra_data``."""
     posted_event(model.BulkPost.objects.get(pk=bulk_post_id), **extra_data)
 
 
 
+def bulk_posted_all(bulk_post_id, author_sequence_id=None):
+    """
+    Send ``message_posted`` events for a bulk post and all its sub-posts.
+
+    Sub-post events are sent first, followed by the bulk post event.
+
+    """
+    bulk_post = model.BulkPost.objects.select_related(
+        'author__user').get(pk=bulk_post_id)
+    subs = bulk_post.triggered.select_related(
+        'author__user', 'relationship').order_by('id')
+    for sub in subs:
+        posted_event(
+            sub,
+            author_sequence_id=author_sequence_id,
+            mark_read_url=reverse('mark_post_read', kwargs={'post_id': sub.id}),
+            )
+    posted_event(bulk_post, author_sequence_id=author_sequence_id)
+
+
+
 def posted_event(post, **extra_data):
-    data = serializers.post2dict(post, **extra_data)
+    """
+    Send ``message_posted`` event for ``post`` to all teachers in context.
+
+    All teachers get identical data (clients determine whether the post is
+    their own from its ``author_id``), so it's triggered on all channels at
+    once. If no teacher is subscribed, the post isn't even serialized.
+
+    """
     teacher_ids = post.elders_in_context.filter(
         school_staff=True).values_list('pk', flat=True)
-    for teacher_id in teacher_ids:
-        channel = 'user_%s' % teacher_id
-        my_data = {
-            'objects': [dict(data, mine=data['author_id'] == teacher_id)]}
-        trigger(channel, 'message_posted', my_data)
+    channels = user_channels(teacher_ids)
+    if not channels:
+        return
+    data = serializers.post2dict(post, **extra_data)
+    trigger_many(channels, 'message_posted', {'objects': [data]})
 
 
 
@@ -59,6 +104,12 @@ def student_event(event, student_id, elder_ids=None, full_data=True):
     If ``elder_ids`` is None, send to all elders of student.
 
     """
+    if elder_ids is None:
+        elder_ids = model.Relationship.objects.filter(
+            to_profile=student_id).values_list('from_profile', flat=True)
+    channels = user_channels(elder_ids)
+    if not channels:
+        return
     if full_data:
         profile_resource = resources.SlimProfileResource()
         student = model.Profile.objects.get(pk=student_id)
@@ -69,11 +120,7 @@ def student_event(event, student_id, elder_ids=None, full_data=True):
         data = profile_resource._meta.serializer.to_simple(b, None)
     else:
         data = {'id': student_id}
-    if elder_ids is None:
-        elder_ids = model.Relationship.objects.filter(
-            to_profile=student_id).values_list('from_profile', flat=True)
-    for elder_id in elder_ids:
-        trigger('user_%s' % elder_id, event, {'objects': [data]})
+    trigger_many(channels, event, {'objects': [data]})
 
 
 
@@ -97,6 +144,9 @@ def group_edited(group_id, owner_id):
 
 def group_event(event, group_id, owner_id, full_data=True):
     """Send Pusher ``event`` to ``owner_id`` regarding ``group_id``."""
+    channels = user_channels([owner_id])
+    if not channels:
+        return
     if full_data:
         group_resource = resources.SlimGroupResource()
         group = model.Group.objects.get(pk=group_id)
@@ -107,12 +157,15 @@ def group_event(event, group_id, owner_id, full_data=True):
         data = group_resource._meta.serializer.to_simple(b, None)
     else:
         data = {'id': group_id}
-    trigger('user_%s' % owner_id, event, {'objects': [data]})
+    trigger_many(channels, event, {'objects': [data]})
 
 
 
 def student_added_to_group(owner_id, student_ids, group_ids):
     """Tell ``owner_id`` that ``student_ids`` were added to ``group_ids``."""
+    channels = user_channels([owner_id])
+    if not channels:
+        return
     profile_resource = resources.SlimProfileResource()
     # allows resource_uri to be generated
     profile_resource._meta.api_name = 'v1'
@@ -123,8 +176,8 @@ def student_added_to_group(owner_id, student_ids, group_ids):
         data = profile_resource._meta.serializer.to_simple(b, None)
         data['groups'] = group_ids
         objects.append(data)
-    trigger(
-        'user_%s' % owner_id,
+    trigger_many(
+        channels,
         'student_added_to_group',
         {
             'objects': objects
@@ -146,21 +199,55 @@ def student_removed_from_group(owner_id, student_ids, group_ids):
 
 
 
+def user_channels(profile_ids):
+    """
+    Return list of user channel names for ``profile_ids`` with subscribers.
+
+    Channels are named without the ``private-`` prefix, as ``trigger`` and
+    ``trigger_many`` expect.
+
+    """
+    channels = ['user_%s' % profile_id for profile_id in profile_ids]
+    if not channels:
+        return []
+    occupied = set(occupancy.occupied(['private-%s' % c for c in channels]))
+    return [c for c in channels if 'private-%s' % c in occupied]
+
+
+
 def trigger(channel, event, data):
     """
     Fire ``event`` on ``channel`` with ``data`` if Pusher is configured.
 
+    Skipped if nobody is subscribed to ``channel``.
+
+    """
+    if occupancy.occupied(['private-%s' % channel]):
+        trigger_many([channel], event, data)
+
+
+
+def trigger_many(channels, event, data):
+    """
+    Fire ``event`` on all ``channels`` with ``data`` if Pusher is configured.
+
+    Channels are triggered in batches of up to ``MAX_TRIGGER_CHANNELS`` per
+    Pusher API request. Unlike ``trigger``, doesn't check whether channels are
+    occupied (see ``user_channels``).
+
     Log failures, but never blow up.
 
     """
     pusher = get_pusher()
     if pusher is None:
         return
-    try:
-        pusher['private-%s' % channel].trigger(event, data)
-    except Exception as e:
-        logger.warning(
-            "Pusher exception: %s" % str(e),
-            exc_info=True,
-            extra={'stack': True},
-            )
+    channels = ['private-%s' % channel for channel in channels]
+    for i in range(0, len(channels), MAX_TRIGGER_CHANNELS):
+        try:
+            pusher.trigger(channels[i:i + MAX_TRIGGER_CHANNELS], event, data)
+        except Exception as e:
+            logger.warning(
+                "Pusher exception: %s" % str(e),
+                exc_info=True,
+                extra={'stack': True},
+                )
@@ -0,0 +1,92 @@
+"""
+Registry of which Pusher channels currently have subscribers.
+
+Pusher's channel existence webhooks (see ``webhooks.pusher_webhook``) tell us
+when a channel becomes occupied (its first subscriber joins) or vacated (its
+last subscriber leaves). The backend configured in the
+``PORTFOLIYO_PUSHER_OCCUPANCY_BACKEND`` setting records this, so that events
+for channels nobody is listening on can be skipped entirely.
+
+Channel names here are full Pusher channel names, e.g. ``private-user_1``.
+
+"""
+from django.conf import settings
+
+from portfoliyo import redis
+from portfoliyo.backends import get_backend
+
+
+
+class AlwaysOccupied(object):
+    """
+    Consider every channel occupied.
+
+    For use when Pusher webhooks are not configured to send us channel
+    existence events; every event is triggered.
+
+    """
+    def occupied(self, channels):
+        return list(channels)
+
+
+    def mark_occupied(self, channel):
+        pass
+
+
+    def mark_vacated(self, channel):
+        pass
+
+
+
+class RedisOccupancy(object):
+    """
+    Store names of occupied channels in a Redis set.
+
+    Requires Pusher channel existence webhooks to be enabled. Without
+    ``REDIS_URL`` configured this uses the in-memory fake Redis, so it also
+    serves as a local stand-in for development and tests.
+
+    """
+    KEY = 'pusher:occupied'
+
+
+    def occupied(self, channels):
+        """Return list of those ``channels`` that have subscribers."""
+        channels = list(channels)
+        if not channels:
+            return []
+        p = redis.client.pipeline()
+        for channel in channels:
+            p.sismember(self.KEY, channel)
+        return [c for c, is_occupied in zip(channels, p.execute())
+                if is_occupied]
+
+
+    def mark_occupied(self, channel):
+        redis.client.sadd(self.KEY, channel)
+
+
+    def mark_vacated(self, channel):
+        redis.client.srem(self.KEY, channel)
+
+
+
+backend = get_backend(settings.PORTFOLIYO_PUSHER_OCCUPANCY_BACKEND)()
+
+
+
+def occupied(channels):
+    """Return list of those ``channels`` that have subscribers."""
+    return backend.occupied(channels)
+
+
+
+def mark_occupied(channel):
+    """Record that ``channel`` has subscribers."""
+    backend.mark_occupied(channel)
+
+
+
+def mark_vacated(channel):
+    """Record that ``channel`` no longer has any subscribers."""
+    backend.mark_vacated(channel)
@@ -0,0 +1,62 @@
+"""Pusher webhooks."""
+from __future__ import absolute_import
+
+import hashlib
+import hmac
+import json
+
+from django.conf import settings
+from django.http import (
+    HttpResponse, HttpResponseBadRequest, HttpResponseForbidden)
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from . import occupancy
+
+
+
+def is_authentic(key, signature, body):
+    """
+    Return True if webhook ``body`` was signed by our Pusher app.
+
+    Pusher sends its app key and a hex HMAC-SHA256 of the body (keyed with the
+    app secret) in the ``X-Pusher-Key`` and ``X-Pusher-Signature`` headers.
+
+    """
+    our_key = getattr(settings, 'PUSHER_KEY', None)
+    secret = getattr(settings, 'PUSHER_SECRET', None)
+    if not (our_key and secret) or key != our_key:
+        return False
+    expected = hmac.new(str(secret), body, hashlib.sha256).hexdigest()
+    return constant_time_compare(signature or '', expected)
+
+
+
+@require_POST
+@csrf_exempt
+def pusher_webhook(request):
+    """Record channel occupancy changes reported by Pusher."""
+    if not is_authentic(
+            request.META.get('HTTP_X_PUSHER_KEY'),
+            request.META.get('HTTP_X_PUSHER_SIGNATURE'),
+            request.body,
+            ):
+        return HttpResponseForbidden("Not Authorized")
+
+    try:
+        events = json.loads(request.body)['events']
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest("Invalid webhook")
+
+    # Pusher sends events in the order they occurred
+    for event in events:
+        name, channel = event.get('name'), event.get('channel')
+        if not channel:
+            continue
+        if name == 'channel_occupied':
+            occupancy.mark_occupied(channel)
+        elif name == 'channel_vacated':
+            occupancy.mark_vacated(channel)
+
+    return HttpResponse("OK")
@@ -0,0 +1,168 @@
+"""
+Celery task queues and their latency.
+
+Tasks are routed to named queues (see the ``PORTFOLIYO_TASK_QUEUES`` setting)
+so that separate workers (see the Procfile) can serve them: a burst of
+analytics or email tasks needn't hold up SMS and Pusher events.
+
+To measure how long tasks wait in each queue before a worker starts them,
+``probe`` sends a tiny probe task, stamped with the time it was sent, into
+every queue. When a worker runs the probe it calls ``record``, storing the
+queue's latency in Redis. (Latencies thus include any clock skew between the
+probing and probed workers.)
+
+Workers also record, for every task call, how long it was pending commit of
+the transaction it was made in, how long it then waited in its queue, and how
+long it ran (see ``TransactionTask``). These timings are counted in per-task,
+per-hour histograms in Redis; ``task_timings`` aggregates them and
+``percentile`` estimates percentiles from them (see the ``task_latency``
+management command).
+
+"""
+import logging
+import time
+
+from django.conf import settings
+
+from portfoliyo import redis
+from portfoliyo.celery import celery
+
+
+logger = logging.getLogger(__name__)
+
+
+# Redis hash mapping queue names to "latency:measured-at" timestamps
+LATENCY_KEY = 'celery:queue-latency'
+
+# task call timings recorded
+METRICS = ['pending', 'wait', 'run']
+# upper bounds (in seconds) of timing histogram buckets; there's also an
+# overflow bucket for anything longer
+BUCKETS = [
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900]
+OVERFLOW = float('inf')
+# Redis hash of bucket counts, by hour, task name and metric
+TIMING_KEY_PATTERN = 'celery:timing:%s:%s:%s'
+# Redis set of names of tasks with timings recorded, by hour
+TIMING_TASKS_KEY_PATTERN = 'celery:timing:%s:tasks'
+# keep hourly timings this long
+TIMING_EXPIRY_SECONDS = 7 * 24 * 60 * 60
+
+
+
+def all_queues():
+    """Return sorted list of all task queue names."""
+    queues = set(settings.PORTFOLIYO_TASK_QUEUES.values())
+    queues.add(celery.conf.CELERY_DEFAULT_QUEUE)
+    return sorted(queues)
+
+
+
+def probe():
+    """Send a latency probe task into every queue."""
+    from portfoliyo import tasks
+    for queue in all_queues():
+        tasks.record_queue_latency.apply_async(
+            (queue, time.time()), queue=queue)
+
+
+
+def record(queue, sent_at):
+    """Record latency of probe sent into ``queue`` at ``sent_at``."""
+    now = time.time()
+    latency = max(now - sent_at, 0.0)
+    redis.client.hset(LATENCY_KEY, queue, '%.3f:%d' % (latency, now))
+    logger.info("Celery queue %s latency: %.3fs", queue, latency)
+
+
+
+def latencies():
+    """
+    Return dict mapping queue names to (latency, measured_at) tuples.
+
+    ``latency`` is in seconds; ``measured_at`` is a Unix timestamp. A queue
+    whose last measurement is old may be stuck (its probes aren't running).
+
+    """
+    ret = {}
+    for queue, value in redis.client.hgetall(LATENCY_KEY).items():
+        latency, measured_at = value.split(':')
+        ret[queue] = (float(latency), int(measured_at))
+    return ret
+
+
+
+def record_task(task_name, pending, wait, run):
+    """Count timings (in seconds) of a task call in this hour's histograms."""
+    hour = int(time.time() // 3600)
+    p = redis.client.pipeline()
+    tasks_key = TIMING_TASKS_KEY_PATTERN % hour
+    p.sadd(tasks_key, task_name)
+    p.expire(tasks_key, TIMING_EXPIRY_SECONDS)
+    for metric, seconds in zip(METRICS, [pending, wait, run]):
+        key = TIMING_KEY_PATTERN % (hour, task_name, metric)
+        p.hincrby(key, _bucket(seconds), 1)
+        p.expire(key, TIMING_EXPIRY_SECONDS)
+    p.execute()
+
+
+
+def task_timings(hours=1):
+    """
+    Return timing histograms of task calls over the last ``hours`` hours.
+
+    Return value is a dict mapping task names to dicts mapping metric names
+    (see ``METRICS``) to histograms: dicts mapping bucket upper bounds (see
+    ``BUCKETS`` and ``OVERFLOW``) to counts of calls.
+
+    """
+    current = int(time.time() // 3600)
+    hour_range = range(current - hours + 1, current + 1)
+    p = redis.client.pipeline()
+    for hour in hour_range:
+        p.smembers(TIMING_TASKS_KEY_PATTERN % hour)
+    keys = [
+        (hour, task_name, metric)
+        for hour, task_names in zip(hour_range, p.execute())
+        for task_name in task_names
+        for metric in METRICS
+        ]
+    if not keys:
+        return {}
+    p = redis.client.pipeline()
+    for key in keys:
+        p.hgetall(TIMING_KEY_PATTERN % key)
+    timings = {}
+    for (hour, task_name, metric), counts in zip(keys, p.execute()):
+        histogram = timings.setdefault(task_name, {}).setdefault(metric, {})
+        for bucket, count in counts.items():
+            bucket = float(bucket)
+            histogram[bucket] = histogram.get(bucket, 0) + int(count)
+    return timings
+
+
+
+def percentile(histogram, pct):
+    """
+    Return upper bound of histogram bucket containing ``pct`` percentile.
+
+    Return None if the histogram is empty.
+
+    """
+    total = sum(histogram.values())
+    if not total:
+        return None
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen * 100.0 >= total * pct:
+            return bucket
+
+
+
+def _bucket(seconds):
+    """Return name of histogram bucket ``seconds`` falls in."""
+    for bound in BUCKETS:
+        if seconds <= bound:
+            return repr(float(bound))
+    return repr(OVERFLOW)
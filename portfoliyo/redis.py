@@ -47,27 +47,55 @@ class InMemoryRedis(object):
         self.expiry[key] = timestamp
 
 
+    def expire(self, key, seconds):
+        self.expireat(key, int(time.time()) + seconds)
+
+
+    def ttl(self, key):
+        # like redis-py 2.7, returns None for keys with no expiry (or missing)
+        self._check_expiry(key)
+        expiry = self.expiry.get(key)
+        if key not in self.data or expiry is None:
+            return None
+        return int(expiry - time.time())
+
+
+    def setnx(self, key, val):
+        self._check_expiry(key)
+        if key in self.data:
+            return False
+        self.data[key] = str(val)
+        return True
+
+
     def smembers(self, key):
         return self._get(key, set())
 
 
-    def sadd(self, key, val):
-        val = str(val)
+    def sadd(self, key, *vals):
         s = self._setdefault(key, set())
-        ret = 1 if val in s else 0
-        s.add(val)
+        ret = 0
+        for val in vals:
+            val = str(val)
+            if val not in s:
+                ret += 1
+            s.add(val)
         return ret
 
 
-    def srem(self, key, val):
-        val = str(val)
+    def srem(self, key, *vals):
         s = self._setdefault(key, set())
-        ret = 1 if val in s else 0
-        s.discard(val)
+        ret = 0
+        for val in vals:
+            val = str(val)
+            if val in s:
+                ret += 1
+            s.discard(val)
         return ret
 
 
     def delete(self, key):
+        self.expiry.pop(key, None)
         if key in self.data:
             del self.data[key]
             return True
@@ -85,16 +113,27 @@ class InMemoryRedis(object):
         return val in s
 
 
-    def incr(self, key):
-        val = self._get(key, 0)
-        val += 1
+    def get(self, key):
+        return self._get(key)
+
+
+    def setex(self, key, seconds, val):
+        self._check_expiry(key)
+        self.data[key] = str(val)
+        self.expire(key, seconds)
+        return True
+
+
+    def incr(self, key, amount=1):
+        val = int(self._get(key, 0))
+        val += amount
         self.data[key] = val
         return val
 
 
     def hmset(self, key, mapping):
         d = self._setdefault(key, {})
-        d.update((k, str(v)) for k, v in mapping.items())
+        d.update((str(k), str(v)) for k, v in mapping.items())
         return True
 
 
@@ -102,44 +141,112 @@ class InMemoryRedis(object):
         return self._get(key, {}).copy()
 
 
+    def hget(self, key, field):
+        return self._get(key, {}).get(str(field))
+
+
+    def hmget(self, key, fields, *args):
+        d = self._get(key, {})
+        return [d.get(str(f)) for f in list(fields) + list(args)]
+
+
+    def hdel(self, key, *fields):
+        d = self._get(key, {})
+        ret = 0
+        for field in fields:
+            ret += 1 if d.pop(str(field), None) is not None else 0
+        return ret
+
+
+    def hset(self, key, field, val):
+        d = self._setdefault(key, {})
+        field = str(field)
+        ret = 0 if field in d else 1
+        d[field] = str(val)
+        return ret
+
+
+    def hsetnx(self, key, field, val):
+        d = self._setdefault(key, {})
+        field = str(field)
+        if field in d:
+            return 0
+        d[field] = str(val)
+        return 1
+
+
+    def hincrby(self, key, field, amount=1):
+        d = self._setdefault(key, {})
+        field = str(field)
+        val = int(d.get(field, 0)) + amount
+        d[field] = str(val)
+        return val
+
+
     def zadd(self, key, score, val):
         score = float(score)
         val = str(val)
         l = self._setdefault(key, [])
-        add_index = 0
-        rem_index = None
-        for i, (iscore, ival) in enumerate(l):
-            if iscore < score:
-                add_index = i + 1
-            if val == ival:
-                rem_index = i
-        l.insert(add_index, (score, val))
-        if rem_index is not None:
-            if add_index <= rem_index:
-                rem_index += 1
-            l.pop(rem_index)
+        # like Redis, order by score, then lexicographically by value
+        l[:] = sorted([i for i in l if i[1] != val] + [(score, val)])
         return 1
 
 
     def zrangebyscore(self, key, min, max):
-        min = float(min)
-        max = float(max)
         ret = []
         for score, val in self._get(key, []):
-            if score >= min and score <= max:
+            if _in_score_range(score, min, max):
                 ret.append(val)
         return ret
 
 
-    def pipeline(self):
+    def zremrangebyscore(self, key, min, max):
+        l = self._get(key, [])
+        keep = [
+            (score, val) for score, val in l
+            if not _in_score_range(score, min, max)
+            ]
+        removed = len(l) - len(keep)
+        l[:] = keep
+        return removed
+
+
+    def pipeline(self, transaction=True):
         return Pipeline(self)
 
 
+    def _run_emulated(self, emulation, keys, args):
+        # a script is a single call to Redis
+        start_calls = self.num_calls
+        ret = emulation(self, keys, args)
+        self.num_calls = start_calls + 1
+        return ret
+
+
+    def transaction(self, func, *watches):
+        # single-threaded, so watched keys can't change before execute
+        p = self.pipeline()
+        p.watch(*watches)
+        func(p)
+        return p.execute()
+
+
 
 class Pipeline(object):
     def __init__(self, client):
         self.client = client
         self.calls = []
+        self.watching = False
+
+
+    def watch(self, *keys):
+        # until ``multi`` is called, commands are executed immediately
+        self.watching = True
+        self.client.num_calls += 1
+
+
+    def multi(self):
+        self.watching = False
 
 
     def execute(self):
@@ -154,17 +261,62 @@ class Pipeline(object):
 
 def _make_pipelined_method(name):
     def _pipelined_method(self, *args, **kwargs):
+        if self.watching:
+            return getattr(self.client, name)(*args, **kwargs)
         self.calls.append((name, args, kwargs))
         return self
 
     return _pipelined_method
 
 for method_name in dir(InMemoryRedis):
-    if not method_name.startswith('_') and method_name != 'pipeline':
+    if (not method_name.startswith('_') and
+            method_name not in {'pipeline', 'transaction'}):
         setattr(Pipeline, method_name, _make_pipelined_method(method_name))
 
 
 
+class Script(object):
+    """
+    A Lua script, run atomically on the server in a single round-trip.
+
+    The in-memory fake Redis can't run Lua, so each script comes with a Python
+    ``emulation(client, keys, args)`` with the same effect, which is run in its
+    place. Call with ``keys`` and ``args`` lists, like redis-py scripts.
+
+    """
+    def __init__(self, lua, emulation):
+        self.lua = lua
+        self.emulation = emulation
+        self._script = None
+
+
+    def __call__(self, keys=(), args=()):
+        if isinstance(client, InMemoryRedis):
+            return client._run_emulated(self.emulation, keys, args)
+        if self._script is None:
+            self._script = client.register_script(self.lua)
+        return self._script(keys=list(keys), args=list(args), client=client)
+
+
+
+def _in_score_range(score, min, max):
+    """Score is within sorted-set range; supports ``(`` exclusive bounds."""
+    min, min_exclusive = _parse_score_bound(min)
+    max, max_exclusive = _parse_score_bound(max)
+    above_min = score > min if min_exclusive else score >= min
+    below_max = score < max if max_exclusive else score <= max
+    return above_min and below_max
+
+
+def _parse_score_bound(bound):
+    """Return (float value, is-exclusive) tuple for a sorted-set range bound."""
+    bound = str(bound)
+    if bound.startswith('('):
+        return float(bound[1:]), True
+    return float(bound), False
+
+
+
 if settings.REDIS_URL: # pragma: no cover
     client = redis.StrictRedis.from_url(settings.REDIS_URL)
 else: # pragma: no cover
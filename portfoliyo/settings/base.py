@@ -248,6 +248,23 @@ PORTFOLIYO_COUNTRIES = [
 DEFAULT_COUNTRY_CODE = 'us'
 
 PORTFOLIYO_SMS_BACKEND = 'portfoliyo.sms.backends.console.ConsoleSMSBackend'
+# outbound texts are paced to this many segments per second per source number,
+# after an initial burst of up to SMS_BURST segments
+SMS_RATE_PER_SECOND = 1
+SMS_BURST = 5
+# longest a paced text is delayed; must be shorter than the broker visibility
+# timeout (CELERY_VISIBILITY_TIMEOUT_SECONDS), or delayed sends are redelivered
+SMS_MAX_DELAY_SECONDS = 50 * 60
+# transliterate texts to GSM-7 (e.g. "u" for u-acute) where that avoids UCS-2
+# encoding and its smaller (70-character) segments
+SMS_TRANSLITERATE = False
+# acknowledge inbound texts immediately (storing them, once per Twilio
+# MessageSid) and process them in the "inbound" task queue, replying with an
+# outbound text, rather than processing them within the webhook request
+SMS_ASYNC_RECEIVE = False
+# cache the IDs of the profile, students and active signups of each texting
+# phone number for this long (seconds; 0 disables)
+SMS_CONTEXT_CACHE_SECONDS = 60 * 60
 PORTFOLIYO_NUMBERS = {
     'us': '+15555555555',
     'ca': '+15555555555',
@@ -255,13 +272,48 @@ PORTFOLIYO_NUMBERS = {
 DEFAULT_NUMBER = '+15555555555'
 
 REDIS_URL = None
+
+# storage for unread-post state; the alternative WatermarkBackend uses far
+# less Redis memory (see the migrate_unread_to_watermarks command)
+PORTFOLIYO_UNREAD_BACKEND = (
+    'portfoliyo.model.village.unread_backends.SetBackend')
+# tracking of which Pusher channels have subscribers; RedisOccupancy requires
+# channel existence webhooks to be enabled (pointed at /pusher/webhook)
+PORTFOLIYO_PUSHER_OCCUPANCY_BACKEND = (
+    'portfoliyo.pusher.occupancy.AlwaysOccupied')
+# index of teacher and group signup codes, looked up for every inbound SMS;
+# DatabaseCodes queries the database directly instead
+PORTFOLIYO_CODE_INDEX_BACKEND = 'portfoliyo.model.users.codes.RedisCodes'
 CELERY_ALWAYS_EAGER = True
+# a task taken from the (Redis) broker but not acknowledged in this long, e.g.
+# because its countdown hasn't elapsed yet, is redelivered to another worker
+CELERY_VISIBILITY_TIMEOUT_SECONDS = 60 * 60
+# Celery queue to route each task to (unlisted tasks go to the default
+# "celery" queue); see the Procfile for the workers consuming each queue
+PORTFOLIYO_TASK_QUEUES = {
+    'portfoliyo.tasks.push_event': 'realtime',
+    'portfoliyo.tasks.receive_sms': 'inbound',
+    'portfoliyo.tasks.send_sms': 'sms',
+    'portfoliyo.tasks.send_sms_batch': 'sms',
+    'portfoliyo.tasks.send_notification_email': 'email',
+    'portfoliyo.tasks.send_notification_emails': 'email',
+    'portfoliyo.tasks.mixpanel': 'analytics',
+    }
+# send a latency probe into each task queue this often (seconds; 0 disables)
+QUEUE_LATENCY_PROBE_SECONDS = 60
+# remember completed side effects of idempotent tasks this long
+IDEMPOTENCY_TTL_SECONDS = 24 * 60 * 60
 
 PORTFOLIYO_BASE_URL = 'http://localhost:8000'
 
 NOTIFICATION_EMAILS = True
 # notifications last 48 hours by default
 NOTIFICATION_EXPIRY_SECONDS = 48 * 60 * 60
+# wait this many seconds for further notifications before sending an email
+# (profiles can override); zero means send immediately
+NOTIFICATION_EMAIL_DELAY_SECONDS = 0
+# pending notification emails are rendered and sent in batches of this size
+NOTIFICATION_BATCH_SIZE = 50
 
 DEBUG_TOOLBAR = False
 DEBUG_URLS = DEBUG
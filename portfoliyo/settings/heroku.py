@@ -108,6 +108,15 @@ EMAIL_HOST_PASSWORD = env('MAILGUN_SMTP_PASSWORD')
 PORTFOLIYO_SMS_BACKEND = env('PORTFOLIYO_SMS_BACKEND')
 TWILIO_ACCOUNT_SID = env('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = env('TWILIO_AUTH_TOKEN')
+SMS_RATE_PER_SECOND = float(
+    env('PORTFOLIYO_SMS_RATE_PER_SECOND') or SMS_RATE_PER_SECOND)
+SMS_BURST = int(env('PORTFOLIYO_SMS_BURST') or SMS_BURST)
+SMS_MAX_DELAY_SECONDS = int(
+    env('PORTFOLIYO_SMS_MAX_DELAY_SECONDS') or SMS_MAX_DELAY_SECONDS)
+SMS_TRANSLITERATE = env('PORTFOLIYO_SMS_TRANSLITERATE', bool)
+SMS_ASYNC_RECEIVE = env('PORTFOLIYO_SMS_ASYNC_RECEIVE', bool)
+SMS_CONTEXT_CACHE_SECONDS = int(
+    env('PORTFOLIYO_SMS_CONTEXT_CACHE_SECONDS') or SMS_CONTEXT_CACHE_SECONDS)
 PORTFOLIYO_NUMBERS = {
     'us': env('US_NUMBER'),
     'ca': env('CA_NUMBER'),
@@ -165,7 +174,29 @@ LOGGING = {
 }
 
 REDIS_URL = env('REDISTOGO_URL')
+PORTFOLIYO_UNREAD_BACKEND = (
+    env('PORTFOLIYO_UNREAD_BACKEND') or PORTFOLIYO_UNREAD_BACKEND)
+PORTFOLIYO_PUSHER_OCCUPANCY_BACKEND = (
+    env('PORTFOLIYO_PUSHER_OCCUPANCY_BACKEND') or
+    PORTFOLIYO_PUSHER_OCCUPANCY_BACKEND
+    )
+PORTFOLIYO_CODE_INDEX_BACKEND = (
+    env('PORTFOLIYO_CODE_INDEX_BACKEND') or PORTFOLIYO_CODE_INDEX_BACKEND)
 CELERY_ALWAYS_EAGER = not REDIS_URL
+CELERY_VISIBILITY_TIMEOUT_SECONDS = int(
+    env('PORTFOLIYO_CELERY_VISIBILITY_TIMEOUT_SECONDS') or
+    CELERY_VISIBILITY_TIMEOUT_SECONDS
+    )
+# e.g. "portfoliyo.tasks.mixpanel:celery,portfoliyo.tasks.send_sms:realtime"
+PORTFOLIYO_TASK_QUEUES.update(
+    pair.split(':', 1)
+    for pair in env('PORTFOLIYO_TASK_QUEUES').split(',')
+    if pair
+    )
+QUEUE_LATENCY_PROBE_SECONDS = int(
+    env('PORTFOLIYO_QUEUE_LATENCY_PROBE_SECONDS') or
+    QUEUE_LATENCY_PROBE_SECONDS
+    )
 
 GOOGLE_ANALYTICS_ID = env('GOOGLE_ANALYTICS_ID')
 USERVOICE_ID = env('USERVOICE_ID')
@@ -178,6 +209,12 @@ PORTFOLIYO_BASE_URL = env('PORTFOLIYO_BASE_URL')
 
 NOTIFICATION_EMAILS = env('PORTFOLIYO_NOTIFICATION_EMAILS', bool)
 NOTIFICATION_EXPIRY_SECONDS = env('PORTFOLIYO_NOTIFICATION_EXPIRY_SECONDS', int)
+NOTIFICATION_EMAIL_DELAY_SECONDS = int(
+    env('PORTFOLIYO_NOTIFICATION_EMAIL_DELAY_SECONDS') or
+    NOTIFICATION_EMAIL_DELAY_SECONDS
+    )
+NOTIFICATION_BATCH_SIZE = int(
+    env('PORTFOLIYO_NOTIFICATION_BATCH_SIZE') or NOTIFICATION_BATCH_SIZE)
 DEBUG_URLS = env('PORTFOLIYO_DEBUG_URLS', bool)
 
 STRIPE_PUBLIC_KEY = 'pk_JUTkGItjFgc2pg4ArykSVE1c0rJps'
@@ -1,21 +1,65 @@
 """Twilio SMS backend."""
 from __future__ import absolute_import
 
+import base64
+import json
+import urllib
+
 from django.conf import settings
-from twilio import rest
+from twilio import TwilioRestException
 
+from portfoliyo import clients
 from . import base
 
 
+API_HOST = 'api.twilio.com'
+SMS_PATH = '/2010-04-01/Accounts/%s/SMS/Messages.json'
+
+
+
 class TwilioSMSBackend(base.SMSBackend):
+    """
+    Send SMSes via Twilio's REST API.
+
+    Rather than use ``twilio.rest.TwilioRestClient``, which opens a new
+    connection for every request, all messages are sent over the process's
+    persistent Twilio connection (see ``portfoliyo.clients``).
+
+    """
     def __init__(self):
-        """Instantiate a TwilioRestClient based on settings."""
-        self.client = rest.TwilioRestClient(
-            settings.TWILIO_ACCOUNT_SID,
-            settings.TWILIO_AUTH_TOKEN,
+        """Prepare request path and headers based on settings."""
+        self.account_sid = settings.TWILIO_ACCOUNT_SID
+        self.path = SMS_PATH % self.account_sid
+        credentials = '%s:%s' % (self.account_sid, settings.TWILIO_AUTH_TOKEN)
+        self.headers = {
+            'Authorization': 'Basic %s' % base64.b64encode(credentials),
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Accept': 'application/json',
+            }
+
+
+    @property
+    def connection(self):
+        """The process's persistent connection to the Twilio API."""
+        return clients.get(
+            'twilio',
+            lambda: clients.PersistentConnection(API_HOST),
+            key=self.account_sid,
             )
 
 
     def send(self, to, from_, body):
-        """Send an SMS."""
-        return self.client.sms.messages.create(to=to, from_=from_, body=body)
+        """Send an SMS; raise ``TwilioRestException`` if Twilio rejects it."""
+        data = urllib.urlencode(
+            {'To': to, 'From': from_, 'Body': body.encode('utf-8')})
+        status, content = self.connection.request(
+            'POST', self.path, data, self.headers)
+        if status >= 400:
+            try:
+                error = json.loads(content)
+                message = "%s: %s" % (error['code'], error['message'])
+            except (ValueError, KeyError):
+                message = content
+            raise TwilioRestException(
+                status, 'https://%s%s' % (API_HOST, self.path), message)
+        return json.loads(content)
@@ -1,42 +1,61 @@
 """Core SMS functionality."""
 from django.conf import settings
 
-
-def get_backend(path):
-    """Load SMS backend based on settings."""
-    bits = path.split('.')
-    module_name = '.'.join(bits[:-1])
-    module = __import__(module_name, {}, {}, bits[-1])
-    return getattr(module, bits[-1])
+from portfoliyo import idempotency
+from portfoliyo.backends import get_backend
+from . import encoding
 
 
 backend = get_backend(settings.PORTFOLIYO_SMS_BACKEND)()
 
 
-def send(phone, source, body):
+def send(phone, source, body, idempotency_key=None):
     """
     Sends sms from ``source`` to ``phone`` with text ``body``.
 
-    If ``body`` is longer than 160 characters, the text will be sent as
-    multiple texts.
+    If ``body`` is longer than fits in a single SMS segment, the text will be
+    sent as multiple texts.
+
+    If ``idempotency_key`` is given, texts already sent under that key (e.g.
+    before a failure part-way through) are not sent again.
 
     """
-    for chunk in split_sms(body):
-        backend.send(phone, source, chunk)
+    for i, chunk in enumerate(split_sms(encoding.prepare(body))):
+        key = '%s:%s' % (idempotency_key, i) if idempotency_key else None
+        idempotency.once(key, backend.send, phone, source, chunk)
+
+
+def count_segments(body):
+    """Return number of SMS segments ``send`` will send ``body`` as."""
+    return len(list(split_sms(encoding.prepare(body))))
 
 
 def split_sms(text, joiner='...'):
     """
-    Return iterable of chunks of ``text`` <=160 chars each.
+    Return iterable of chunks of ``text`` each fitting in one SMS segment.
 
-    Joined components will end/begin with ``joiner``.
+    A segment holds 160 characters, or 70 if ``text`` requires UCS-2 encoding
+    (see the ``encoding`` module). Joined components will end/begin with
+    ``joiner``.
 
     """
-    joiner_len = len(joiner)
+    text_encoding = encoding.get_encoding(text)
+    limit = encoding.SEGMENT_LIMITS[text_encoding]
+    joiner_len = encoding.length(joiner, text_encoding)
     while True:
-        if len(text) <= 160:
+        if encoding.length(text, text_encoding) <= limit:
             yield text
             break
-        breakpoint = 160-joiner_len
+        breakpoint = _fit(text, limit - joiner_len, text_encoding)
         yield text[:breakpoint] + joiner
         text = joiner + text[breakpoint:]
+
+
+def _fit(text, limit, text_encoding):
+    """Return number of leading chars of ``text`` that fit in ``limit``."""
+    used = 0
+    for i, char in enumerate(text):
+        used += encoding.length(char, text_encoding)
+        if used > limit:
+            return i
+    return len(text)
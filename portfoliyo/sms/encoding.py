@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+SMS character encodings and segment budgets.
+
+A text segment holds 160 characters if the text can be encoded in the GSM-7
+alphabet, but only 70 if any character requires UCS-2 (e.g. the Spanish
+"ú"). Characters from the GSM-7 extension table (e.g. "[" or "€")
+take two of a segment's 160 slots. We split long texts into independent
+messages ourselves (see ``split_sms``), so the lower per-segment limits of
+concatenated messages (153 and 67) don't apply.
+
+If the ``SMS_TRANSLITERATE`` setting is on, ``prepare`` transliterates texts
+that would otherwise need UCS-2 into GSM-7 (e.g. "ú" to "u"), as long as
+every such character is Latin or punctuation, so nothing but accents and
+typography is lost.
+
+"""
+import unicodedata
+
+from django.conf import settings
+from unidecode import unidecode
+
+
+GSM7 = 'GSM-7'
+UCS2 = 'UCS-2'
+
+SEGMENT_LIMITS = {GSM7: 160, UCS2: 70}
+
+
+GSM7_CHARS = frozenset(
+    u'@£$¥èéùìòÇ\nØø\rÅå'
+    u'Δ_ΦΓΛΩΠΨΣΘΞÆæßÉ'
+    u' !"#¤%&\'()*+,-./0123456789:;<=>?'
+    u'¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§'
+    u'¿abcdefghijklmnopqrstuvwxyzäöñüà'
+    )
+# these take an escape character plus the character itself
+GSM7_EXTENDED_CHARS = frozenset(u'\f^{}\\[~]|€')
+
+# ranges of characters that transliteration tables are offered for: Latin-1
+# Supplement, Latin Extended-A and -B, and General Punctuation
+TRANSLITERATION_RANGES = [(0xa0, 0x250), (0x2000, 0x2070)]
+
+
+# maps character to its safe GSM-7 transliteration (or None)
+_transliterations = {}
+
+
+
+def get_encoding(text):
+    """Return encoding (``GSM7`` or ``UCS2``) an SMS of ``text`` will use."""
+    for char in text:
+        if char not in GSM7_CHARS and char not in GSM7_EXTENDED_CHARS:
+            return UCS2
+    return GSM7
+
+
+
+def length(text, encoding=None):
+    """
+    Return number of segment slots ``text`` occupies in given encoding.
+
+    If ``encoding`` is not given, it is determined from ``text``.
+
+    """
+    if encoding is None:
+        encoding = get_encoding(text)
+    return sum(_char_length(char, encoding) for char in text)
+
+
+
+def prepare(text):
+    """Return ``text`` as it should be sent, per ``SMS_TRANSLITERATE``."""
+    if settings.SMS_TRANSLITERATE:
+        return transliterate(text)
+    return text
+
+
+
+def transliterate(text):
+    """
+    Return ``text`` transliterated to GSM-7, if that can be done safely.
+
+    If any character in ``text`` would still require UCS-2, return ``text``
+    unchanged; it'll be sent as UCS-2 anyway, so may as well keep its accents.
+
+    """
+    if get_encoding(text) == GSM7:
+        return text
+    chars = []
+    for char in text:
+        if char in GSM7_CHARS or char in GSM7_EXTENDED_CHARS:
+            chars.append(char)
+            continue
+        replacement = _transliterate_char(char)
+        if replacement is None:
+            return text
+        chars.append(replacement)
+    return u''.join(chars)
+
+
+
+def transliterations():
+    """
+    Return dict mapping characters to their GSM-7 transliterations.
+
+    Covers the characters in ``TRANSLITERATION_RANGES``, for the benefit of
+    client-side segment counting.
+
+    """
+    mapping = {}
+    for start, end in TRANSLITERATION_RANGES:
+        for codepoint in range(start, end):
+            char = unichr(codepoint)
+            if char in GSM7_CHARS or char in GSM7_EXTENDED_CHARS:
+                continue
+            replacement = _transliterate_char(char)
+            if replacement is not None:
+                mapping[char] = replacement
+    return mapping
+
+
+
+def _transliterate_char(char):
+    """Return safe GSM-7 transliteration of non-GSM-7 ``char``, or None."""
+    if char not in _transliterations:
+        replacement = None
+        category = unicodedata.category(char)
+        latin = unicodedata.name(char, '').startswith('LATIN ')
+        if (latin and category.startswith('L')) or category[0] in 'PZ':
+            candidate = unidecode(char)
+            if candidate and get_encoding(candidate) == GSM7:
+                replacement = candidate
+        _transliterations[char] = replacement
+    return _transliterations[char]
+
+
+
+def _char_length(char, encoding):
+    """Return number of segment slots ``char`` occupies in ``encoding``."""
+    if encoding == GSM7:
+        return 2 if char in GSM7_EXTENDED_CHARS else 1
+    # characters outside the Basic Multilingual Plane take a surrogate pair
+    return 2 if ord(char) > 0xffff else 1
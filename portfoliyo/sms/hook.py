@@ -1,10 +1,12 @@
 """Village SMS-handling."""
 import logging
+import re
 
 from django.conf import settings
 from django.utils import timezone
 
-from portfoliyo import model, tasks
+from portfoliyo import model, tasks, xact
+from portfoliyo.model.users import codes, sms_contexts
 from . import messages
 
 
@@ -13,11 +15,41 @@ from . import messages
 # warning us, not affecting the user
 MAX_EXPECTED_ANSWER_LENGTH = 5
 
+# Only a word matching this can be a teacher or group code, so nothing else is
+# looked up (codes are alphanumeric and fit in Profile.code and Group.code)
+CODE_RE = re.compile(r'^[A-Z0-9]{1,20}$')
+
 
 logger = logging.getLogger(__name__)
 
 
 
+def process_inbound(inbound_id):
+    """
+    Process the stored ``InboundSms`` with given ID; send any reply as an SMS.
+
+    Does nothing if the message was already processed (e.g. if its task was
+    redelivered).
+
+    """
+    with xact.xact():
+        try:
+            inbound = model.InboundSms.objects.select_for_update().get(
+                pk=inbound_id)
+        except model.InboundSms.DoesNotExist:
+            logger.warning("Inbound SMS %s not found.", inbound_id)
+            return
+        if inbound.processed is not None:
+            logger.info("Inbound SMS %s already processed.", inbound.sid)
+            return
+        reply = receive_sms(inbound.source, inbound.to, inbound.body)
+        inbound.processed = timezone.now()
+        inbound.save()
+        if reply:
+            tasks.send_sms.delay(inbound.source, inbound.to, reply)
+
+
+
 def receive_sms(source, to, body):
     """
     Hook for when an SMS is received.
@@ -25,10 +57,8 @@ def receive_sms(source, to, body):
     Return None if no reply should be sent, or text of reply.
 
     """
-    try:
-        profile = model.Profile.objects.select_related(
-            'user').get(phone=source)
-    except model.Profile.DoesNotExist:
+    profile, students, active_signups = sms_contexts.load(source)
+    if profile is None:
         return handle_unknown_source(source, to, body)
 
     if body.strip().lower() == 'stop':
@@ -36,11 +66,10 @@ def receive_sms(source, to, body):
         profile.save()
         profile.user.is_active = False
         profile.user.save()
-        for student in profile.students:
-            model.Post.create(profile, student, body, from_sms=True)
+        model.Post.create_many(profile, students, body, from_sms=True)
         return reply(
             source,
-            profile.students,
+            students,
             messages.get('ACK_STOP', profile.lang_code)
             )
 
@@ -54,8 +83,6 @@ def receive_sms(source, to, body):
         profile.save()
         activated = True
 
-    active_signups = profile.signups.exclude(state=model.TextSignup.STATE.done)
-
     if active_signups:
         if len(active_signups) > 1:
             # shouldn't happen, since second signup sets first to done
@@ -78,14 +105,11 @@ def receive_sms(source, to, body):
         elif signup.state == model.TextSignup.STATE.name:
             return handle_name_update(signup, body)
 
-    students = profile.students
-
     if not students:
         track_sms('no students', source, body)
         return messages.get('NO_STUDENTS', profile.lang_code)
 
-    for student in students:
-        model.Post.create(profile, student, body, from_sms=True)
+    model.Post.create_many(profile, students, body, from_sms=True)
 
     teachers = model.Profile.objects.filter(
         school_staff=True, relationships_from__to_profile__in=students)
@@ -177,7 +201,7 @@ def handle_subsequent_code(profile, body, teacher, group, lang, signup):
             )
         if group:
             group.students.add(student)
-        model.Post.create(profile, student, body, from_sms=True)
+        model.Post.create_many(profile, [student], body, from_sms=True)
 
     # don't reply, track, or create new signup if already connected to teacher
     if (signup and teacher == signup.teacher) or (student and not created):
@@ -236,9 +260,9 @@ def handle_new_student(signup, body):
     signup.state = model.TextSignup.STATE.relationship
     signup.student = student
     signup.save()
-    model.Post.create(
+    model.Post.create_many(
         signup.family,
-        student,
+        [student],
         body,
         from_sms=True,
         notifications=False,
@@ -262,13 +286,12 @@ def handle_role_update(signup, body):
     signup.state = model.TextSignup.STATE.name
     signup.save()
     teacher = signup.teacher
-    student_rels = parent.student_relationships
-    for rel in student_rels:
-        model.Post.create(
-            parent, rel.student, body, from_sms=True, notifications=False)
+    students = parent.students
+    model.Post.create_many(
+        parent, students, body, from_sms=True, notifications=False)
     return reply(
         parent.phone,
-        parent.students,
+        students,
         messages.get('NAME', parent.lang_code) % teacher,
         )
 
@@ -282,14 +305,13 @@ def handle_name_update(signup, body):
     parent.save()
     signup.state = model.TextSignup.STATE.done
     signup.save()
-    student_rels = parent.student_relationships
-    for rel in student_rels:
-        model.Post.create(
-            parent, rel.student, body, from_sms=True, notifications=False)
+    students = parent.students
+    model.Post.create_many(
+        parent, students, body, from_sms=True, notifications=False)
     tasks.record_notification.delay('new_parent', signup.teacher, signup)
     return reply(
         parent.phone,
-        parent.students,
+        students,
         interpolate_teacher_names(
             messages.get('ALL_DONE', parent.lang_code),
             parent,
@@ -319,16 +341,10 @@ def parse_code(body):
     else:
         lang = settings.LANGUAGE_CODE
     possible_code = bits[0].rstrip('.,:;').upper()
-    try:
-        group = model.Group.objects.get(code=possible_code)
-    except model.Group.DoesNotExist:
-        group = None
-        try:
-            teacher = model.Profile.objects.get(code=possible_code)
-        except model.Profile.DoesNotExist:
-            teacher = None
+    if CODE_RE.match(possible_code):
+        teacher, group = codes.lookup(possible_code)
     else:
-        teacher = group.owner
+        teacher, group = None, None
     if teacher is None:
         lang = None
     return (teacher, group, lang)
@@ -385,9 +401,8 @@ def interpolate_teacher_names(msg, parent):
 
 def reply(phone, students, body):
     """Save given reply to given students' villages before returning it."""
-    for student in students:
-        model.Post.create(
-            None, student, body, in_reply_to=phone, notifications=False)
+    model.Post.create_many(
+        None, students, body, in_reply_to=phone, notifications=False)
     return body
 
 
@@ -0,0 +1,189 @@
+"""
+Pacing of outbound SMS sends per source number.
+
+SMS providers only accept a limited rate of messages per source number
+(roughly one per second for a Twilio long code), so a large batch of texts
+sent all at once is queued or rejected upstream. ``schedule`` instead spreads
+each batch's sends out over time with a token bucket per source number, and
+enqueues each send as a ``send_sms`` task delayed until its slot comes up.
+
+The bucket for each source number is a single Redis integer holding the time
+(in milliseconds) at which all sends scheduled so far will be done; it expires
+once they are, so an idle source starts over from the current time. Each text
+segment costs ``1 / SMS_RATE_PER_SECOND`` seconds, and the first ``SMS_BURST``
+segments of a source's backlog are sent without delay. Slots are reserved by
+atomic increments, so concurrent schedulers never hand out the same slot.
+
+No send is delayed by more than ``SMS_MAX_DELAY_SECONDS``: the broker would
+redeliver a task still waiting out its countdown after its visibility timeout.
+A backlog longer than that is sent faster than the configured rate.
+
+Every source number ever scheduled from is recorded in a Redis set, so
+``backlogs`` can report the queue depth and projected completion time of all
+of them (see the ``sms_backlog`` management command).
+
+"""
+from __future__ import division
+
+import collections
+import logging
+import time
+
+from django.conf import settings
+
+from portfoliyo import redis, tasks
+from portfoliyo.celery import IDEMPOTENCY_KEY_KWARG
+from .base import count_segments
+
+
+logger = logging.getLogger(__name__)
+
+
+SCHEDULE_KEY_PATTERN = 'sms:schedule:%s'
+SOURCES_KEY = 'sms:sources'
+
+
+
+class Backlog(collections.namedtuple('Backlog', ['queued', 'completes_at'])):
+    """
+    Backlog of scheduled sends for a source number.
+
+    ``queued`` is the number of text segments reserved on the number that are
+    not yet drained from its bucket, and ``completes_at`` the timestamp
+    (seconds since the epoch) by which they will all have been sent.
+
+    """
+    __slots__ = ()
+
+
+
+def schedule(messages, idempotency_key=None):
+    """
+    Schedule sending of given messages, paced per source number.
+
+    ``messages`` is an iterable of (phone, source, body) tuples. Return dict
+    mapping each source number to its resulting ``Backlog``.
+
+    If ``idempotency_key`` is given, each send is given a key derived from it
+    and the message's position, so that if the same messages are scheduled
+    again under the same key, none is sent twice.
+
+    """
+    by_source = collections.OrderedDict()
+    for i, (phone, source, body) in enumerate(messages):
+        by_source.setdefault(source, []).append((i, (phone, source, body)))
+    if not by_source:
+        return {}
+
+    interval = _interval()
+    now = _now()
+
+    # reserve slots for all of each source's messages at once; an idle
+    # source's bucket has expired, so its reservation starts now
+    sources = by_source.keys()
+    costs = [
+        sum(count_segments(body) for __, (__, __, body) in by_source[source])
+        * interval
+        for source in sources
+        ]
+    p = redis.client.pipeline()
+    for source, cost in zip(sources, costs):
+        key = make_schedule_key(source)
+        p.setnx(key, now)
+        p.incr(key, cost)
+    ends = p.execute()[1::2]
+
+    # let each bucket expire once its backlog is sent
+    p = redis.client.pipeline()
+    for source, end in zip(sources, ends):
+        p.expireat(make_schedule_key(source), int(end // 1000) + 1)
+    p.sadd(SOURCES_KEY, *sources)
+    p.execute()
+
+    result = {}
+    burst = settings.SMS_BURST * interval
+    max_delay = settings.SMS_MAX_DELAY_SECONDS
+    for source, cost, end in zip(sources, costs, ends):
+        slot = end - cost
+        for i, message in by_source[source]:
+            # a slot is only delayed once the SMS_BURST slots before it are
+            # taken
+            countdown = max(slot + interval - burst - now, 0) / 1000
+            if countdown > max_delay:
+                logger.warning(
+                    "SMS from %s delayed %.0fs; capped to %ss",
+                    source,
+                    countdown,
+                    max_delay,
+                    )
+                countdown = max_delay
+            if idempotency_key:
+                tasks.send_sms.apply_async(
+                    message,
+                    {IDEMPOTENCY_KEY_KWARG: '%s:%s' % (idempotency_key, i)},
+                    countdown=countdown,
+                    )
+            else:
+                tasks.send_sms.apply_async(message, countdown=countdown)
+            slot += count_segments(message[2]) * interval
+        backlog = result[source] = _backlog(end, now, interval)
+        logger.info(
+            "Scheduled %s SMS from %s; %s segments queued, done in %.0fs",
+            len(by_source[source]),
+            source,
+            backlog.queued,
+            backlog.completes_at - now / 1000,
+            )
+
+    return result
+
+
+
+def backlogs(sources=None):
+    """
+    Return dict mapping source numbers to their ``Backlog``.
+
+    If ``sources`` is not given, report all source numbers ever scheduled
+    from.
+
+    """
+    if sources is None:
+        sources = redis.client.smembers(SOURCES_KEY)
+    sources = list(sources)
+    p = redis.client.pipeline()
+    for source in sources:
+        p.get(make_schedule_key(source))
+    interval = _interval()
+    now = _now()
+    return dict(
+        (source, _backlog(int(end or 0), now, interval))
+        for source, end in zip(sources, p.execute())
+        )
+
+
+
+def _backlog(end, now, interval):
+    """Return ``Backlog`` given bucket end time, now, and slot interval."""
+    remaining = max(end - now, 0)
+    return Backlog(
+        queued=int(-(-remaining // interval)),
+        completes_at=max(end, now) / 1000,
+        )
+
+
+
+def _interval():
+    """Return milliseconds each text segment occupies its source number."""
+    return int(round(1000 / settings.SMS_RATE_PER_SECOND))
+
+
+
+def _now():
+    """Return current time in milliseconds."""
+    return int(time.time() * 1000)
+
+
+
+def make_schedule_key(source):
+    """Make Redis key for send schedule of given source number."""
+    return SCHEDULE_KEY_PATTERN % source
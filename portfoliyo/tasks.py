@@ -1,8 +1,12 @@
 """Celery tasks."""
 from __future__ import absolute_import
 
+import httplib
+import socket
+
 from celery.utils.log import get_task_logger
 
+from portfoliyo import clients
 from portfoliyo.celery import celery, ModelTask
 
 
@@ -11,27 +15,74 @@ logger = get_task_logger(__name__)
 
 # set ignore_result=True for tasks where we don't care about the return value
 # set acks_late=True for tasks that are better executed twice than not at all
+# set coalesce=True (and maybe merge_arg) for tasks that are safe to send only
+# once per transaction for identical (or mergeable) calls; see TransactionTask
+# set idempotent=True for tasks with side effects that must not be repeated
 
 
 
-@celery.task(ignore_result=True, acks_late=True)
+@celery.task(ignore_result=True, acks_late=True, idempotent=True)
 def send_sms(phone, source, body):
-    """Send an SMS message."""
+    """
+    Send an SMS message; retry with backoff if provider is unreachable.
+
+    Only retry if the request provably never reached the provider; after a
+    timeout or a failure reading the response, the text may have been sent,
+    and a retry could send it twice.
+
+    """
     from portfoliyo import sms
-    sms.send(phone, source, body)
+    try:
+        sms.send(
+            phone,
+            source,
+            body,
+            idempotency_key=send_sms.request.get('idempotency_key'),
+            )
+    except (socket.error, httplib.HTTPException) as e:
+        if not clients.never_reached_server(e):
+            logger.error(
+                "SMS to %s may or may not have been sent; not retrying: %r",
+                phone,
+                e,
+                )
+            raise
+        raise send_sms.retry_with_backoff(e)
+
+
+
+@celery.task(ignore_result=True, acks_late=True, idempotent=True)
+def send_sms_batch(messages):
+    """Schedule paced sending of (phone, source, body) SMS messages."""
+    from portfoliyo.sms import scheduler
+    scheduler.schedule(
+        messages,
+        idempotency_key=send_sms_batch.request.get('idempotency_key'),
+        )
+
+
+
+@celery.task(ignore_result=True, acks_late=True)
+def receive_sms(inbound_id):
+    """Process a stored received SMS and send any reply."""
+    from portfoliyo.sms import hook
+    hook.process_inbound(inbound_id)
 
 
 
 @celery.task(ignore_result=True)
 def check_for_pending_notifications():
     """Trigger notifications to all users with pending notifications."""
+    from django.conf import settings
     from portfoliyo.notifications import store
-    for profile_id in store.pending_profile_ids():
-        send_notification_email.delay(profile_id)
+    profile_ids = list(store.pending_profile_ids())
+    batch_size = settings.NOTIFICATION_BATCH_SIZE
+    for i in range(0, len(profile_ids), batch_size):
+        send_notification_emails.delay(profile_ids[i:i + batch_size])
 
 
 
-@celery.task(ignore_result=True)
+@celery.task(ignore_result=True, idempotent=True)
 def send_notification_email(profile_id):
     """Send notification email to the user with the given profile ID."""
     from portfoliyo.notifications import render
@@ -39,7 +90,24 @@ def send_notification_email(profile_id):
 
 
 
-@celery.task(base=ModelTask, ignore_result=True)
+@celery.task(ignore_result=True)
+def send_notification_emails(profile_ids):
+    """Send notification emails to users with the given profile IDs."""
+    from portfoliyo.notifications import render
+    render.send_many(profile_ids)
+
+
+
+@celery.task(
+    base=ModelTask,
+    ignore_result=True,
+    coalesce=True,
+    merge_arg={'posts_all': 1, 'village_additions': 3},
+    select_related={
+        'users.profile': ['user'],
+        'village.post': ['author'],
+        },
+    )
 def record_notification(name, *args, **kw):
     """Record a notification (to later be incorporated in an email)."""
     from portfoliyo.notifications import record
@@ -48,7 +116,19 @@ def record_notification(name, *args, **kw):
 
 
 
-@celery.task(ignore_result=True)
+@celery.task(
+    ignore_result=True,
+    coalesce=True,
+    idempotent=True,
+    merge_arg={
+        'posted_many': 1,
+        'student_added': 2,
+        'student_removed': 2,
+        'student_edited': 2,
+        'student_added_to_group': 2,
+        'student_removed_from_group': 2,
+        },
+    )
 def push_event(name, *args, **kw):
     """Send a Pusher event."""
     from portfoliyo.pusher import events
@@ -57,6 +137,22 @@ def push_event(name, *args, **kw):
 
 
 
+@celery.task(ignore_result=True)
+def probe_queues():
+    """Send a latency probe into every task queue."""
+    from portfoliyo import queues
+    queues.probe()
+
+
+
+@celery.task(ignore_result=True)
+def record_queue_latency(queue, sent_at):
+    """Record how long this probe (sent at ``sent_at``) waited in ``queue``."""
+    from portfoliyo import queues
+    queues.record(queue, sent_at)
+
+
+
 @celery.task(ignore_result=True)
 def mixpanel(func, *args, **kw):
     """Record something in Mixpanel."""
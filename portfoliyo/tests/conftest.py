@@ -244,7 +244,8 @@ def _celery_transaction_task_helper(request):
 
     So if a test is using the `db` fixture, we temporarily monkeypatch Celery
     to tell it to pretend there is no transaction in progress, so it will apply
-    the task immediately.
+    the task immediately. The same goes for deferred calls (see
+    ``portfoliyo.deferred``).
 
     This still allows us to have some tests use the `transactional_db` fixture
     instead (where tests are not run in a transaction, and the database is
@@ -253,9 +254,12 @@ def _celery_transaction_task_helper(request):
 
     """
     if 'db' in request.funcargnames:
-        from portfoliyo import celery
+        from portfoliyo import celery, deferred
         celery._original_in_transaction = celery._in_transaction
         celery._in_transaction = lambda: False
+        deferred._original_in_transaction = deferred.in_transaction
+        deferred.in_transaction = lambda: False
         def _restore():
             celery._in_transaction = celery._original_in_transaction
+            deferred.in_transaction = deferred._original_in_transaction
         request.addfinalizer(_restore)
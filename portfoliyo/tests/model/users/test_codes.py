@@ -0,0 +1,133 @@
+"""Tests for signup-code index."""
+import pytest
+
+from portfoliyo import xact
+from portfoliyo.model.users import codes
+
+from portfoliyo.tests import factories, utils
+
+
+
+@pytest.fixture
+def redis_codes(request, redis):
+    """Use the Redis code-index backend for the duration of the test."""
+    orig = codes.backend
+    codes.backend = codes.RedisCodes()
+    def _restore():
+        codes.backend = orig
+    request.addfinalizer(_restore)
+    return codes.backend
+
+
+
+class TestDatabaseCodes(object):
+    def test_lookup(self, db):
+        """Finds teacher, or group and its owner, by code."""
+        g = factories.GroupFactory.create(
+            code='ABCDEFG', owner__code='ABCDEF')
+        backend = codes.DatabaseCodes()
+
+        assert backend.lookup('ABCDEFG') == (g.owner, g)
+        assert backend.lookup('ABCDEF') == (g.owner, None)
+        assert backend.lookup('ACDC') == (None, None)
+
+
+
+class TestRedisCodes(object):
+    def test_lookup(self, db, redis_codes):
+        """Finds teacher, or group and its owner, by code."""
+        g = factories.GroupFactory.create(
+            code='ABCDEFG', owner__code='ABCDEF')
+
+        assert codes.lookup('ABCDEFG') == (g.owner, g)
+        assert codes.lookup('ABCDEF') == (g.owner, None)
+        assert codes.lookup('ACDC') == (None, None)
+
+
+    def test_indexed_on_save(self, db, redis_codes):
+        """Saved teachers and groups are indexed."""
+        redis_codes.rebuild()
+        g = factories.GroupFactory.create(
+            code='ABCDEFG', owner__code='ABCDEF')
+
+        assert redis_codes.lookup('ABCDEFG') == (g.owner, g)
+        assert redis_codes.lookup('ABCDEF') == (g.owner, None)
+
+
+    def test_unindexed_on_delete(self, db, redis, redis_codes):
+        """Deleted groups are removed from the index."""
+        g = factories.GroupFactory.create(code='ABCDEFG')
+        g.delete()
+
+        assert redis.hget(redis_codes.KEY, 'ABCDEFG') is None
+
+
+    def test_rebuild(self, db, redis, redis_codes):
+        """If the index is missing (e.g. Redis was flushed), it is rebuilt."""
+        g = factories.GroupFactory.create(
+            code='ABCDEFG', owner__code='ABCDEF')
+        redis.delete(redis_codes.KEY)
+
+        assert redis_codes.lookup('ABCDEF') == (g.owner, None)
+        assert redis.hgetall(redis_codes.KEY) == {
+            '': '1',
+            'ABCDEFG': 'group:%s' % g.id,
+            'ABCDEF': 'profile:%s' % g.owner.id,
+            }
+
+
+    def test_no_code_no_queries(self, db, redis, redis_codes):
+        """Looking up a word that isn't a code takes one Redis query only."""
+        redis_codes.rebuild()
+
+        with utils.assert_num_queries(0):
+            with utils.assert_num_calls(redis, 1):
+                assert redis_codes.lookup('HELLO') == (None, None)
+
+
+    def test_code_one_query(self, db, redis, redis_codes):
+        """Looking up a code takes one database query."""
+        g = factories.GroupFactory.create(code='ABCDEFG')
+        redis_codes.rebuild()
+
+        with utils.assert_num_queries(1):
+            assert redis_codes.lookup('ABCDEFG') == (g.owner, g)
+
+
+    def test_stale(self, db, redis, redis_codes):
+        """A stale entry is removed and the database consulted instead."""
+        t = factories.ProfileFactory.create(code='ABCDEF')
+        redis_codes.rebuild()
+        redis_codes.index('ABCDEF', 'group', 0)
+
+        assert redis_codes.lookup('ABCDEF') == (t, None)
+        assert redis.hget(redis_codes.KEY, 'ABCDEF') is None
+
+
+    def test_rolled_back_delete(self, transactional_db, redis, redis_codes):
+        """A code whose deletion is rolled back stays in the index."""
+        g = factories.GroupFactory.create(code='ABCDEFG')
+        group_id, owner = g.id, g.owner
+        redis_codes.rebuild()
+        class TestException(Exception):
+            pass
+        try:
+            with xact.xact():
+                g.delete()
+                assert redis.hget(redis_codes.KEY, 'ABCDEFG') is not None
+                raise TestException()
+        except TestException:
+            pass
+
+        teacher, group = redis_codes.lookup('ABCDEFG')
+        assert (teacher, group.id) == (owner, group_id)
+
+
+    def test_indexed_on_commit(self, transactional_db, redis, redis_codes):
+        """A code is indexed once its transaction commits."""
+        redis_codes.rebuild()
+        with xact.xact():
+            g = factories.GroupFactory.create(code='ABCDEFG')
+            assert redis.hget(redis_codes.KEY, 'ABCDEFG') is None
+
+        assert redis.hget(redis_codes.KEY, 'ABCDEFG') == 'group:%s' % g.id
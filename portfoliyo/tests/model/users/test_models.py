@@ -870,6 +870,26 @@ class TestContextualizedElders(object):
 
 
 
+class TestInboundSms(object):
+    def test_record(self, db):
+        """Stores a received SMS."""
+        inbound = model.InboundSms.record('SM1', '+13216540987', 'to', 'hi')
+
+        assert model.InboundSms.objects.get() == inbound
+        assert inbound.body == 'hi'
+        assert inbound.processed is None
+
+
+    def test_record_duplicate(self, db):
+        """Returns None for a duplicate MessageSid, storing nothing."""
+        model.InboundSms.record('SM1', '+13216540987', 'to', 'hi')
+        dupe = model.InboundSms.record('SM1', '+13216540987', 'to', 'hi')
+
+        assert dupe is None
+        assert model.InboundSms.objects.count() == 1
+
+
+
 class TestGenerateCode(object):
     def test_too_many_ambiguous(self):
         """If most of original code is bad chars, maintain min length."""
@@ -0,0 +1,150 @@
+"""Tests for cached inbound-SMS context."""
+import json
+
+from django.conf import settings
+import pytest
+
+from portfoliyo import xact
+from portfoliyo.model.users import sms_contexts
+
+from portfoliyo.tests import factories, utils
+
+
+
+@pytest.fixture
+def cached(monkeypatch, redis):
+    """Enable caching of SMS contexts for the duration of the test."""
+    monkeypatch.setattr(settings, 'SMS_CONTEXT_CACHE_SECONDS', 60)
+    return redis
+
+
+
+def test_uncached(db, monkeypatch):
+    """With caching disabled, loads context from the database."""
+    monkeypatch.setattr(settings, 'SMS_CONTEXT_CACHE_SECONDS', 0)
+    phone = '+13216430987'
+    rel = factories.RelationshipFactory.create(from_profile__phone=phone)
+    signup = factories.TextSignupFactory.create(family=rel.elder)
+
+    assert sms_contexts.load(phone) == (rel.elder, [rel.student], [signup])
+
+
+
+def test_unknown_phone(db, cached):
+    """Profile is None for unknown phone; nothing is cached."""
+    assert sms_contexts.load('+13216430987') == (None, [], [])
+    assert cached.get(sms_contexts.KEY_PATTERN % '+13216430987') is None
+
+
+
+class TestCached(object):
+    def test_cached(self, db, cached):
+        """Caches IDs of profile, students and active signups."""
+        phone = '+13216430987'
+        rel = factories.RelationshipFactory.create(from_profile__phone=phone)
+        signup = factories.TextSignupFactory.create(family=rel.elder)
+        factories.TextSignupFactory.create(family=rel.elder, state='done')
+
+        first = sms_contexts.load(phone)
+        with utils.assert_num_queries(2):
+            second = sms_contexts.load(phone)
+
+        assert first == second == (rel.elder, [rel.student], [signup])
+        assert json.loads(cached.get(sms_contexts.KEY_PATTERN % phone)) == {
+            'profile': rel.elder.id,
+            'students': [rel.student.id],
+            'signups': [signup.id],
+            }
+
+
+    def test_no_signups_one_query(self, db, cached):
+        """A cached profile without signups is loaded in a single query."""
+        phone = '+13216430987'
+        rel = factories.RelationshipFactory.create(from_profile__phone=phone)
+        sms_contexts.load(phone)
+
+        with utils.assert_num_queries(1):
+            profile, students, signups = sms_contexts.load(phone)
+
+        assert profile.user == rel.elder.user
+        assert (students, signups) == ([rel.student], [])
+
+
+    def test_students_ordered_by_name(self, db, cached):
+        """Cached students are ordered by name, like ``Profile.students``."""
+        phone = '+13216430987'
+        rel = factories.RelationshipFactory.create(
+            from_profile__phone=phone, to_profile__name='B')
+        rel2 = factories.RelationshipFactory.create(
+            from_profile=rel.elder, to_profile__name='A')
+        sms_contexts.load(phone)
+
+        assert sms_contexts.load(phone)[1] == [rel2.student, rel.student]
+
+
+    def test_invalidated_by_relationship(self, db, cached):
+        """Adding or removing a student invalidates the cached context."""
+        phone = '+13216430987'
+        rel = factories.RelationshipFactory.create(from_profile__phone=phone)
+        sms_contexts.load(phone)
+        rel2 = factories.RelationshipFactory.create(from_profile=rel.elder)
+
+        assert sms_contexts.load(phone)[1] == sorted(
+            [rel.student, rel2.student], key=lambda p: p.name)
+
+        rel.delete()
+
+        assert sms_contexts.load(phone)[1] == [rel2.student]
+
+
+    def test_invalidated_by_signup(self, db, cached):
+        """Starting or finishing a signup invalidates the cached context."""
+        phone = '+13216430987'
+        profile = factories.ProfileFactory.create(phone=phone)
+        sms_contexts.load(phone)
+        signup = factories.TextSignupFactory.create(family=profile)
+
+        assert sms_contexts.load(phone)[2] == [signup]
+
+        signup.state = 'done'
+        signup.save()
+
+        assert sms_contexts.load(phone)[2] == []
+
+
+    def test_invalidated_by_profile(self, db, cached):
+        """Changing a profile's phone invalidates its cached context."""
+        profile = factories.ProfileFactory.create(phone='+13216430987')
+        sms_contexts.load('+13216430987')
+        profile.phone = '+13216430988'
+        profile.save()
+
+        assert sms_contexts.load('+13216430987') == (None, [], [])
+        assert sms_contexts.load('+13216430988')[0] == profile
+
+
+    def test_stale(self, db, cached):
+        """A cached context that doesn't match the database is discarded."""
+        phone = '+13216430987'
+        profile = factories.ProfileFactory.create(phone=phone)
+        cached.setex(
+            sms_contexts.KEY_PATTERN % phone,
+            60,
+            json.dumps({'profile': 0, 'students': [], 'signups': []}),
+            )
+
+        assert sms_contexts.load(phone) == (profile, [], [])
+        assert cached.get(sms_contexts.KEY_PATTERN % phone) is None
+
+
+    def test_invalidated_on_commit(self, transactional_db, cached):
+        """A context re-cached before commit is invalidated on commit."""
+        phone = '+13216430987'
+        profile = factories.ProfileFactory.create(phone=phone)
+        sms_contexts.load(phone)
+        with xact.xact():
+            signup = factories.TextSignupFactory.create(family=profile)
+            # e.g. a concurrent inbound SMS, which can't see the signup yet
+            sms_contexts._store(phone, profile, [], [])
+
+        assert sms_contexts.load(phone)[2] == [signup]
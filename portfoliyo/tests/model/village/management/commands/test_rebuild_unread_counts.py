@@ -0,0 +1,28 @@
+from cStringIO import StringIO
+
+from django.core.management import call_command
+
+from portfoliyo.model import unread
+from portfoliyo.tests import factories as f
+
+
+
+def test_rebuilds_counts(db, redis):
+    rel = f.RelationshipFactory.create()
+    other_rel = f.RelationshipFactory.create()
+    post = f.PostFactory.create(student=rel.student)
+    other_post = f.PostFactory.create(student=other_rel.student)
+    unread.mark_unread(post, rel.elder)
+    unread.mark_unread(other_post, other_rel.elder)
+    redis.delete(unread.make_counts_key(rel.elder))
+    redis.delete(unread.make_counts_key(other_rel.elder))
+    mock_stdout = StringIO()
+
+    call_command(
+        'rebuild_unread_counts', str(rel.elder.id), stdout=mock_stdout)
+
+    assert unread.unread_counts_by_student_id(rel.elder) == {rel.student.id: 1}
+    # only rebuilds for given profiles
+    assert unread.unread_counts_by_student_id(other_rel.elder) == {}
+    mock_stdout.seek(0)
+    assert mock_stdout.read() == "Rebuilt unread counts for 1 profiles.\n"
@@ -96,7 +96,7 @@ class TestPostCreate(object):
         rel = factories.RelationshipFactory.create(
             from_profile__school_staff=True)
 
-        target = 'portfoliyo.pusher.events.trigger'
+        target = 'portfoliyo.pusher.events.trigger_many'
         with mock.patch(target) as mock_trigger:
             post = models.Post.create(
                 rel.elder, rel.student, 'Foo\n', sequence_id='33')
@@ -104,7 +104,7 @@ class TestPostCreate(object):
         args = mock_trigger.call_args[0]
         post_data = args[2]['objects'][0]
 
-        assert args[0] == 'user_%s' % rel.from_profile_id
+        assert args[0] == ['user_%s' % rel.from_profile_id]
         assert args[1] == 'message_posted'
         assert post_data['author_sequence_id'] == '33'
         assert post_data['author_id'] == rel.from_profile_id
@@ -128,7 +128,7 @@ class TestPostCreate(object):
             description="Father",
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             post = models.Post.create(
                 rel1.elder,
@@ -138,7 +138,7 @@ class TestPostCreate(object):
                 )
 
         mock_send_sms.assert_called_with(
-            "+13216540987", "+13336660000", "Hey dad --John Doe")
+            [("+13216540987", "+13336660000", "Hey dad --John Doe")])
         assert post.to_sms == True
         assert post.meta['sms'] == [
             {
@@ -146,6 +146,7 @@ class TestPostCreate(object):
                 'role': "Father",
                 'name': "Jim Smith",
                 'phone': "+13216540987",
+                'segments': 1,
                 }
             ]
 
@@ -165,7 +166,7 @@ class TestPostCreate(object):
             description="Father",
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             post = models.Post.create(
                 rel1.elder,
@@ -193,7 +194,7 @@ class TestPostCreate(object):
             description="Father",
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             post = models.Post.create(
                 rel1.elder,
@@ -203,7 +204,7 @@ class TestPostCreate(object):
                 )
 
         mock_send_sms.assert_called_with(
-            "+13216540987", "+13336660000", "Hey dad --John Doe")
+            [("+13216540987", "+13336660000", "Hey dad --John Doe")])
         assert post.to_sms == True
         assert post.meta['sms'] == [
             {
@@ -211,6 +212,7 @@ class TestPostCreate(object):
                 'role': "Father",
                 'name': "Jim Smith",
                 'phone': "+13216540987",
+                'segments': 1,
                 }
             ]
 
@@ -234,7 +236,7 @@ class TestPostCreate(object):
             state='kidname',
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             models.Post.create(
                 rel1.elder,
@@ -244,7 +246,7 @@ class TestPostCreate(object):
                 )
 
         mock_send_sms.assert_called_with(
-            "+13216540987", "+1333666000", "Hey dad --John Doe")
+            [("+13216540987", "+1333666000", "Hey dad --John Doe")])
         assert utils.refresh(signup).state == 'done'
 
 
@@ -259,7 +261,7 @@ class TestPostCreate(object):
             from_profile__user__is_active=False,
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             post = models.Post.create(
                 rel1.elder,
@@ -283,7 +285,7 @@ class TestPostCreate(object):
             from_profile__user__is_active=True,
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             post = models.Post.create(
                 rel1.elder,
@@ -305,7 +307,7 @@ class TestPostCreate(object):
             description="Father",
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             post = models.Post.create(
                 None,
@@ -436,6 +438,139 @@ class TestPostCreate(object):
 
 
 
+class TestPostCreateMany(object):
+    def test_creates_posts(self, db):
+        """Creates and returns a Post in each student's village."""
+        rel = factories.RelationshipFactory.create()
+        rel2 = factories.RelationshipFactory.create(from_profile=rel.elder)
+
+        posts = models.Post.create_many(
+            rel.elder, [rel.student, rel2.student], 'Foo\n', from_sms=True)
+
+        assert set(p.id for p in posts) == set(
+            models.Post.objects.values_list('id', flat=True))
+        for post, r in zip(posts, [rel, rel2]):
+            post = utils.refresh(post)
+            assert post.author == rel.elder
+            assert post.student == r.student
+            assert post.relationship == r
+            assert post.html_text == 'Foo<br>'
+            assert post.from_sms == True
+            assert post.to_sms == False
+            assert post.meta == {'sms': []}
+        assert utils.refresh(rel.elder).has_posted
+
+
+    def test_no_students(self, db):
+        """Creating posts in no villages does nothing."""
+        rel = factories.RelationshipFactory.create()
+
+        with utils.assert_num_queries(0):
+            assert models.Post.create_many(rel.elder, [], 'Foo') == []
+
+
+    def test_batched_fanout(self, db, redis):
+        """Posts marked unread in one Redis transaction, pushed in one task."""
+        rel = factories.RelationshipFactory.create()
+        others = []
+        for i in range(3):
+            other = factories.RelationshipFactory.create(
+                from_profile__user__email='foo%s@example.com' % i)
+            factories.RelationshipFactory.create(
+                from_profile=rel.elder, to_profile=other.student)
+            others.append(other)
+        students = [o.student for o in others]
+
+        target = 'portfoliyo.model.village.models.tasks'
+        with mock.patch(target) as mock_tasks:
+            with utils.assert_num_calls(redis, 1):
+                posts = models.Post.create_many(rel.elder, students, 'Foo')
+
+        mock_tasks.push_event.delay.assert_called_once_with(
+            'posted_many', [p.id for p in posts])
+        mock_tasks.record_notification.delay.assert_called_once_with(
+            'posts_all', posts)
+        for post, other in zip(posts, others):
+            assert unread.is_unread(post, other.elder)
+            assert not unread.is_unread(post, rel.elder)
+
+
+    def test_triggers_pusher_events(self, db):
+        """Triggers a pusher event for each post."""
+        rel = factories.RelationshipFactory.create(
+            from_profile__school_staff=True)
+        rel2 = factories.RelationshipFactory.create(from_profile=rel.elder)
+
+        target = 'portfoliyo.pusher.events.trigger_many'
+        with mock.patch(target) as mock_trigger:
+            posts = models.Post.create_many(
+                rel.elder, [rel.student, rel2.student], 'Foo')
+
+        urls = [
+            call[0][2]['objects'][0]['mark_read_url']
+            for call in mock_trigger.call_args_list
+            ]
+        assert urls == [
+            reverse('mark_post_read', kwargs={'post_id': p.id})
+            for p in sorted(posts, key=lambda p: p.id)
+            ]
+
+
+    def test_autoreply(self, db):
+        """Auto-reply records SMS to replied-to phone, but sends none."""
+        rel = factories.RelationshipFactory.create(
+            from_profile__phone="+13216540987",
+            from_profile__user__is_active=True,
+            description="Father",
+            )
+        rel2 = factories.RelationshipFactory.create(
+            from_profile=rel.elder, description="Uncle")
+
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
+        with mock.patch(target) as mock_send_sms:
+            posts = models.Post.create_many(
+                None,
+                [rel.student, rel2.student],
+                'Thank you!',
+                in_reply_to="+13216540987",
+                )
+
+        assert mock_send_sms.call_count == 0
+        assert [p.meta['sms'][0]['role'] for p in posts] == [
+            "Father", "Uncle"]
+        assert [p.meta['sms'][0]['id'] for p in posts] == [rel.elder.id] * 2
+        assert all(p.to_sms for p in posts)
+
+
+    def test_records_notifications(self, db):
+        """Records notification for users in villages, but not author."""
+        rel1 = factories.RelationshipFactory.create()
+        rel2 = factories.RelationshipFactory.create(
+            to_profile=rel1.student)
+
+        target = 'portfoliyo.notifications.record.post'
+        with mock.patch(target) as mock_notify_post:
+            posts = models.Post.create_many(
+                rel1.elder, [rel1.student], "Hello")
+
+        mock_notify_post.assert_called_once_with(rel2.elder, posts[0])
+
+
+    def test_can_prevent_notification(self, db):
+        """No notification if pass notifications=False."""
+        rel1 = factories.RelationshipFactory.create()
+        factories.RelationshipFactory.create(
+            to_profile=rel1.student)
+
+        target = 'portfoliyo.notifications.record.post'
+        with mock.patch(target) as mock_notify_post:
+            models.Post.create_many(
+                rel1.elder, [rel1.student], "Hello", notifications=False)
+
+        assert mock_notify_post.call_count == 0
+
+
+
 class TestBulkPost(object):
     def test_create(self, db):
         """Creates a bulk post and posts in individual villages."""
@@ -466,7 +601,7 @@ class TestBulkPost(object):
         rel = factories.RelationshipFactory.create(
             from_profile__school_staff=True)
 
-        target = 'portfoliyo.pusher.events.trigger'
+        target = 'portfoliyo.pusher.events.trigger_many'
         with mock.patch(target) as mock_trigger:
             models.BulkPost.create(rel.elder, None, 'Foo\n', sequence_id='33')
 
@@ -475,8 +610,8 @@ class TestBulkPost(object):
         group_args = mock_trigger.call_args_list[1][0]
         group_post_data = group_args[2]['objects'][0]
 
-        assert student_args[0] == 'user_%s' % rel.from_profile_id
-        assert group_args[0] == 'user_%s' % rel.from_profile_id
+        assert student_args[0] == ['user_%s' % rel.from_profile_id]
+        assert group_args[0] == ['user_%s' % rel.from_profile_id]
         assert student_args[1] == group_args[1] == 'message_posted'
         assert student_post_data['author_sequence_id'] == '33'
         assert student_post_data['author_id'] == rel.from_profile_id
@@ -507,6 +642,35 @@ class TestBulkPost(object):
         assert not unread.is_unread(sub, rel3.elder)
 
 
+    def test_batched_fanout(self, db, redis):
+        """Sub-posts marked unread in one Redis transaction and one task."""
+        rel = factories.RelationshipFactory.create(
+            from_profile__user__email='foo@example.com')
+        group = factories.GroupFactory.create(owner=rel.elder)
+        group.students.add(rel.student)
+        others = []
+        for i in range(3):
+            other = factories.RelationshipFactory.create(
+                from_profile__user__email='foo%s@example.com' % i)
+            factories.RelationshipFactory.create(
+                from_profile=rel.elder, to_profile=other.student)
+            group.students.add(other.student)
+            others.append(other)
+
+        target = 'portfoliyo.model.village.models.tasks'
+        with mock.patch(target) as mock_tasks:
+            with utils.assert_num_calls(redis, 1):
+                post = models.BulkPost.create(rel.elder, group, 'Foo')
+
+        mock_tasks.push_event.delay.assert_called_once_with(
+            'bulk_posted_all', post.id, author_sequence_id=None)
+        assert post.triggered.count() == 4
+        for other in others:
+            sub = post.triggered.get(student=other.student)
+            assert unread.is_unread(sub, other.elder)
+            assert not unread.is_unread(sub, rel.elder)
+
+
     def test_all_students(self, db):
         """group=None sends to all author's students."""
         rel = factories.RelationshipFactory.create()
@@ -544,13 +708,13 @@ class TestBulkPost(object):
         group = factories.GroupFactory.create()
         group.students.add(rel1.student)
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             post = models.BulkPost.create(
                 rel1.elder, group, 'Hey dad', profile_ids=[rel2.elder.id])
 
         mock_send_sms.assert_called_with(
-            "+13216540987", "+13336660000", "Hey dad --John Doe")
+            [("+13216540987", "+13336660000", "Hey dad --John Doe")])
         assert post.to_sms == True
         assert post.meta['sms'] == [
             {
@@ -558,6 +722,7 @@ class TestBulkPost(object):
                 'name': 'Jim Smith',
                 'role': 'Father',
                 'phone': "+13216540987",
+                'segments': 1,
                 }
             ]
 
@@ -579,13 +744,13 @@ class TestBulkPost(object):
         group = factories.GroupFactory.create()
         group.students.add(rel1.student)
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             post = models.BulkPost.create(
                 rel1.elder, group, 'Hey dad', profile_ids='all')
 
         mock_send_sms.assert_called_with(
-            "+13216540987", "+13336660000", "Hey dad --John Doe")
+            [("+13216540987", "+13336660000", "Hey dad --John Doe")])
         assert post.to_sms == True
         assert post.meta['sms'] == [
             {
@@ -593,6 +758,7 @@ class TestBulkPost(object):
                 'name': 'Jim Smith',
                 'role': 'Father',
                 'phone': "+13216540987",
+                'segments': 1,
                 }
             ]
 
@@ -659,3 +825,35 @@ def test_post_char_limit(mock_sms_suffix):
     rel = mock.Mock()
 
     assert models.post_char_limit(rel) == 150
+
+
+
+@mock.patch('portfoliyo.model.village.models.sms_suffix')
+def test_post_char_limit_unicode(mock_sms_suffix):
+    """Char limit for a post requiring UCS-2 is 70 - length of suffix."""
+    mock_sms_suffix.return_value = "a" * 10
+    rel = mock.Mock()
+
+    assert models.post_char_limit(rel, u'\xbfQu\xe9 t\xfa?') == 60
+    assert models.post_char_limit(rel, encoding='UCS-2') == 60
+
+
+
+@mock.patch('portfoliyo.model.village.models.sms_suffix')
+def test_post_char_limit_unicode_suffix(mock_sms_suffix):
+    """If the suffix requires UCS-2, so does every post."""
+    mock_sms_suffix.return_value = u" --Sra. N\xfa\xf1ez"
+    rel = mock.Mock()
+
+    assert models.post_char_limit(rel, u'Hola') == 57
+
+
+
+@mock.patch('portfoliyo.model.village.models.sms_suffix')
+def test_post_length(mock_sms_suffix):
+    """GSM-7 extension characters count double in post length."""
+    mock_sms_suffix.return_value = "a" * 10
+    rel = mock.Mock()
+
+    assert models.post_length(rel, u'[1]') == 5
+    assert models.post_length(rel, u'[t\xfa]') == 4
@@ -1,7 +1,10 @@
 """Tests for unread-counts management."""
+import mock
+import pytest
+
 from portfoliyo.model import unread
 
-from portfoliyo.tests import factories
+from portfoliyo.tests import factories, utils
 
 
 
@@ -36,6 +39,74 @@ def test_all_unread(db, redis):
 
 
 
+def test_mark_unread_for_profiles(db, redis):
+    """Can mark a post unread by many profiles in one Redis call."""
+    post = factories.PostFactory.create()
+    profile1 = factories.ProfileFactory.create()
+    profile2 = factories.ProfileFactory.create()
+
+    # marks and updates counts in a single script call
+    with utils.assert_num_calls(redis, 1):
+        unread.mark_unread_for_profiles(post, [profile1, profile2])
+
+    assert unread.is_unread(post, profile1)
+    assert unread.is_unread(post, profile2)
+
+
+
+def test_mark_many_unread(db, redis):
+    """Can mark many posts unread by many profiles in one Redis call."""
+    post1 = factories.PostFactory.create()
+    post2 = factories.PostFactory.create()
+    profile1 = factories.ProfileFactory.create()
+    profile2 = factories.ProfileFactory.create()
+
+    with utils.assert_num_calls(redis, 1):
+        unread.mark_many_unread({post1: [profile1, profile2], post2: []})
+
+    assert unread.is_unread(post1, profile1)
+    assert unread.is_unread(post1, profile2)
+    assert not unread.is_unread(post2, profile1)
+
+
+
+def test_mark_unread_twice(db, redis):
+    """Marking an already-unread post unread doesn't change counts."""
+    post = factories.PostFactory.create()
+    profile = factories.ProfileFactory.create()
+
+    unread.mark_unread(post, profile)
+    unread.mark_many_unread({post: [profile]})
+
+    assert unread.unread_count(post.student, profile) == 1
+    assert unread.total_unread_count(profile) == 1
+
+
+
+def test_mark_read_atomic(db, redis):
+    """If counts can't be updated, unread state isn't changed either."""
+    post = factories.PostFactory.create()
+    profile = factories.ProfileFactory.create()
+    unread.mark_unread(post, profile)
+
+    target = 'portfoliyo.model.village.unread._queue_count_changes'
+    with mock.patch(target) as mock_queue:
+        mock_queue.side_effect = ValueError()
+        with pytest.raises(ValueError):
+            unread.mark_read(post, profile)
+
+    assert unread.is_unread(post, profile)
+    assert unread.unread_count(post.student, profile) == 1
+
+
+
+def test_mark_many_unread_nothing_to_do(redis):
+    """If there are no profiles to mark, Redis isn't touched."""
+    with utils.assert_num_calls(redis, 0):
+        unread.mark_many_unread({})
+
+
+
 def test_mark_read(db, redis):
     """Can mark a post as read."""
     post = factories.PostFactory.create()
@@ -48,6 +119,24 @@ def test_mark_read(db, redis):
 
 
 
+def test_mark_many_read(db, redis):
+    """Can mark many posts read by a profile in three Redis calls."""
+    post1 = factories.PostFactory.create()
+    post2 = factories.PostFactory.create()
+    post3 = factories.PostFactory.create(student=post1.student)
+    profile = factories.ProfileFactory.create()
+    unread.mark_many_unread(
+        {post1: [profile], post2: [profile], post3: [profile]})
+
+    with utils.assert_num_calls(redis, 3):
+        unread.mark_many_read([post1, post2], profile)
+
+    assert not unread.is_unread(post1, profile)
+    assert not unread.is_unread(post2, profile)
+    assert unread.is_unread(post3, profile)
+
+
+
 def test_mark_village_read(db, redis):
     """Marks posts only in given village read."""
     post1 = factories.PostFactory.create()
@@ -135,3 +224,64 @@ def test_group_unread_counts(db, redis):
 
     assert unread.group_unread_counts([groupa, groupb], profile) == {
         groupa: 2, groupb: 3}
+
+
+
+def test_counts_maintained(db, redis):
+    """Unread counts are kept up to date as posts are marked read/unread."""
+    post1 = factories.PostFactory.create()
+    post2 = factories.PostFactory.create(student=post1.student)
+    post3 = factories.PostFactory.create()
+    profile = factories.ProfileFactory.create()
+    unread.mark_many_unread(
+        {post1: [profile], post2: [profile], post3: [profile]})
+    # marking an already-unread post again doesn't double-count
+    unread.mark_unread(post1, profile)
+    unread.mark_read(post3, profile)
+    # marking an already-read post read again doesn't double-count
+    unread.mark_read(post3, profile)
+
+    assert unread.unread_counts_by_student_id(profile) == {
+        post1.student.id: 2, post3.student.id: 0}
+    assert unread.total_unread_count(profile) == 2
+
+    unread.mark_village_read(post1.student, profile)
+
+    assert unread.unread_count(post1.student, profile) == 0
+    assert unread.total_unread_count(profile) == 0
+
+
+
+def test_unread_counts_single_call(db, redis):
+    """All of a profile's unread counts are fetched in one Redis call."""
+    post1 = factories.PostFactory.create()
+    post2 = factories.PostFactory.create()
+    profile = factories.ProfileFactory.create()
+    unread.mark_unread(post1, profile)
+    unread.mark_unread(post2, profile)
+
+    with utils.assert_num_calls(redis, 1):
+        counts = unread.unread_counts([post1.student, post2.student], profile)
+
+    assert counts == {post1.student: 1, post2.student: 1}
+
+
+
+def test_rebuild_counts(db, redis):
+    """Counts can be recomputed from the underlying unread sets."""
+    post1 = factories.PostFactory.create()
+    post2 = factories.PostFactory.create(student=post1.student)
+    post3 = factories.PostFactory.create()
+    profile = factories.ProfileFactory.create()
+    unread.mark_many_unread(
+        {post1: [profile], post2: [profile], post3: [profile]})
+    redis.delete(unread.make_counts_key(profile))
+    redis.hincrby(unread.make_counts_key(profile), 'total', 7)
+
+    total = unread.rebuild_counts(
+        profile.id, [post1.student.id, post3.student.id])
+
+    assert total == 3
+    assert unread.unread_counts_by_student_id(profile) == {
+        post1.student.id: 2, post3.student.id: 1}
+    assert unread.total_unread_count(profile) == 3
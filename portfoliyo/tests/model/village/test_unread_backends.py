@@ -0,0 +1,152 @@
+"""Tests for unread-storage backends."""
+import pytest
+
+from portfoliyo.model.village import unread, unread_backends
+
+from portfoliyo.tests import factories
+
+
+
+@pytest.fixture
+def watermarks(request, redis):
+    """Use the watermark unread backend for the duration of the test."""
+    orig_backend = unread.backend
+    unread.backend = unread_backends.WatermarkBackend()
+    def _restore():
+        unread.backend = orig_backend
+    request.addfinalizer(_restore)
+    return unread.backend
+
+
+
+class TestWatermarkBackend(object):
+    def test_unread(self, db, watermarks):
+        """A post marked unread is unread; earlier posts are read."""
+        post1 = factories.PostFactory.create()
+        post2 = factories.PostFactory.create(student=post1.student)
+        profile = factories.ProfileFactory.create()
+
+        unread.mark_unread(post2, profile)
+
+        assert not unread.is_unread(post1, profile)
+        assert unread.is_unread(post2, profile)
+        assert unread.all_unread(post1.student, profile) == {str(post2.id)}
+        assert unread.unread_count(post1.student, profile) == 1
+
+
+    def test_mark_unread_twice(self, db, watermarks):
+        """Marking an already-unread post unread doesn't change counts."""
+        post1 = factories.PostFactory.create()
+        post2 = factories.PostFactory.create(student=post1.student)
+        profile = factories.ProfileFactory.create()
+        unread.mark_many_unread({post1: [profile], post2: [profile]})
+
+        unread.mark_unread(post1, profile)
+        unread.mark_many_unread({post1: [profile], post2: [profile]})
+
+        assert unread.unread_count(post1.student, profile) == 2
+        assert unread.total_unread_count(profile) == 2
+
+
+    def test_mark_read_then_unread(self, db, watermarks):
+        """A post marked read and then unread again is counted again."""
+        post1 = factories.PostFactory.create()
+        post2 = factories.PostFactory.create(student=post1.student)
+        profile = factories.ProfileFactory.create()
+        unread.mark_many_unread({post1: [profile], post2: [profile]})
+        unread.mark_read(post1, profile)
+
+        unread.mark_unread(post1, profile)
+
+        assert unread.is_unread(post1, profile)
+        assert unread.unread_count(post1.student, profile) == 2
+
+
+    def test_own_posts_read(self, db, watermarks):
+        """Posts by the profile itself after the watermark are not unread."""
+        profile = factories.ProfileFactory.create()
+        post1 = factories.PostFactory.create()
+        own = factories.PostFactory.create(
+            student=post1.student, author=profile)
+        unread.mark_unread(post1, profile)
+
+        assert not unread.is_unread(own, profile)
+        assert unread.all_unread(post1.student, profile) == {str(post1.id)}
+
+
+    def test_mark_read(self, db, watermarks):
+        """Individually-read posts above the watermark are read."""
+        post1 = factories.PostFactory.create()
+        post2 = factories.PostFactory.create(student=post1.student)
+        profile = factories.ProfileFactory.create()
+        unread.mark_many_unread({post1: [profile], post2: [profile]})
+
+        unread.mark_read(post1, profile)
+        # already read; doesn't change count
+        unread.mark_read(post1, profile)
+
+        assert not unread.is_unread(post1, profile)
+        assert unread.is_unread(post2, profile)
+        assert unread.unread_count(post1.student, profile) == 1
+
+
+    def test_mark_village_read(self, db, watermarks):
+        """Marking a village read moves the watermark to its latest post."""
+        post1 = factories.PostFactory.create()
+        post2 = factories.PostFactory.create(student=post1.student)
+        other = factories.PostFactory.create()
+        profile = factories.ProfileFactory.create()
+        unread.mark_many_unread(
+            {post1: [profile], post2: [profile], other: [profile]})
+        unread.mark_read(post1, profile)
+
+        unread.mark_village_read(post1.student, profile)
+
+        assert unread.all_unread(post1.student, profile) == set()
+        assert unread.unread_count(post1.student, profile) == 0
+        assert unread.is_unread(other, profile)
+        assert unread.total_unread_count(profile) == 1
+
+
+    def test_rebuild_counts(self, db, watermarks):
+        """Counts can be recomputed from watermarks and exceptions."""
+        post1 = factories.PostFactory.create()
+        post2 = factories.PostFactory.create(student=post1.student)
+        post3 = factories.PostFactory.create(student=post1.student)
+        other = factories.PostFactory.create()
+        profile = factories.ProfileFactory.create()
+        unread.mark_many_unread(
+            {post1: [profile], post2: [profile], post3: [profile]})
+        unread.mark_read(post2, profile)
+
+        total = unread.rebuild_counts(
+            profile.id, [post1.student.id, other.student.id])
+
+        assert total == 2
+        assert unread.unread_counts_by_student_id(profile) == {
+            post1.student.id: 2}
+
+
+    def test_migrate_from_sets(self, db, redis):
+        """Converts an unread set into a watermark plus exceptions."""
+        profile = factories.ProfileFactory.create()
+        post1 = factories.PostFactory.create()
+        post2 = factories.PostFactory.create(student=post1.student)
+        post3 = factories.PostFactory.create(student=post1.student)
+        own = factories.PostFactory.create(
+            student=post1.student, author=profile)
+        post4 = factories.PostFactory.create(student=post1.student)
+        unread.mark_many_unread({post2: [profile], post4: [profile]})
+        backend = unread_backends.WatermarkBackend()
+
+        num = backend.migrate_from_sets(profile.id, post1.student.id)
+
+        assert num == 2
+        assert redis.smembers(
+            unread_backends.SetBackend.KEY_PATTERN % (
+                profile.id, post1.student.id)) == set()
+        assert backend.all_unread(post1.student, profile) == {
+            str(post2.id), str(post4.id)}
+        assert not backend.is_unread(post1, profile)
+        assert not backend.is_unread(post3, profile)
+        assert not backend.is_unread(own, profile)
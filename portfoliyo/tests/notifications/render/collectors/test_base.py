@@ -1,6 +1,8 @@
 """Tests for base NotificationTypeCollector."""
 import mock
+import pytest
 
+from portfoliyo import model
 from portfoliyo.notifications.render.collectors import base
 
 
@@ -9,3 +11,15 @@ def test_default_context_empty():
     ntc = base.NotificationTypeCollector(mock.Mock())
 
     assert ntc.get_context() == {}
+
+
+
+def test_get_object_prefetched():
+    """Uses prefetched objects without querying."""
+    profile = mock.Mock()
+    ntc = base.NotificationTypeCollector(
+        mock.Mock(), {model.Profile: {'2': profile, '3': None}})
+
+    assert ntc.get_object(model.Profile, 2) is profile
+    with pytest.raises(model.Profile.DoesNotExist):
+        ntc.get_object(model.Profile, '3')
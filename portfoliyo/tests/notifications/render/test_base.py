@@ -1,5 +1,6 @@
 """Integration tests for email-sending."""
 from datetime import datetime, timedelta
+import time
 
 from django.conf import settings
 from django.core import mail
@@ -9,9 +10,9 @@ from django.utils import timezone
 import mock
 import pytest
 
-from portfoliyo.notifications import record
+from portfoliyo.notifications import record, store
 from portfoliyo.notifications.render import base
-from portfoliyo.tests import factories
+from portfoliyo.tests import factories, utils
 
 
 
@@ -39,16 +40,12 @@ def recip(request, db, redis):
     patcher.start()
     request.addfinalizer(patcher.stop)
 
-    # Temporarily patch premailer to be a no-op; our tests assert against the
-    # HTML that's in the templates, not as mangled by premailer.
-    class mock_Premailer(object):
-        def __init__(self, html, **kw):
-            self.html = html
-
-        def transform(self):
-            return self.html
-
-    patcher2 = mock.patch('premailer.Premailer', mock_Premailer)
+    # Temporarily patch CSS inlining to be a no-op; our tests assert against
+    # the HTML that's in the templates, not as mangled by premailer.
+    patcher2 = mock.patch(
+        'portfoliyo.notifications.render.inline.inline_css',
+        lambda html, **kw: html,
+        )
     patcher2.start()
     request.addfinalizer(patcher2.stop)
 
@@ -77,6 +74,132 @@ class TestSend(object):
         assert not base.send(p.id)
 
 
+    def test_send_many(self, recip):
+        """Sends emails to all given profiles with notifications."""
+        other = factories.ProfileFactory.create(
+            user__email='bar@example.com', user__is_active=True)
+        nothing = factories.ProfileFactory.create(
+            user__email='baz@example.com', user__is_active=True)
+        rel = factories.RelationshipFactory.create(from_profile=recip)
+        other_rel = factories.RelationshipFactory.create(from_profile=other)
+        record.added_to_village(recip, rel.elder, rel.student)
+        record.added_to_village(other, other_rel.elder, other_rel.student)
+
+        assert base.send_many([recip.id, other.id, nothing.id]) == (2, 0)
+        assert set(m.to[0] for m in mail.outbox) == {
+            'foo@example.com', 'bar@example.com'}
+
+
+    def test_send_many_render_failure(self, recip):
+        """A failure rendering one email is counted and logged."""
+        rel = factories.RelationshipFactory.create(from_profile=recip)
+        record.added_to_village(recip, rel.elder, rel.student)
+
+        with mock.patch('portfoliyo.notifications.render.base.render') as m:
+            m.side_effect = ValueError()
+            with mock.patch(
+                    'portfoliyo.notifications.render.base.logger') as logger:
+                assert base.send_many([recip.id]) == (0, 1)
+
+        assert logger.exception.call_count == 1
+        assert len(mail.outbox) == 0
+
+
+    def test_send_many_send_failure(self, recip):
+        """Notifications of an email that failed to send are not cleared."""
+        other = factories.ProfileFactory.create(
+            user__email='bar@example.com', user__is_active=True)
+        rel = factories.RelationshipFactory.create(from_profile=recip)
+        other_rel = factories.RelationshipFactory.create(from_profile=other)
+        record.added_to_village(recip, rel.elder, rel.student)
+        record.added_to_village(other, other_rel.elder, other_rel.student)
+
+        def _send_first(messages, fail_silently):
+            return messages[:1]
+
+        target = 'portfoliyo.notifications.render.base.email.send_messages'
+        with mock.patch(target, _send_first):
+            assert base.send_many([recip.id, other.id]) == (1, 1)
+
+        pending = [
+            p for p in [recip, other] if list(store.get_all(p.id))]
+        assert len(pending) == 1
+
+
+    def test_send_many_notification_meanwhile(self, recip):
+        """A notification arriving while the email is sent gets an email."""
+        from portfoliyo import tasks
+        recip.notification_delay = 60
+        recip.save()
+        rel = factories.RelationshipFactory.create(from_profile=recip)
+        record.added_to_village(recip, rel.elder, rel.student)
+        later = time.time() + 5
+
+        def _record_and_send(messages, fail_silently):
+            target = 'portfoliyo.notifications.store.time.time'
+            with mock.patch(target, return_value=later):
+                record.added_to_village(recip, rel.elder, rel.student)
+            # the email is already scheduled, so no new one is
+            assert not tasks.send_notification_email.apply_async.call_count
+            return messages
+
+        tasks.send_notification_email.reset_mock()
+        target = 'portfoliyo.notifications.render.base.email.send_messages'
+        with mock.patch(target, _record_and_send):
+            assert base.send_many([recip.id]) == (1, 0)
+
+        assert len(list(store.get_all(recip.id))) == 1
+        assert store.pending_profile_ids() == {str(recip.id)}
+        tasks.send_notification_email.apply_async.assert_called_once_with(
+            (recip.id,), countdown=60)
+
+
+    def test_send_many_no_connection(self, recip):
+        """If no email could be sent, no notifications are cleared."""
+        rel = factories.RelationshipFactory.create(from_profile=recip)
+        record.added_to_village(recip, rel.elder, rel.student)
+
+        target = 'portfoliyo.notifications.render.base.email.send_messages'
+        with mock.patch(target) as mock_send_messages:
+            mock_send_messages.return_value = []
+            assert base.send_many([recip.id]) == (0, 1)
+
+        assert len(list(store.get_all(recip.id))) == 1
+
+
+    def test_query_budget(self, recip):
+        """Number of queries to render doesn't depend on number of villages."""
+        def num_render_queries(num_villages):
+            teacher = factories.ProfileFactory.create(school_staff=True)
+            bulk_post = factories.BulkPostFactory.create(author=teacher)
+            for i in range(num_villages):
+                rel = factories.RelationshipFactory.create(from_profile=recip)
+                parent_rel = factories.RelationshipFactory.create(
+                    to_profile=rel.student)
+                post = factories.PostFactory.create(
+                    author=parent_rel.elder,
+                    student=rel.student,
+                    relationship=parent_rel,
+                    )
+                factories.PostFactory.create(
+                    author=teacher, student=rel.student, from_bulk=bulk_post)
+                signup = factories.TextSignupFactory.create(
+                    family=parent_rel.elder,
+                    student=rel.student,
+                    teacher=teacher,
+                    )
+                record.post(recip, post)
+                record.new_parent(recip, signup)
+                record.added_to_village(recip, teacher, rel.student)
+            record.bulk_post(recip, bulk_post)
+
+            with utils.count_queries() as counter:
+                base.render(recip)
+            return counter.num
+
+        assert num_render_queries(2) == num_render_queries(5)
+
+
     def test_generic_subject_single_student(self, recip):
         """Generic subject if multiple notification types, single student."""
         rel = factories.RelationshipFactory.create(
@@ -4,6 +4,7 @@ import mock
 
 from portfoliyo.notifications import types
 from portfoliyo.notifications.render import collect
+from portfoliyo.tests import factories, utils
 
 
 @contextlib.contextmanager
@@ -29,6 +30,26 @@ class TestNotificationCollection(object):
             "Unknown notification type '%s'", 'foo')
 
 
+    def test_switch_to_invalid_type(self):
+        """A switch to an invalid notification type is logged and ignored."""
+        logger = 'portfoliyo.notifications.render.collect.logger'
+        collector = mock.Mock(db_lookup={})
+        collector.add.side_effect = collect.SwitchType('bar', {})
+        collector.get_context.return_value = {}
+        collector.get_students.return_value = []
+        collector_classes = {'foo': mock.Mock(return_value=collector)}
+        profile = mock.Mock(id=1)
+        collection = collect.NotificationCollection(profile)
+        with mock.patch.dict(collect.COLLECTOR_CLASSES, collector_classes):
+            with mock.patch(logger) as mock_logger:
+                with mock_store([{'name': 'foo'}]):
+                    collectors = collection.collectors
+
+        assert collectors.keys() == ['foo']
+        mock_logger.warning.assert_called_with(
+            "Unknown notification type '%s'", 'bar')
+
+
     def test_invalid_data(self):
         """Evaluates to false if no notifications have valid data."""
         profile = mock.Mock(id=1)
@@ -37,6 +58,36 @@ class TestNotificationCollection(object):
             assert not collection
 
 
+    def test_batched_hydration(self, db):
+        """Looks up all objects of the same model in a single query."""
+        teacher = factories.ProfileFactory.create()
+        students = [factories.ProfileFactory.create() for i in range(3)]
+        data = [
+            {
+                'name': types.ADDED_TO_VILLAGE,
+                'added-by-id': str(teacher.id),
+                'student-id': str(student.id),
+                }
+            for student in students
+            ]
+        # missing objects still cause rehydration to fail
+        data.append(
+            {
+                'name': types.ADDED_TO_VILLAGE,
+                'added-by-id': str(teacher.id),
+                'student-id': '0',
+                }
+            )
+        collection = collect.NotificationCollection(mock.Mock(id=1))
+
+        with mock_store(data):
+            with utils.assert_num_queries(1):
+                collectors = collection.collectors
+
+        notifications = collectors[types.ADDED_TO_VILLAGE].notifications
+        assert set(n['student'] for n in notifications) == set(students)
+
+
     def test_context(self):
         """Accessing context attr forces hydration."""
         def fake_hydrate(self_):
@@ -0,0 +1,64 @@
+"""Tests for CSS inlining."""
+import threading
+
+from django.template.loader import render_to_string
+import mock
+import premailer
+
+from portfoliyo.notifications.render import inline
+
+
+
+HTML = """<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml">
+<head>
+<title>Test</title>
+<style type="text/css">
+h1, h2 { color:red; }
+p { font-size:2px; text-align: center; }
+p.footer { font-size: 1px !important; }
+a:hover { color: blue; }
+td:first-child { width: 10px; }
+</style>
+</head>
+<body>
+<h1>Hi!</h1>
+<p class="intro">Yes! <a href="/foo/">link</a></p>
+<p class="footer" style="color:red">Feetnuts</p>
+<table><tr><td>one</td><td>two</td></tr></table>
+</body>
+</html>"""
+
+
+
+def test_matches_premailer():
+    """Output is the same as premailer's."""
+    expected = premailer.Premailer(
+        HTML, base_url='http://example.com', output_xhtml=True).transform()
+
+    assert inline.inline_css(HTML, base_url='http://example.com') == expected
+    # the cached Premailer gives the same output again
+    assert inline.inline_css(HTML, base_url='http://example.com') == expected
+
+
+
+def test_matches_premailer_activity_email():
+    """Output for our real notification email matches premailer's."""
+    html = render_to_string('notifications/activity.html', {})
+    expected = premailer.Premailer(
+        html, base_url='http://example.com', output_xhtml=True).transform()
+
+    assert inline.inline_css(html, base_url='http://example.com') == expected
+
+
+
+def test_reuses_premailer():
+    """A Premailer is constructed only once per thread and base URL."""
+    with mock.patch.object(inline, '_local', threading.local()):
+        with mock.patch.object(
+                inline, 'Premailer', wraps=inline.Premailer) as mock_class:
+            inline.inline_css(HTML)
+            inline.inline_css(HTML.replace('Feetnuts', 'Other'))
+            inline.inline_css(HTML, base_url='http://example.com')
+
+    assert mock_class.call_count == 2
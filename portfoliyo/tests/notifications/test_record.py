@@ -4,7 +4,7 @@ import pytest
 
 from portfoliyo.notifications import record
 
-from portfoliyo.tests import factories
+from portfoliyo.tests import factories, utils
 
 
 
@@ -137,7 +137,7 @@ def test_new_teacher(mock_record, requested):
 
 @pytest.fixture
 def mock_store(request):
-    patcher = mock.patch('portfoliyo.notifications.record.store.store')
+    patcher = mock.patch('portfoliyo.notifications.record.store.store_many')
     mock_store = patcher.start()
     request.addfinalizer(patcher.stop)
     return mock_store
@@ -149,8 +149,7 @@ def test_record(mock_store):
     record._record(
         _profile(id=2), 'some', triggering=False, data={'foo': 'bar'})
 
-    mock_store.assert_called_with(
-        2, 'some', triggering=False, data={'foo': 'bar'})
+    mock_store.assert_called_with([(2, 'some', False, {'foo': 'bar'})])
 
 
 
@@ -161,8 +160,7 @@ def test_record_triggering(mock_store):
         record._record(_profile(id=2), 'some', triggering=True)
 
     mock_task_delay.assert_called_with(2)
-    mock_store.assert_called_with(
-        2, 'some', triggering=True, data=None)
+    mock_store.assert_called_with([(2, 'some', True, None)])
 
 
 
@@ -179,6 +177,94 @@ def test_record_triggering_disabled(mock_store):
 
 
 
+def test_record_triggering_delayed(mock_store, redis):
+    """With a delay, schedules at most one delayed email per window."""
+    settings_tgt = 'portfoliyo.notifications.record.settings'
+    tgt = 'portfoliyo.notifications.record.tasks.send_notification_email'
+    with mock.patch(settings_tgt) as mock_settings:
+        with mock.patch(tgt) as mock_task:
+            mock_settings.NOTIFICATION_EMAIL_DELAY_SECONDS = 60
+            record._record(_profile(id=2), 'some', triggering=True)
+            record._record(_profile(id=2), 'other', triggering=True)
+
+    mock_task.apply_async.assert_called_once_with((2,), countdown=60)
+    assert mock_task.delay.call_count == 0
+
+
+
+def test_record_triggering_profile_delay(mock_store, redis):
+    """A profile can override the default delay."""
+    tgt = 'portfoliyo.notifications.record.tasks.send_notification_email'
+    with mock.patch(tgt) as mock_task:
+        record._record(
+            _profile(id=2, notification_delay=300), 'some', triggering=True)
+
+    mock_task.apply_async.assert_called_once_with((2,), countdown=300)
+
+
+
+def test_record_batched(mock_store):
+    """Notifications recorded within a batch are stored together."""
+    tgt = 'portfoliyo.notifications.record.tasks.send_notification_email.delay'
+    with mock.patch(tgt) as mock_task_delay:
+        with record.batched():
+            record._record(_profile(id=2), 'some', triggering=True)
+            record._record(_profile(id=3), 'other')
+            record._record(_profile(id=2), 'more', triggering=True)
+
+            assert not mock_store.call_count
+
+    mock_store.assert_called_once_with(
+        [
+            (2, 'some', True, None),
+            (3, 'other', False, None),
+            (2, 'more', True, None),
+            ]
+        )
+    # only one email triggered per profile
+    mock_task_delay.assert_called_once_with(2)
+
+
+
+def test_post_all_batched(db, redis):
+    """Notifications for all elders of a post are stored in two round-trips."""
+    rel = factories.RelationshipFactory.create(
+        from_profile__user__email='one@example.com')
+    for i in range(3):
+        factories.RelationshipFactory.create(
+            to_profile=rel.student,
+            from_profile__user__email='%s@example.com' % i,
+            )
+    post = factories.PostFactory.create(
+        author=rel.elder, student=rel.student)
+
+    tgt = 'portfoliyo.notifications.record.tasks.send_notification_email'
+    with mock.patch(tgt):
+        with utils.assert_num_calls(redis, 2):
+            record.post_all(post)
+
+
+
+def test_posts_all(db):
+    """Calls post for each elder in each post's village, except author."""
+    rel = factories.RelationshipFactory.create()
+    rel2 = factories.RelationshipFactory.create(from_profile=rel.elder)
+    other = factories.RelationshipFactory.create(to_profile=rel.student)
+    other2 = factories.RelationshipFactory.create(to_profile=rel2.student)
+    post = factories.PostFactory.create(author=rel.elder, student=rel.student)
+    post2 = factories.PostFactory.create(
+        author=rel.elder, student=rel2.student)
+
+    with mock.patch('portfoliyo.notifications.record.post') as mock_post:
+        with utils.assert_num_queries(1):
+            record.posts_all([post, post2])
+
+    assert mock_post.call_count == 2
+    mock_post.assert_any_call(other.elder, post)
+    mock_post.assert_any_call(other2.elder, post2)
+
+
+
 def test_record_doesnt_store_if_user_inactive(mock_store):
     """Doesn't store notifications for inactive users."""
     record._record(_profile(id=2, is_active=False), 'some')
@@ -195,6 +281,10 @@ def test_record_doesnt_store_if_no_email(mock_store):
 
 
 
-def _profile(id, email="foo@example.com", is_active=True, **kwargs):
+def _profile(id, email="foo@example.com", is_active=True,
+             notification_delay=None, **kwargs):
     return mock.Mock(
-        id=id, user=mock.Mock(email=email, is_active=is_active), **kwargs)
+        id=id,
+        user=mock.Mock(email=email, is_active=is_active),
+        notification_delay=notification_delay,
+        **kwargs)
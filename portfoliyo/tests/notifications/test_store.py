@@ -1,8 +1,11 @@
 """Tests for notification storage/retrieval."""
+import time
+
 from django.conf import settings
 import mock
 
 from portfoliyo.notifications import store
+from portfoliyo.tests import utils
 
 
 
@@ -17,6 +20,26 @@ def test_pending_profile_ids(redis):
 
 
 
+def test_store_many(redis):
+    """Stores notifications for many profiles in two round-trips."""
+    with utils.assert_num_calls(redis, 2):
+        store.store_many(
+            [
+                (1, 'some', False, {'foo': 'bar'}),
+                (2, 'other', True, None),
+                (1, 'more', True, None),
+                ]
+            )
+
+    assert list(store.get_all(1)) == [
+        {'name': 'some', 'triggering': '0', 'foo': 'bar'},
+        {'name': 'more', 'triggering': '1'},
+        ]
+    assert list(store.get_all(2)) == [{'name': 'other', 'triggering': '1'}]
+    assert store.pending_profile_ids() == {'1', '2'}
+
+
+
 def test_get_all(redis):
     """Gets all data from all pending notifications."""
     store.store(1, 'some', data={'foo': 'bar'})
@@ -55,6 +78,62 @@ def test_get_all_clear(redis):
 
 
 
+def test_clear(redis):
+    """Clears notifications stored before given time, and scheduled mark."""
+    store.store(1, 'some', triggering=True)
+    store.schedule_email(1, 60)
+    stored_before = time.time()
+    with mock.patch('portfoliyo.notifications.store.time.time') as mock_time:
+        mock_time.return_value = stored_before + 5
+        store.store(1, 'later')
+
+    assert not store.clear(1, stored_before)
+
+    assert list(store.get_all(1)) == [{'name': 'later', 'triggering': '0'}]
+    assert store.pending_profile_ids() == set()
+    assert store.schedule_email(1, 60)
+
+
+
+def test_clear_keeps_triggering(redis):
+    """Keeps profile pending if triggering notifications arrived meanwhile."""
+    store.store(1, 'some', triggering=True)
+    store.schedule_email(1, 60)
+    stored_before = time.time()
+    with mock.patch('portfoliyo.notifications.store.time.time') as mock_time:
+        mock_time.return_value = stored_before + 5
+        store.store(1, 'later', triggering=True)
+
+    assert store.clear(1, stored_before)
+
+    assert list(store.get_all(1)) == [{'name': 'later', 'triggering': '1'}]
+    assert store.pending_profile_ids() == {'1'}
+    assert store.schedule_email(1, 60)
+
+
+
+def test_schedule_email(redis):
+    """Email can be scheduled only once until notifications are cleared."""
+    assert store.schedule_email(1, 60)
+    assert not store.schedule_email(1, 60)
+    assert store.schedule_email(2, 60)
+
+    store.get_all(1, clear=True)
+
+    assert store.schedule_email(1, 60)
+
+
+
+def test_schedule_email_repairs_expiry(redis):
+    """A scheduled mark left without expiry is given one."""
+    key = store.make_email_scheduled_key(1)
+    redis.setnx(key, 1)
+
+    assert not store.schedule_email(1, 60)
+    assert 0 < redis.ttl(key) <= 120
+
+
+
 def test_get_all_excludes_expired(redis):
     """Does not return expired notifications."""
     initial_time = 123456.789
@@ -66,3 +145,25 @@ def test_get_all_excludes_expired(redis):
         mock_time.return_value = expired_time
 
         assert list(store.get_all(1)) == []
+        # expired notification IDs are pruned from the pending set
+        assert redis.zrangebyscore(
+            store.make_pending_notifications_key(1), '-inf', '+inf') == []
+
+
+
+def test_get_all_num_calls(redis):
+    """Fetches any number of notifications in two Redis round-trips."""
+    for i in range(5):
+        store.store(1, 'some', triggering=True)
+
+    with utils.assert_num_calls(redis, 2):
+        res = store.get_all(1, clear=True)
+
+    assert len(res) == 5
+
+
+
+def test_get_all_none_pending(redis):
+    """With no pending notifications, needs only one Redis round-trip."""
+    with utils.assert_num_calls(redis, 1):
+        assert store.get_all(1) == []
@@ -2,6 +2,7 @@
 import mock
 
 
+from portfoliyo.pusher import occupancy
 from portfoliyo.pusher.auth import allow
 from portfoliyo.tests import factories
 
@@ -62,6 +63,25 @@ class TestPusherAuthView(object):
         assert response.json == {'some': 'data'}
 
 
+    def test_marks_occupied(self, client, monkeypatch):
+        """A successfully-authenticated channel is marked occupied."""
+        backend = occupancy.RedisOccupancy()
+        monkeypatch.setattr(occupancy, 'backend', backend)
+        profile = factories.ProfileFactory.create()
+        channel = 'private-user_%s' % profile.id
+
+        with mock.patch('portfoliyo.pusher.auth.get_pusher') as mock_get_p:
+            mock_get_p.return_value = {channel: mock.Mock()}
+            mock_get_p.return_value[channel].authenticate.return_value = {}
+            client.post(
+                '/pusher/auth',
+                {'channel_name': channel, 'socket_id': 'socket-id'},
+                user=profile.user,
+                )
+
+        assert backend.occupied([channel]) == [channel]
+
+
 
     def test_failed(self, client):
         """Returns 403 if unsuccessful."""
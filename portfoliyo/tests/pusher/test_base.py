@@ -1,22 +1,89 @@
 """Tests for Pusher support code."""
+import json
+
 from django.test.utils import override_settings
 
 import mock
+import pytest
+
+from portfoliyo import clients, pusher
+from portfoliyo.pusher import base
+
 
-from portfoliyo import pusher
 
+@pytest.fixture(autouse=True)
+def _reset_clients(request):
+    """Don't share registered API clients between tests."""
+    request.addfinalizer(clients.reset)
 
 
-@mock.patch('pusher.Pusher')
-def test_get_pusher(mock_Pusher):
-    """If settings are configured, returns a Pusher instance."""
+
+def test_get_pusher():
+    """If settings are configured, returns a pooled Pusher instance."""
     with override_settings(PUSHER_APPID='a', PUSHER_KEY='k', PUSHER_SECRET='s'):
         p = pusher.get_pusher()
 
-    assert p is mock_Pusher.return_value
-    mock_Pusher.assert_called_with(app_id='a', key='k', secret='s', port=443)
+    assert isinstance(p, base.PooledPusher)
+    assert (p.app_id, p.key, p.secret, p.port) == ('a', 'k', 's', 443)
+
+
+
+def test_get_pusher_reused():
+    """The same Pusher instance is returned until settings change."""
+    with override_settings(PUSHER_APPID='a', PUSHER_KEY='k', PUSHER_SECRET='s'):
+        p = pusher.get_pusher()
+        assert pusher.get_pusher() is p
+    with override_settings(PUSHER_APPID='b', PUSHER_KEY='k', PUSHER_SECRET='s'):
+        assert pusher.get_pusher() is not p
+
 
 
 def test_get_pusher_none():
     """If settings are not configured, return None."""
     assert pusher.get_pusher() is None
+
+
+
+def test_trigger_uses_persistent_connection():
+    """Channel events are sent over the client's persistent connection."""
+    p = base.PooledPusher(app_id='a', key='k', secret='s', port=443)
+    target = 'portfoliyo.pusher.base.clients.PersistentConnection.request'
+    with mock.patch(target) as mock_request:
+        mock_request.return_value = (202, '')
+        assert p['private-foo'].trigger('event', {'some': 'data'})
+
+    method, path, body, headers = mock_request.call_args[0]
+    assert method == 'POST'
+    assert path.startswith('/apps/a/channels/private-foo/events?')
+    assert body == '{"some": "data"}'
+
+
+
+def test_trigger_multiple_channels():
+    """An event is triggered on several channels with a single request."""
+    p = base.PooledPusher(app_id='a', key='k', secret='s', port=443)
+    target = 'portfoliyo.pusher.base.clients.PersistentConnection.request'
+    with mock.patch(target) as mock_request:
+        mock_request.return_value = (200, '{}')
+        assert p.trigger(['private-a', 'private-b'], 'event', {'some': 'data'})
+
+    method, path, body, headers = mock_request.call_args[0]
+    assert method == 'POST'
+    assert path.startswith('/apps/a/events?')
+    assert 'auth_signature=' in path
+    assert json.loads(body) == {
+        'name': 'event',
+        'channels': ['private-a', 'private-b'],
+        'data': '{"some": "data"}',
+        }
+
+
+
+def test_trigger_multiple_channels_auth_error():
+    """Raises AuthenticationError if Pusher rejects our credentials."""
+    p = base.PooledPusher(app_id='a', key='k', secret='s', port=443)
+    target = 'portfoliyo.pusher.base.clients.PersistentConnection.request'
+    with mock.patch(target) as mock_request:
+        mock_request.return_value = (401, '')
+        with pytest.raises(base.pusher.AuthenticationError):
+            p.trigger(['private-a'], 'event', {})
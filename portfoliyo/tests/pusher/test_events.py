@@ -2,7 +2,7 @@
 from django.core.urlresolvers import reverse
 import mock
 
-from portfoliyo.pusher import events
+from portfoliyo.pusher import events, occupancy
 from portfoliyo.tests import factories
 
 
@@ -16,38 +16,76 @@ def test_posted_event(db):
         author=author_rel.elder, student=author_rel.student)
 
     with mock.patch('portfoliyo.pusher.events.get_pusher') as mock_get_pusher:
-        author_channel = mock.Mock()
-        other_channel = mock.Mock()
-        mock_get_pusher.return_value = {
-            'private-user_%s' % author_rel.elder.id: author_channel,
-            'private-user_%s' % other_rel.elder.id: other_channel,
-            }
         events.posted_event(p, extra='foo')
 
-    author_args = author_channel.trigger.call_args[0]
-    other_args = other_channel.trigger.call_args[0]
-    assert author_args[0] == other_args[0] == 'message_posted'
-    author_data = author_args[1]['objects'][0]
-    other_data = other_args[1]['objects'][0]
-    assert author_data['extra'] == other_data['extra'] == 'foo'
-    assert author_data['mine']
-    assert not other_data['mine']
+    mock_trigger = mock_get_pusher.return_value.trigger
+    assert mock_trigger.call_count == 1
+    channels, event, data = mock_trigger.call_args[0]
+    assert set(channels) == {
+        'private-user_%s' % author_rel.elder.id,
+        'private-user_%s' % other_rel.elder.id,
+        }
+    assert event == 'message_posted'
+    post_data = data['objects'][0]
+    assert post_data['extra'] == 'foo'
+    assert post_data['author_id'] == author_rel.elder.id
+
+
+def test_bulk_posted_all(db):
+    """Pusher events for a bulk post and all its sub-posts, in one go."""
+    rel = factories.RelationshipFactory.create(
+        from_profile__school_staff=True)
+    bulk = factories.BulkPostFactory.create(author=rel.elder)
+    sub = factories.PostFactory.create(
+        author=rel.elder, student=rel.student, from_bulk=bulk)
+
+    with mock.patch('portfoliyo.pusher.events.posted_event') as mock_posted:
+        events.bulk_posted_all(bulk.id, author_sequence_id='5')
+
+    assert mock_posted.call_args_list == [
+        mock.call(
+            sub,
+            author_sequence_id='5',
+            mark_read_url=reverse(
+                'mark_post_read', kwargs={'post_id': sub.id}),
+            ),
+        mock.call(bulk, author_sequence_id='5'),
+        ]
+
+
+
+def test_posted_many(db):
+    """Pusher events for many posts, in one go, in order of ID."""
+    rel = factories.RelationshipFactory.create(
+        from_profile__school_staff=True)
+    post = factories.PostFactory.create(author=rel.elder, student=rel.student)
+    post2 = factories.PostFactory.create(author=rel.elder, student=rel.student)
+
+    with mock.patch('portfoliyo.pusher.events.posted_event') as mock_posted:
+        events.posted_many([post2.id, post.id], author_sequence_id='5')
+
+    assert mock_posted.call_args_list == [
+        mock.call(
+            p,
+            author_sequence_id='5',
+            mark_read_url=reverse('mark_post_read', kwargs={'post_id': p.id}),
+            )
+        for p in [post, post2]
+        ]
+
 
 
 def test_student_event(db):
     """Pusher event for adding/editing/removing a student."""
     rel = factories.RelationshipFactory.create()
     with mock.patch('portfoliyo.pusher.events.get_pusher') as mock_get_pusher:
-        channel = mock.Mock()
-        mock_get_pusher.return_value = {
-            'private-user_%s' % rel.elder.id: channel,
-            }
         events.student_event('some_event', rel.student.id, [rel.elder.id])
 
-    args = channel.trigger.call_args[0]
-    assert args[0] == 'some_event'
-    assert len(args[1]['objects']) == 1
-    data = args[1]['objects'][0]
+    args = mock_get_pusher.return_value.trigger.call_args[0]
+    assert args[0] == ['private-user_%s' % rel.elder.id]
+    assert args[1] == 'some_event'
+    assert len(args[2]['objects']) == 1
+    data = args[2]['objects'][0]
     assert data['name'] == rel.student.name
     assert data['id'] == rel.student.id
     assert data['resource_uri'] == reverse(
@@ -66,16 +104,13 @@ def test_group_event(db):
     """Pusher event for adding/editing/removing a group."""
     group = factories.GroupFactory.create()
     with mock.patch('portfoliyo.pusher.events.get_pusher') as mock_get_pusher:
-        channel = mock.Mock()
-        mock_get_pusher.return_value = {
-            'private-user_%s' % group.owner.id: channel,
-            }
         events.group_event('some_event', group.id, group.owner.id)
 
-    args = channel.trigger.call_args[0]
-    assert args[0] == 'some_event'
-    assert len(args[1]['objects']) == 1
-    data = args[1]['objects'][0]
+    args = mock_get_pusher.return_value.trigger.call_args[0]
+    assert args[0] == ['private-user_%s' % group.owner.id]
+    assert args[1] == 'some_event'
+    assert len(args[2]['objects']) == 1
+    data = args[2]['objects'][0]
     assert data['name'] == group.name
     assert data['id'] == group.id
     assert data['resource_uri'] == reverse(
@@ -97,8 +132,8 @@ def test_pusher_socket_error():
     get_pusher_location = 'portfoliyo.pusher.events.get_pusher'
     logger_warning_location = 'portfoliyo.pusher.events.logger.warning'
     with mock.patch(get_pusher_location) as mock_get_pusher:
-        channel = mock_get_pusher.return_value['channel']
-        channel.trigger.side_effect = socket.error('connection timed out')
+        mock_trigger = mock_get_pusher.return_value.trigger
+        mock_trigger.side_effect = socket.error('connection timed out')
 
         with mock.patch(logger_warning_location) as mock_logger_warning:
             events.trigger('channel', 'event', {})
@@ -120,8 +155,7 @@ def test_pusher_bad_response():
     get_pusher_location = 'portfoliyo.pusher.events.get_pusher'
     logger_warning_location = 'portfoliyo.pusher.events.logger.warning'
     with mock.patch(get_pusher_location) as mock_get_pusher:
-        channel = mock_get_pusher.return_value['channel']
-        channel.trigger.side_effect = Exception(
+        mock_get_pusher.return_value.trigger.side_effect = Exception(
             'Unexpected return status 413')
 
         with mock.patch(logger_warning_location) as mock_logger_warning:
@@ -132,3 +166,62 @@ def test_pusher_bad_response():
         exc_info=True,
         extra={'stack': True},
         )
+
+
+
+def test_trigger_many_batches():
+    """Channels are triggered in batches of MAX_TRIGGER_CHANNELS."""
+    channels = ['user_%s' % i for i in range(25)]
+    with mock.patch('portfoliyo.pusher.events.get_pusher') as mock_get_pusher:
+        events.trigger_many(channels, 'event', {'foo': 'bar'})
+
+    calls = mock_get_pusher.return_value.trigger.call_args_list
+    assert [len(c[0][0]) for c in calls] == [10, 10, 5]
+    assert calls[0] == mock.call(
+        ['private-user_%s' % i for i in range(10)], 'event', {'foo': 'bar'})
+
+
+
+def test_posted_event_skips_unoccupied(db, redis, monkeypatch):
+    """A post is only serialized and sent for teachers who are subscribed."""
+    monkeypatch.setattr(occupancy, 'backend', occupancy.RedisOccupancy())
+    author_rel = factories.RelationshipFactory.create(
+        from_profile__school_staff=True)
+    other_rel = factories.RelationshipFactory.create(
+        from_profile__school_staff=True, to_profile=author_rel.student)
+    p = factories.PostFactory.create(
+        author=author_rel.elder, student=author_rel.student)
+    occupancy.mark_occupied('private-user_%s' % other_rel.elder.id)
+
+    with mock.patch('portfoliyo.pusher.events.get_pusher') as mock_get_pusher:
+        events.posted_event(p)
+
+    channels = mock_get_pusher.return_value.trigger.call_args[0][0]
+    assert channels == ['private-user_%s' % other_rel.elder.id]
+
+
+
+def test_posted_event_nobody_subscribed(db, redis, monkeypatch):
+    """If no teacher is subscribed, the post isn't even serialized."""
+    monkeypatch.setattr(occupancy, 'backend', occupancy.RedisOccupancy())
+    rel = factories.RelationshipFactory.create(
+        from_profile__school_staff=True)
+    p = factories.PostFactory.create(author=rel.elder, student=rel.student)
+
+    target = 'portfoliyo.pusher.events.serializers.post2dict'
+    with mock.patch(target) as mock_post2dict:
+        with mock.patch('portfoliyo.pusher.events.get_pusher') as mock_get_p:
+            events.posted_event(p)
+
+    assert mock_post2dict.call_count == 0
+    assert mock_get_p.return_value.trigger.call_count == 0
+
+
+
+def test_trigger_skips_unoccupied(redis, monkeypatch):
+    """An event for a channel nobody is subscribed to isn't sent."""
+    monkeypatch.setattr(occupancy, 'backend', occupancy.RedisOccupancy())
+    with mock.patch('portfoliyo.pusher.events.get_pusher') as mock_get_pusher:
+        events.trigger('user_1', 'event', {})
+
+    assert mock_get_pusher.return_value.trigger.call_count == 0
@@ -0,0 +1,40 @@
+"""Tests for Pusher channel-occupancy tracking."""
+from portfoliyo.pusher import occupancy
+
+
+
+class TestAlwaysOccupied(object):
+    def test_occupied(self):
+        """All channels are considered occupied."""
+        backend = occupancy.AlwaysOccupied()
+        backend.mark_vacated('private-user_1')
+
+        assert backend.occupied(['private-user_1']) == ['private-user_1']
+
+
+
+class TestRedisOccupancy(object):
+    def test_occupied(self, redis):
+        """Only channels marked occupied (and not since vacated) are."""
+        backend = occupancy.RedisOccupancy()
+        backend.mark_occupied('private-user_1')
+        backend.mark_occupied('private-user_2')
+        backend.mark_vacated('private-user_2')
+
+        assert backend.occupied(
+            ['private-user_1', 'private-user_2', 'private-user_3']
+            ) == ['private-user_1']
+
+
+    def test_single_query(self, redis):
+        """Occupancy of any number of channels is checked in one query."""
+        backend = occupancy.RedisOccupancy()
+        backend.occupied(['private-user_%s' % i for i in range(10)])
+
+        assert redis.num_calls == 1
+
+
+    def test_no_channels(self, redis):
+        """Checking no channels doesn't query Redis."""
+        assert occupancy.RedisOccupancy().occupied([]) == []
+        assert redis.num_calls == 0
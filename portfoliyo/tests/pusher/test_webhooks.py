@@ -0,0 +1,98 @@
+"""Tests for Pusher webhooks."""
+import hashlib
+import hmac
+import json
+
+from django.test.utils import override_settings
+import mock
+import pytest
+
+from portfoliyo.pusher import occupancy
+
+
+
+@pytest.fixture
+def backend(request, redis, monkeypatch):
+    """Track channel occupancy in (fake) Redis; return backend."""
+    backend = occupancy.RedisOccupancy()
+    monkeypatch.setattr(occupancy, 'backend', backend)
+    return backend
+
+
+
+def post_webhook(client, events, key='k', secret='s', status=None):
+    """Post signed webhook with ``events`` to ``client``; return response."""
+    body = json.dumps({'time_ms': 1363118541000, 'events': events})
+    signature = hmac.new(secret, body, hashlib.sha256).hexdigest()
+    with override_settings(PUSHER_KEY='k', PUSHER_SECRET='s'):
+        return client.post(
+            '/pusher/webhook',
+            body,
+            content_type='application/json',
+            headers={'X-Pusher-Key': key, 'X-Pusher-Signature': signature},
+            status=status,
+            )
+
+
+
+class TestPusherWebhook(object):
+    def test_occupied_and_vacated(self, client, backend):
+        """Channel occupied/vacated events update the occupancy registry."""
+        backend.mark_occupied('private-user_2')
+        post_webhook(
+            client,
+            [
+                {'name': 'channel_occupied', 'channel': 'private-user_1'},
+                {'name': 'channel_vacated', 'channel': 'private-user_2'},
+                {'name': 'member_added', 'channel': 'presence-foo'},
+                ],
+            )
+
+        assert backend.occupied(
+            ['private-user_1', 'private-user_2']) == ['private-user_1']
+
+
+    def test_bad_signature(self, client, backend):
+        """A webhook not signed with our secret is rejected."""
+        post_webhook(
+            client,
+            [{'name': 'channel_occupied', 'channel': 'private-user_1'}],
+            secret='wrong',
+            status=403,
+            )
+
+        assert backend.occupied(['private-user_1']) == []
+
+
+    def test_wrong_key(self, client, backend):
+        """A webhook for some other app key is rejected."""
+        post_webhook(
+            client,
+            [{'name': 'channel_occupied', 'channel': 'private-user_1'}],
+            key='other',
+            status=403,
+            )
+
+        assert backend.occupied(['private-user_1']) == []
+
+
+    def test_not_configured(self, client):
+        """If Pusher isn't configured, all webhooks are rejected."""
+        with mock.patch('portfoliyo.pusher.occupancy.mark_occupied') as mock_m:
+            client.post(
+                '/pusher/webhook',
+                json.dumps(
+                    {
+                        'events': [
+                            {
+                                'name': 'channel_occupied',
+                                'channel': 'private-user_1',
+                                },
+                            ],
+                        },
+                    ),
+                content_type='application/json',
+                status=403,
+                )
+
+        assert mock_m.call_count == 0
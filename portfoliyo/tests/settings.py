@@ -11,6 +11,9 @@ MIXPANEL_ID = None
 PUSHER_APPID = None
 PUSHER_KEY = None
 PUSHER_SECRET = None
+# most tests save profiles, groups etc without the redis fixture
+PORTFOLIYO_CODE_INDEX_BACKEND = 'portfoliyo.model.users.codes.DatabaseCodes'
+SMS_CONTEXT_CACHE_SECONDS = 0
 
 CACHES = {
     'default': {
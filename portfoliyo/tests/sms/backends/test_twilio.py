@@ -1,18 +1,50 @@
 """Tests for Twilio SMS backend class."""
-from django.test.utils import override_settings
+import urlparse
 
+from django.test.utils import override_settings
 import mock
+import pytest
+from twilio import TwilioRestException
 
 from portfoliyo.sms.backends import twilio
 
 
+
+@pytest.fixture
+def connection(request):
+    """Patch out the Twilio connection; return mock of it."""
+    patcher = mock.patch('portfoliyo.sms.backends.twilio.clients.get')
+    request.addfinalizer(patcher.stop)
+    return patcher.start().return_value
+
+
+
+@override_settings(TWILIO_ACCOUNT_SID='account_sid', TWILIO_AUTH_TOKEN='token')
+def test_send(connection):
+    """send() POSTs the message over the persistent Twilio connection."""
+    connection.request.return_value = (201, '{"sid": "SM1"}')
+    sms = twilio.TwilioSMSBackend()
+
+    assert sms.send('1', '2', u'b\xf6dy') == {'sid': 'SM1'}
+
+    method, path, data, headers = connection.request.call_args[0]
+    assert method == 'POST'
+    assert path == '/2010-04-01/Accounts/account_sid/SMS/Messages.json'
+    assert urlparse.parse_qs(data) == {
+        'To': ['1'], 'From': ['2'], 'Body': [u'b\xf6dy'.encode('utf-8')]}
+    assert headers['Authorization'] == 'Basic YWNjb3VudF9zaWQ6dG9rZW4='
+
+
+
 @override_settings(TWILIO_ACCOUNT_SID='account_sid', TWILIO_AUTH_TOKEN='token')
-@mock.patch("twilio.rest.TwilioRestClient")
-def test_send(twilio_client_class):
-    """send() method passes on its args to client send."""
+def test_send_error(connection):
+    """send() raises TwilioRestException if Twilio rejects the message."""
+    connection.request.return_value = (
+        400, '{"code": 21211, "message": "Invalid To number"}')
     sms = twilio.TwilioSMSBackend()
-    twilio_client_class.assert_called_with('account_sid', 'token')
 
-    sms.send('1', '2', 'body')
-    sms.client.sms.messages.create.assert_called_with(
-        to='1', from_='2', body='body')
+    with pytest.raises(TwilioRestException) as excinfo:
+        sms.send('1', '2', 'body')
+
+    assert excinfo.value.status == 400
+    assert excinfo.value.msg == "21211: Invalid To number"
@@ -16,3 +16,52 @@ def test_split_sms():
         phone, source_phone, ('a' * 157) + '...')
     mock_send.assert_any_call(
         phone, source_phone, '...' + ('a' * 4))
+
+
+
+def test_send_idempotent(redis):
+    """With an idempotency key, parts already sent aren't sent again."""
+    phone = '+132165437890'
+    source_phone = '+13336660000'
+    longtext = 'a' * 161
+    with mock.patch('portfoliyo.sms.base.backend') as mock_backend:
+        mock_backend.send.side_effect = [None, Exception('oops')]
+        try:
+            sms.send(phone, source_phone, longtext, idempotency_key='key')
+        except Exception:
+            pass
+        mock_backend.send.side_effect = None
+        sms.send(phone, source_phone, longtext, idempotency_key='key')
+        sms.send(phone, source_phone, longtext, idempotency_key='key')
+
+    assert mock_backend.send.call_args_list == [
+        mock.call(phone, source_phone, ('a' * 157) + '...'),
+        mock.call(phone, source_phone, '...' + ('a' * 4)),
+        mock.call(phone, source_phone, '...' + ('a' * 4)),
+        ]
+
+
+
+def test_split_sms_unicode():
+    """A text requiring UCS-2 encoding is split into 70-char segments."""
+    text = u'\xfa' * 71
+
+    assert list(sms.base.split_sms(text)) == [
+        u'\xfa' * 67 + u'...', u'...' + u'\xfa' * 4]
+
+
+
+def test_split_sms_extended_chars():
+    """GSM-7 extension characters count double when splitting."""
+    text = u'[' * 80
+
+    assert list(sms.base.split_sms(text)) == [u'[' * 80]
+    assert list(sms.base.split_sms(text + u'a')) == [
+        u'[' * 78 + u'...', u'...' + u'[[a']
+
+
+
+def test_count_segments():
+    """Counts the SMS segments a message will be sent as."""
+    assert sms.base.count_segments(u'a' * 160) == 1
+    assert sms.base.count_segments(u'\xfa' * 71) == 2
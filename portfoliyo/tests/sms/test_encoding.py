@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from django.conf import settings
+import mock
+
+from portfoliyo.sms import encoding
+
+
+
+def test_get_encoding():
+    """Text with any character outside the GSM-7 alphabet needs UCS-2."""
+    assert encoding.get_encoding(u'Hola, \xbfc\xf3mo est\xe1s?') == 'UCS-2'
+    assert encoding.get_encoding(u'\xbfQu\xe9 pasa? [€5]') == 'GSM-7'
+
+
+
+def test_length():
+    """GSM-7 extension characters count double, except in UCS-2."""
+    assert encoding.length(u'[5€]') == 7
+    assert encoding.length(u'[5€]', encoding.UCS2) == 4
+    assert encoding.length(u'[\xfa]') == 3
+
+
+
+class TestTransliterate(object):
+    def test_latin(self):
+        """Accented Latin letters and typographic punctuation are replaced."""
+        text = u'“\xbfT\xfa?” — s\xed…'
+
+        assert encoding.transliterate(text) == u'"\xbfTu?" -- si...'
+
+
+    def test_gsm7_untouched(self):
+        """Characters in the GSM-7 alphabet are kept, accents and all."""
+        assert encoding.transliterate(u'\xe9 \xfa') == u'\xe9 u'
+
+
+    def test_unsafe(self):
+        """If any character can't be safely replaced, text is unchanged."""
+        text = u't\xfa 中'
+
+        assert encoding.transliterate(text) == text
+
+
+
+def test_transliterations():
+    """Offers a mapping of transliterations for client-side counting."""
+    mapping = encoding.transliterations()
+
+    assert mapping[u'\xfa'] == u'u'
+    assert mapping[u'’'] == u"'"
+    # characters already in GSM-7 are not included
+    assert u'\xe9' not in mapping
+
+
+
+def test_prepare():
+    """Transliterates only if the SMS_TRANSLITERATE setting is on."""
+    with mock.patch.object(settings, 'SMS_TRANSLITERATE', False):
+        assert encoding.prepare(u't\xfa') == u't\xfa'
+    with mock.patch.object(settings, 'SMS_TRANSLITERATE', True):
+        assert encoding.prepare(u't\xfa') == u'tu'
@@ -12,6 +12,47 @@ from portfoliyo.sms import hook
 from portfoliyo.tests import factories, utils
 
 
+def test_process_inbound(db):
+    """Processes stored SMS, sending reply as SMS and marking it processed."""
+    inbound = model.InboundSms.record('SM1', '+13216430987', 'to', 'foo')
+
+    with mock.patch('portfoliyo.sms.hook.receive_sms') as mock_receive_sms:
+        mock_receive_sms.return_value = 'a reply'
+        with mock.patch('portfoliyo.sms.hook.tasks.send_sms') as mock_send:
+            hook.process_inbound(inbound.id)
+
+    mock_receive_sms.assert_called_once_with('+13216430987', 'to', 'foo')
+    mock_send.delay.assert_called_once_with('+13216430987', 'to', 'a reply')
+    assert utils.refresh(inbound).processed is not None
+
+
+
+def test_process_inbound_no_reply(db):
+    """If there's no reply, no SMS is sent."""
+    inbound = model.InboundSms.record('SM1', '+13216430987', 'to', 'foo')
+
+    with mock.patch('portfoliyo.sms.hook.receive_sms') as mock_receive_sms:
+        mock_receive_sms.return_value = None
+        with mock.patch('portfoliyo.sms.hook.tasks.send_sms') as mock_send:
+            hook.process_inbound(inbound.id)
+
+    assert not mock_send.delay.called
+
+
+
+def test_process_inbound_once(db):
+    """An already-processed SMS is not processed again."""
+    inbound = model.InboundSms.record('SM1', '+13216430987', 'to', 'foo')
+
+    with mock.patch('portfoliyo.sms.hook.receive_sms') as mock_receive_sms:
+        mock_receive_sms.return_value = None
+        hook.process_inbound(inbound.id)
+        hook.process_inbound(inbound.id)
+
+    assert mock_receive_sms.call_count == 1
+
+
+
 def test_create_post(db):
     """Creates Post (and no reply) if one associated student."""
     phone = '+13216430987'
@@ -21,12 +62,12 @@ def test_create_post(db):
     factories.RelationshipFactory.create(
         from_profile__school_staff=True, to_profile=rel.student)
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch.object(model.Post, 'create_many') as mock_create:
         reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, 'foo')
 
     assert reply is None
     mock_create.assert_called_once_with(
-        profile, rel.student, 'foo', from_sms=True)
+        profile, [rel.student], 'foo', from_sms=True)
 
 
 
@@ -44,14 +85,14 @@ def test_activate_user(db):
         to_profile=rel.student,
         )
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch.object(model.Post, 'create_many') as mock_create:
         reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, 'foo')
 
     profile = utils.refresh(profile)
     assert profile.user.is_active
     assert not profile.declined
     mock_create.assert_any_call(
-        None, rel.student, reply, in_reply_to=phone, notifications=False)
+        None, [rel.student], reply, in_reply_to=phone, notifications=False)
     assert reply == (
         "You can text this number "
         "to talk with Ms. Johns."
@@ -66,7 +107,7 @@ def test_decline(db):
         user__is_active=False, phone=phone)
     rel = factories.RelationshipFactory.create(from_profile=profile)
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch.object(model.Post, 'create_many') as mock_create:
         reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, 'stop')
 
     assert not utils.refresh(profile.user).is_active
@@ -75,9 +116,9 @@ def test_decline(db):
         "No problem! Sorry to have bothered you. "
         "Text this number anytime to re-start."
         )
-    mock_create.assert_any_call(profile, rel.student, "stop", from_sms=True)
+    mock_create.assert_any_call(profile, [rel.student], "stop", from_sms=True)
     mock_create.assert_any_call(
-        None, rel.student, reply, in_reply_to=phone, notifications=False)
+        None, [rel.student], reply, in_reply_to=phone, notifications=False)
 
 
 
@@ -88,7 +129,7 @@ def test_active_user_decline(db):
         user__is_active=True, phone=phone)
     rel = factories.RelationshipFactory.create(from_profile=profile)
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch.object(model.Post, 'create_many') as mock_create:
         reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, 'stop')
 
     assert not utils.refresh(profile.user).is_active
@@ -97,9 +138,9 @@ def test_active_user_decline(db):
         "No problem! Sorry to have bothered you. "
         "Text this number anytime to re-start."
         )
-    mock_create.assert_any_call(profile, rel.student, "stop", from_sms=True)
+    mock_create.assert_any_call(profile, [rel.student], "stop", from_sms=True)
     mock_create.assert_any_call(
-        None, rel.student, reply, in_reply_to=phone, notifications=False)
+        None, [rel.student], reply, in_reply_to=phone, notifications=False)
 
 
 
@@ -125,11 +166,12 @@ def test_multiple_students(db):
     factories.RelationshipFactory.create(
         from_profile__school_staff=True, to_profile=rel1.student)
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch.object(model.Post, 'create_many') as mock_create:
         reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, 'foo')
 
-    mock_create.assert_any_call(profile, rel1.student, 'foo', from_sms=True)
-    mock_create.assert_any_call(profile, rel2.student, 'foo', from_sms=True)
+    mock_create.assert_called_once_with(
+        profile, mock.ANY, 'foo', from_sms=True)
+    assert set(mock_create.call_args[0][1]) == {rel1.student, rel2.student}
     assert reply is None
 
 
@@ -170,7 +212,7 @@ def test_code_signup(db):
     teacher = factories.ProfileFactory.create(
         school_staff=True, name="Teacher Jane", code="ABCDEF", country_code='ca')
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch.object(model.Post, 'create_many') as mock_create:
         with mock.patch('portfoliyo.sms.hook.track_signup') as mock_track:
             reply = hook.receive_sms(phone, source_phone, "abcdef")
 
@@ -197,7 +239,7 @@ def test_code_signup_with_language(db):
     factories.ProfileFactory.create(
         school_staff=True, name="Teacher Joe", code="ABCDEF")
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create'):
+    with mock.patch.object(model.Post, 'create_many'):
         reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, "abcdef ES")
 
     assert reply == (
@@ -213,7 +255,7 @@ def test_group_code_signup(db):
     group = factories.GroupFactory.create(
         owner__school_staff=True, owner__name="Teacher Jane", code="ABCDEFG")
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch.object(model.Post, 'create_many') as mock_create:
         with mock.patch('portfoliyo.sms.hook.track_signup') as mock_track:
             reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, "abcdefg")
 
@@ -246,7 +288,7 @@ def test_code_signup_student_name(db):
         teacher=teacher,
         )
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch.object(model.Post, 'create_many') as mock_create:
         with mock.patch(
                 'portfoliyo.pusher.events.student_added') as mock_student_added:
             reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, "Jimmy Doe")
@@ -271,10 +313,10 @@ def test_code_signup_student_name(db):
     assert signup.student == student
     # and the name is sent on to the village chat as a post
     mock_create.assert_any_call(
-        parent, student, "Jimmy Doe", from_sms=True, notifications=False)
+        parent, [student], "Jimmy Doe", from_sms=True, notifications=False)
     # and the automated reply is also sent on to village chat
     mock_create.assert_any_call(
-        None, student, reply, in_reply_to=phone, notifications=False)
+        None, [student], reply, in_reply_to=phone, notifications=False)
 
 
 def test_code_signup_student_name_strips_extra_lines(db):
@@ -290,7 +332,7 @@ def test_code_signup_student_name_strips_extra_lines(db):
         teacher=teacher,
         )
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch.object(model.Post, 'create_many') as mock_create:
         hook.receive_sms(
             phone, settings.DEFAULT_NUMBER, "Jimmy Doe\nLook at me!")
 
@@ -299,7 +341,7 @@ def test_code_signup_student_name_strips_extra_lines(db):
     assert student.name == u"Jimmy Doe"
     mock_create.assert_any_call(
         parent,
-        student,
+        [student],
         "Jimmy Doe\nLook at me!",
         from_sms=True,
         notifications=False,
@@ -320,7 +362,7 @@ def test_unusually_long_student_name_tracked(db):
         )
 
     msg = "Hi there Ms. Waggoner this is Joe Smith how is Jimmy doing?"
-    with mock.patch('portfoliyo.sms.hook.model.Post.create'):
+    with mock.patch.object(model.Post, 'create_many'):
         with mock.patch('portfoliyo.sms.hook.track_sms') as mock_track:
             hook.receive_sms(phone, settings.DEFAULT_NUMBER, msg)
 
@@ -342,7 +384,7 @@ def test_group_code_signup_student_name(db):
         state=model.TextSignup.STATE.kidname,
         )
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch.object(model.Post, 'create_many') as mock_create:
         with mock.patch(
                 'portfoliyo.pusher.events.student_added') as mock_student_added:
             reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, "Jimmy Doe")
@@ -368,10 +410,10 @@ def test_group_code_signup_student_name(db):
     assert signup.student == student
     # and the name is sent on to the village chat as a post
     mock_create.assert_any_call(
-        parent, student, "Jimmy Doe", from_sms=True, notifications=False)
+        parent, [student], "Jimmy Doe", from_sms=True, notifications=False)
     # and the automated reply is also sent on to village chat
     mock_create.assert_any_call(
-        None, student, reply, in_reply_to=phone, notifications=False)
+        None, [student], reply, in_reply_to=phone, notifications=False)
 
 
 def test_code_signup_student_name_dupe_detection(db):
@@ -388,7 +430,7 @@ def test_code_signup_student_name_dupe_detection(db):
         state=model.TextSignup.STATE.kidname,
         )
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create'):
+    with mock.patch.object(model.Post, 'create_many'):
         reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, "Jimmy Doe")
 
     assert reply == (
@@ -426,7 +468,7 @@ def test_code_signup_role(db):
         state=model.TextSignup.STATE.relationship,
         )
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+    with mock.patch.object(model.Post, 'create_many') as mock_create:
         reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, "father")
 
     assert reply == (
@@ -440,10 +482,10 @@ def test_code_signup_role(db):
     student = teacher_rel.student
     # and the role is sent on to the village chat as a post
     mock_create.assert_any_call(
-        parent, student, "father", from_sms=True, notifications=False)
+        parent, [student], "father", from_sms=True, notifications=False)
     # and the automated reply is also sent on to village chat
     mock_create.assert_any_call(
-        None, student, reply, in_reply_to=phone, notifications=False)
+        None, [student], reply, in_reply_to=phone, notifications=False)
 
 
 def test_code_signup_role_strips_extra_lines(db):
@@ -469,7 +511,7 @@ def test_code_signup_role_strips_extra_lines(db):
         state=model.TextSignup.STATE.relationship,
         )
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create'):
+    with mock.patch.object(model.Post, 'create_many'):
         hook.receive_sms(phone, settings.DEFAULT_NUMBER, "father\nI'm a sig!")
 
     parent = model.Profile.objects.get(phone=phone)
@@ -500,7 +542,7 @@ def test_unusually_long_role_tracked(db):
         )
 
     msg = "Hi there Ms. Waggoner this is Joe Smith how is Jimmy doing?"
-    with mock.patch('portfoliyo.sms.hook.model.Post.create'):
+    with mock.patch.object(model.Post, 'create_many'):
         with mock.patch('portfoliyo.sms.hook.track_sms') as mock_track:
             hook.receive_sms(phone, settings.DEFAULT_NUMBER, msg)
 
@@ -532,7 +574,7 @@ def test_code_signup_name(db):
 
     record_notification_path = 'portfoliyo.tasks.record_notification.delay'
     with mock.patch(record_notification_path) as mock_record_notification:
-        with mock.patch('portfoliyo.sms.hook.model.Post.create') as mock_create:
+        with mock.patch.object(model.Post, 'create_many') as mock_create:
             reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, "John Doe")
 
     assert reply == (
@@ -545,10 +587,10 @@ def test_code_signup_name(db):
     assert signup.state == model.TextSignup.STATE.done
     student = teacher_rel.student
     mock_create.assert_any_call(
-        parent, student, "John Doe", from_sms=True, notifications=False)
+        parent, [student], "John Doe", from_sms=True, notifications=False)
     # and the automated reply is also sent on to village chat
     mock_create.assert_any_call(
-        None, student, reply, in_reply_to=phone, notifications=False)
+        None, [student], reply, in_reply_to=phone, notifications=False)
     mock_record_notification.assert_called_with('new_parent', teacher_rel.elder, signup)
 
 
@@ -574,7 +616,7 @@ def test_code_signup_name_strips_extra_lines(db):
         state=model.TextSignup.STATE.name,
         )
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create'):
+    with mock.patch.object(model.Post, 'create_many'):
         hook.receive_sms(
             phone, settings.DEFAULT_NUMBER, "\n John Doe\nI'm a sig too!")
 
@@ -605,7 +647,7 @@ def test_unusually_long_parent_name_tracked(db):
         )
 
     msg = "Hi there Ms. Waggoner this is Joe Smith how is Jimmy doing?"
-    with mock.patch('portfoliyo.sms.hook.model.Post.create'):
+    with mock.patch.object(model.Post, 'create_many'):
         with mock.patch('portfoliyo.sms.hook.track_sms') as mock_track:
             hook.receive_sms(phone, settings.DEFAULT_NUMBER, msg)
 
@@ -628,7 +670,7 @@ def test_subsequent_signup(db):
         code='ABCDEF', name='Ms. Doe')
 
     rn_tgt = 'portfoliyo.tasks.record_notification.delay'
-    create_tgt = 'portfoliyo.sms.hook.model.Post.create'
+    create_tgt = 'portfoliyo.sms.hook.model.Post.create_many'
     with mock.patch('portfoliyo.sms.hook.track_signup') as mock_track:
         with mock.patch(rn_tgt) as mock_record_notification:
             with mock.patch(create_tgt) as mock_create:
@@ -647,13 +689,13 @@ def test_subsequent_signup(db):
     assert mock_create.call_count == 2
     mock_create.assert_any_call(
         signup.family,
-        signup.student,
+        [signup.student],
         "ABCDEF",
         from_sms=True,
         )
     mock_create.assert_any_call(
         None,
-        signup.student,
+        [signup.student],
         reply,
         in_reply_to=u'+13216430987',
         notifications=False,
@@ -683,7 +725,7 @@ def test_subsequent_signup_with_language(db):
     factories.ProfileFactory.create(
         code='ABCDEF', name='Ms. Doe')
 
-    with mock.patch('portfoliyo.sms.hook.model.Post.create'):
+    with mock.patch.object(model.Post, 'create_many'):
         reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, 'ABCDEF Es')
 
     profile = utils.refresh(signup.family)
@@ -707,7 +749,7 @@ def test_subsequent_signup_when_teacher_already_in_village(db):
         from_profile=signup.family, to_profile=signup.student)
 
     rn_tgt = 'portfoliyo.tasks.record_notification.delay'
-    create_tgt = 'portfoliyo.sms.hook.model.Post.create'
+    create_tgt = 'portfoliyo.sms.hook.model.Post.create_many'
     with mock.patch(rn_tgt) as mock_record_notification:
         with mock.patch(create_tgt) as mock_create:
             reply = hook.receive_sms(phone, settings.DEFAULT_NUMBER, 'ABCDEF')
@@ -717,7 +759,7 @@ def test_subsequent_signup_when_teacher_already_in_village(db):
     # incoming text is recorded in village
     mock_create.assert_called_with(
         signup.family,
-        signup.student,
+        [signup.student],
         "ABCDEF",
         from_sms=True,
         )
@@ -937,6 +979,15 @@ class TestParseCode(object):
         assert hook.parse_code('') == (None, None, None)
 
 
+    def test_not_a_code(self):
+        """Doesn't look up words that can't be codes."""
+        with mock.patch('portfoliyo.sms.hook.codes.lookup') as mock_lookup:
+            assert hook.parse_code("Hello! foo") == (None, None, None)
+            assert hook.parse_code("I'm here") == (None, None, None)
+
+        assert not mock_lookup.called
+
+
     def test_lang(self, db):
         """Can specify language with teacher or group code."""
         g = factories.GroupFactory.create(
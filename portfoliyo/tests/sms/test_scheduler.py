@@ -0,0 +1,172 @@
+"""Tests for SMS send scheduling."""
+import time
+
+from django.conf import settings
+import mock
+import pytest
+
+from portfoliyo.sms import scheduler
+from portfoliyo.tests import utils
+
+
+
+@pytest.fixture
+def now(request):
+    """Freeze time (in whole seconds) for scheduler; return it."""
+    now = float(int(time.time()))
+    patcher = mock.patch('portfoliyo.sms.scheduler.time.time')
+    patcher.start().return_value = now
+    request.addfinalizer(patcher.stop)
+    return now
+
+
+
+@pytest.fixture
+def send_sms(request):
+    """Patch out send_sms task; return mock of its apply_async."""
+    patcher = mock.patch('portfoliyo.sms.scheduler.tasks.send_sms.apply_async')
+    request.addfinalizer(patcher.stop)
+    return patcher.start()
+
+
+
+def _countdowns(mock_apply_async):
+    """Return list of (args, countdown) from mock ``apply_async`` calls."""
+    return [
+        (args[0], kwargs['countdown'])
+        for args, kwargs in mock_apply_async.call_args_list
+        ]
+
+
+
+class TestSchedule(object):
+    def test_paces_per_source(self, redis, now, send_sms):
+        """Sends from each source number are spaced at the configured rate."""
+        messages = [
+            ('+13216540001', '+13336660000', 'one'),
+            ('+13216540002', '+13336660000', 'two'),
+            ('+13216540003', '+13336661111', 'three'),
+            ('+13216540004', '+13336660000', 'four'),
+            ]
+        with mock.patch.object(settings, 'SMS_BURST', 1):
+            backlogs = scheduler.schedule(messages)
+
+        assert _countdowns(send_sms) == [
+            (messages[0], 0),
+            (messages[1], 1),
+            (messages[3], 2),
+            (messages[2], 0),
+            ]
+        assert backlogs == {
+            '+13336660000': scheduler.Backlog(3, now + 3),
+            '+13336661111': scheduler.Backlog(1, now + 1),
+            }
+
+
+    def test_idempotency_key(self, redis, now, send_sms):
+        """Given a key, each send gets a key from it and message position."""
+        messages = [
+            ('+13216540001', '+13336660000', 'one'),
+            ('+13216540002', '+13336661111', 'two'),
+            ('+13216540003', '+13336660000', 'three'),
+            ]
+        scheduler.schedule(messages, idempotency_key='batch')
+
+        assert [
+            (args[0], args[1]) for args, kwargs in send_sms.call_args_list
+            ] == [
+            (messages[0], {'_idempotency_key': 'batch:0'}),
+            (messages[2], {'_idempotency_key': 'batch:2'}),
+            (messages[1], {'_idempotency_key': 'batch:1'}),
+            ]
+
+
+    def test_burst(self, redis, now, send_sms):
+        """The first SMS_BURST segments are not delayed."""
+        messages = [
+            ('+1321654000%s' % i, '+13336660000', 'hi') for i in range(4)]
+        with mock.patch.object(settings, 'SMS_BURST', 2):
+            scheduler.schedule(messages)
+
+        assert [c for m, c in _countdowns(send_sms)] == [0, 0, 1, 2]
+
+
+    def test_max_delay(self, redis, now, send_sms):
+        """No send is delayed longer than SMS_MAX_DELAY_SECONDS."""
+        messages = [
+            ('+1321654000%s' % i, '+13336660000', 'hi') for i in range(4)]
+        with mock.patch.object(settings, 'SMS_BURST', 1):
+            with mock.patch.object(settings, 'SMS_MAX_DELAY_SECONDS', 2):
+                scheduler.schedule(messages)
+
+        assert [c for m, c in _countdowns(send_sms)] == [0, 1, 2, 2]
+
+
+    def test_long_message_uses_multiple_slots(self, redis, now, send_sms):
+        """A message split into several segments occupies several slots."""
+        messages = [
+            ('+13216540001', '+13336660000', 'a' * 161),
+            ('+13216540002', '+13336660000', 'short'),
+            ]
+        with mock.patch.object(settings, 'SMS_BURST', 1):
+            backlogs = scheduler.schedule(messages)
+
+        assert [c for m, c in _countdowns(send_sms)] == [0, 2]
+        assert backlogs['+13336660000'].queued == 3
+
+
+    def test_later_batch_queued_behind_earlier(self, redis, now, send_sms):
+        """A second batch from the same number waits for the first."""
+        with mock.patch.object(settings, 'SMS_BURST', 1):
+            scheduler.schedule([('+13216540001', '+13336660000', 'one')])
+            scheduler.schedule([('+13216540002', '+13336660000', 'two')])
+
+        assert [c for m, c in _countdowns(send_sms)] == [0, 1]
+
+
+    def test_num_calls(self, redis, now, send_sms):
+        """Any number of messages and sources are scheduled in two calls."""
+        messages = [
+            ('+1321654000%s' % i, '+133366600%s' % (i % 3), 'hi')
+            for i in range(9)
+            ]
+        with utils.assert_num_calls(redis, 2):
+            scheduler.schedule(messages)
+
+
+    def test_empty(self, redis, send_sms):
+        """Scheduling no messages does nothing."""
+        with utils.assert_num_calls(redis, 0):
+            assert scheduler.schedule([]) == {}
+
+        assert not send_sms.call_count
+
+
+
+def test_backlogs(redis, now, send_sms):
+    """Reports queue depth and completion time for given source numbers."""
+    messages = [
+        ('+13216540001', '+13336660000', 'one'),
+        ('+13216540002', '+13336660000', 'two'),
+        ]
+    scheduler.schedule(messages)
+
+    assert scheduler.backlogs(['+13336660000', '+13336661111']) == {
+        '+13336660000': scheduler.Backlog(2, now + 2),
+        '+13336661111': scheduler.Backlog(0, now),
+        }
+
+
+
+def test_backlogs_all_sources(redis, now, send_sms):
+    """By default, reports all source numbers ever scheduled from."""
+    messages = [
+        ('+13216540001', '+13336660000', 'one'),
+        ('+13216540002', '+13336661111', 'two'),
+        ]
+    scheduler.schedule(messages)
+
+    assert scheduler.backlogs() == {
+        '+13336660000': scheduler.Backlog(1, now + 1),
+        '+13336661111': scheduler.Backlog(1, now + 1),
+        }
@@ -0,0 +1,20 @@
+"""Tests for backend loading."""
+import pytest
+
+from portfoliyo import backends
+from portfoliyo.sms.backends.console import ConsoleSMSBackend
+
+
+
+def test_get_backend():
+    """Returns the class at given dotted path."""
+    assert backends.get_backend(
+        'portfoliyo.sms.backends.console.ConsoleSMSBackend') is (
+        ConsoleSMSBackend)
+
+
+
+def test_get_backend_missing():
+    """Raises ImportError if the module can't be imported."""
+    with pytest.raises(ImportError):
+        backends.get_backend('portfoliyo.no_such_module.Backend')
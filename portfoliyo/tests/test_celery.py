@@ -1,8 +1,9 @@
 """Tests for our transactional Celery behavior."""
+import mock
 import pytest
 
-from portfoliyo import celery, tasks, xact
-from portfoliyo.tests import factories
+from portfoliyo import celery, idempotency, tasks, xact
+from portfoliyo.tests import factories, utils
 
 
 
@@ -36,6 +37,209 @@ class TestTransactionTask(object):
         assert len(sms.outbox) == 0
 
 
+    def test_tasks_coalesced(self):
+        """Pending calls of coalescing tasks are coalesced at commit."""
+        target = 'portfoliyo.pusher.events.student_added'
+        with mock.patch(target) as mock_student_added:
+            with xact.xact():
+                tasks.push_event.delay('student_added', 1, [2])
+                tasks.push_event.delay('student_added', 1, [3])
+                tasks.push_event.delay('student_added', 1, [2])
+
+        mock_student_added.assert_called_once_with(1, [2, 3])
+
+
+
+class FakeTask(celery.TransactionTask):
+    """Coalescing task class for testing commit-time coalescing."""
+    name = 'portfoliyo.tests.test_celery.fake'
+    coalesce = True
+    merge_arg = {'merge': 2}
+
+
+
+class TestTimestamps(object):
+    def test_records_timing(self):
+        """A timestamped call records its timings when executed."""
+        task = tasks.send_sms
+        target = 'portfoliyo.queues.record_task'
+        with mock.patch(target) as mock_record:
+            with mock.patch('portfoliyo.tasks.send_sms.run') as mock_run:
+                with mock.patch('portfoliyo.celery.time.time') as mock_time:
+                    mock_time.side_effect = [10.0, 12.5]
+                    task(1, 2, 3, **{celery.TIMESTAMPS_KWARG: (7.0, 8.0)})
+
+        mock_run.assert_called_once_with(1, 2, 3)
+        mock_record.assert_called_once_with(
+            'portfoliyo.tasks.send_sms', pending=1.0, wait=2.0, run=2.5)
+
+
+    def test_recording_failure(self):
+        """If recording timings fails, the task isn't affected."""
+        task = tasks.send_sms
+        target = 'portfoliyo.queues.record_task'
+        with mock.patch(target) as mock_record:
+            mock_record.side_effect = Exception("Redis is down")
+            with mock.patch('portfoliyo.tasks.send_sms.run') as mock_run:
+                mock_run.return_value = 'ok'
+                assert task(
+                    1, 2, 3, **{celery.TIMESTAMPS_KWARG: (7.0, 8.0)}) == 'ok'
+
+
+    def test_publish_stamps(self):
+        """Calls sent to a real queue are stamped with enqueue/commit times."""
+        task = tasks.send_sms
+        task.app.conf.CELERY_ALWAYS_EAGER = False
+        try:
+            with mock.patch.object(task, 'original_apply_async') as mock_apply:
+                task.publish((1,), {'a': 2}, {'countdown': 3}, 4.0, 5.0)
+        finally:
+            task.app.conf.CELERY_ALWAYS_EAGER = True
+
+        mock_apply.assert_called_once_with(
+            (1,),
+            {'a': 2, celery.TIMESTAMPS_KWARG: (4.0, 5.0)},
+            countdown=3,
+            )
+
+
+
+class TestIdempotent(object):
+    def call(self, task, *args, **kwargs):
+        """Call ``task`` as a worker would for message with ID ``some-id``."""
+        task.push_request(id='some-id', called_directly=False)
+        try:
+            return task(*args, **kwargs)
+        finally:
+            task.pop_request()
+
+
+    def test_skips_done(self, redis):
+        """A call of an idempotent task that was already done is skipped."""
+        task = tasks.send_sms
+        with mock.patch.object(task, 'run') as mock_run:
+            self.call(task, 1, 2, 3)
+            self.call(task, 1, 2, 3)
+
+        mock_run.assert_called_once_with(1, 2, 3)
+        assert idempotency.is_done('portfoliyo.tasks.send_sms:some-id')
+
+
+    def test_explicit_key(self, redis):
+        """A call can be given an explicit idempotency key."""
+        task = tasks.send_sms
+        kwargs = {celery.IDEMPOTENCY_KEY_KWARG: 'key'}
+        with mock.patch.object(task, 'run') as mock_run:
+            self.call(task, 1, 2, 3, **kwargs)
+            self.call(task, 1, 2, 3, **kwargs)
+
+        mock_run.assert_called_once_with(1, 2, 3)
+        assert idempotency.is_done('portfoliyo.tasks.send_sms:key')
+
+
+    def test_failure_not_done(self, redis):
+        """A call that fails isn't marked done."""
+        task = tasks.send_sms
+        with mock.patch.object(task, 'run') as mock_run:
+            mock_run.side_effect = ValueError()
+            with pytest.raises(ValueError):
+                self.call(task, 1, 2, 3)
+
+        assert not idempotency.is_done('portfoliyo.tasks.send_sms:some-id')
+
+
+    def test_not_idempotent(self):
+        """Calls of tasks that aren't idempotent are always run."""
+        task = tasks.mixpanel
+        with mock.patch.object(task, 'run') as mock_run:
+            self.call(task, 'track')
+            self.call(task, 'track')
+
+        assert mock_run.call_count == 2
+
+
+
+class TestCoalesceCalls(object):
+    def call(self, *args, **kwargs):
+        """Return a pending call of ``FakeTask`` with given arguments."""
+        return (FakeTask(), args, kwargs, {}, 1.0)
+
+
+    def coalesce(self, *calls):
+        """Coalesce given calls; return list of (args, kwargs) remaining."""
+        return [
+            (args, kwargs) for task, args, kwargs, options, enqueued_at
+            in celery.coalesce_calls(list(calls))
+            ]
+
+
+    def test_identical(self):
+        """Identical calls are sent only once."""
+        assert self.coalesce(
+            self.call('foo', 1), self.call('foo', 1)) == [(('foo', 1), {})]
+
+
+    def test_merge(self):
+        """Calls differing only in merge argument are merged."""
+        assert self.coalesce(
+            self.call('merge', 1, [2]),
+            self.call('merge', 3, [4]),
+            self.call('merge', 1, [5, 2]),
+            ) == [(('merge', 1, [2, 5]), {}), (('merge', 3, [4]), {})]
+
+
+    def test_merge_sets(self):
+        """Set-valued merge arguments are merged too."""
+        assert self.coalesce(
+            self.call('merge', 1, set([2])),
+            self.call('merge', 1, set([3])),
+            ) == [(('merge', 1, set([2, 3])), {})]
+
+
+    def test_no_merge_other_kind(self):
+        """Only calls with a merge argument for their kind are merged."""
+        calls = [self.call('foo', 1, [2]), self.call('foo', 1, [3])]
+
+        assert self.coalesce(*calls) == [(c[1], c[2]) for c in calls]
+
+
+    def test_no_merge_different_kwargs(self):
+        """Calls with different keyword arguments aren't merged."""
+        calls = [
+            self.call('merge', 1, [2], extra=1),
+            self.call('merge', 1, [3], extra=2),
+            ]
+
+        assert self.coalesce(*calls) == [(c[1], c[2]) for c in calls]
+
+
+    def test_no_coalesce_across_kinds(self):
+        """A call isn't coalesced past a call of the same task and new kind."""
+        calls = [
+            self.call('merge', 1, [2]),
+            self.call('other', 1, [2]),
+            self.call('merge', 1, [2]),
+            ]
+
+        assert self.coalesce(*calls) == [(c[1], c[2]) for c in calls]
+
+
+    def test_not_coalescing(self):
+        """Calls of tasks that don't set ``coalesce`` are all sent."""
+        task = tasks.send_sms
+        call = (task, ('+15555555555', '+15555555555', 'hi'), {}, {}, 1.0)
+
+        assert celery.coalesce_calls([call, call]) == [call, call]
+
+
+    def test_model_references(self):
+        """Equal model references are recognized as identical arguments."""
+        assert self.coalesce(
+            self.call('merge', celery.ModelReference('a', 'b', 1), [2]),
+            self.call('merge', celery.ModelReference('a', 'b', 1), [3]),
+            ) == [(('merge', celery.ModelReference('a', 'b', 1), [2, 3]), {})]
+
+
 
 class TestModelReference(object):
     def test_from_instance(self, db):
@@ -121,6 +325,74 @@ class TestModelReference(object):
 
 
 
+class TestModelReferenceLoad(object):
+    def test_load(self, db):
+        """Loads all referenced instances of a model with a single query."""
+        l = [factories.UserFactory.create(), factories.UserFactory.create()]
+        mrl = [celery.ModelReference('auth', 'user', u.pk) for u in l]
+        cache = {}
+
+        with utils.assert_num_queries(1):
+            celery.ModelReference.load([mrl[0], mrl, 3], cache)
+
+        assert cache == dict((mr.as_tuple(), u) for mr, u in zip(mrl, l))
+
+
+    def test_load_cached(self):
+        """Instances already in the cache aren't loaded again."""
+        mr = celery.ModelReference('auth', 'user', -1)
+        cache = {('auth', 'user', -1): 'foo!'}
+
+        celery.ModelReference.load([mr], cache)
+
+        assert cache == {('auth', 'user', -1): 'foo!'}
+
+
+    def test_load_select_related(self, db):
+        """Can select_related when loading instances of a model."""
+        p = factories.ProfileFactory.create()
+        mr = celery.ModelReference('users', 'profile', p.pk)
+        cache = {}
+
+        celery.ModelReference.load([mr], cache, {'users.profile': ['user']})
+
+        with utils.assert_num_queries(0):
+            assert cache[mr.as_tuple()].user == p.user
+
+
+    def test_load_missing_pk(self, db):
+        """If any instance cannot be found, raises DereferenceFailed."""
+        u = factories.UserFactory.create()
+        mrl = [
+            celery.ModelReference('auth', 'user', u.pk),
+            celery.ModelReference('auth', 'user', -1),
+            ]
+        with pytest.raises(celery.DereferenceFailed):
+            celery.ModelReference.load(mrl, {})
+
+
+    def test_load_ignore_missing(self, db):
+        """Can leave instances that can't be found out of the cache."""
+        u = factories.UserFactory.create()
+        mrl = [
+            celery.ModelReference('auth', 'user', u.pk),
+            celery.ModelReference('auth', 'user', -1),
+            ]
+        cache = {}
+
+        celery.ModelReference.load(mrl, cache, ignore_missing=True)
+
+        assert cache == {('auth', 'user', u.pk): u}
+
+
+    def test_load_bad_model_class(self):
+        """If model class cannot be found, raises DereferenceFailed."""
+        bad_mr = celery.ModelReference('no', 'such', 'class')
+        with pytest.raises(celery.DereferenceFailed):
+            celery.ModelReference.load([bad_mr], {})
+
+
+
 class TestModelTask(object):
     def test_dereference_fails(self):
         """If dereferencing fails, skips task execution and returns None."""
@@ -128,3 +400,46 @@ class TestModelTask(object):
         mt = celery.ModelTask()
 
         assert mt(bad_mr) is None
+
+
+    def test_dereference_missing_in_list(self, db):
+        """If any referenced instance is gone, skips task execution."""
+        u = factories.UserFactory.create()
+        mrl = [
+            celery.ModelReference('auth', 'user', u.pk),
+            celery.ModelReference('auth', 'user', -1),
+            ]
+        mt = celery.ModelTask()
+
+        assert mt(mrl) is None
+
+
+    def test_merged_missing_dropped(self, db):
+        """Instances missing from a merged list arg are just dropped."""
+        u = factories.UserFactory.create()
+        mrl = [
+            celery.ModelReference('auth', 'user', u.pk),
+            celery.ModelReference('auth', 'user', -1),
+            ]
+        mt = celery.ModelTask()
+        mt.coalesce = True
+        mt.merge_arg = {'foo': 1}
+        mt.run = mock.Mock()
+
+        mt('foo', mrl)
+
+        mt.run.assert_called_once_with('foo', [u])
+
+
+    def test_merged_missing_other_arg(self, db):
+        """An instance missing from another arg still skips the call."""
+        u = factories.UserFactory.create()
+        mt = celery.ModelTask()
+        mt.coalesce = True
+        mt.merge_arg = 0
+        mt.run = mock.Mock()
+
+        mt([celery.ModelReference('auth', 'user', u.pk)],
+           celery.ModelReference('auth', 'user', -1))
+
+        assert mt.run.call_count == 0
@@ -0,0 +1,194 @@
+"""Tests for API client registry and persistent connections."""
+import errno
+import httplib
+import socket
+
+import mock
+import pytest
+
+from portfoliyo import clients
+
+
+
+@pytest.fixture(autouse=True)
+def _reset_clients(request):
+    """Don't share registered API clients between tests."""
+    request.addfinalizer(clients.reset)
+
+
+
+class TestRegistry(object):
+    def test_get_reuses(self):
+        """A registered client is created once and then reused."""
+        factory = mock.Mock()
+        c = clients.get('foo', factory)
+
+        assert clients.get('foo', factory) is c
+        assert factory.call_count == 1
+
+
+    def test_get_new_key(self):
+        """A client registered with a different key is closed and replaced."""
+        old = clients.get('foo', mock.Mock(), key=1)
+        new = clients.get('foo', mock.Mock(), key=2)
+
+        assert new is not old
+        old.close.assert_called_once_with()
+
+
+    def test_reset(self):
+        """Resetting closes and forgets all clients."""
+        c = clients.get('foo', mock.Mock())
+        clients.reset()
+
+        c.close.assert_called_once_with()
+        assert clients.get('foo', mock.Mock()) is not c
+
+
+    def test_stats(self):
+        """Returns stats of registered clients' connections."""
+        clients.get('foo', lambda: clients.PersistentConnection('example.com'))
+
+        assert clients.stats()['foo']['requests'] == 0
+        assert clients.stats()['foo']['healthy']
+
+
+
+@pytest.fixture
+def https(request):
+    """Patch out HTTPSConnection class; return mock of it."""
+    patcher = mock.patch('portfoliyo.clients.httplib.HTTPSConnection')
+    request.addfinalizer(patcher.stop)
+    # idle connections are never found closed by the server unless a test
+    # says otherwise
+    select_patcher = mock.patch(
+        'portfoliyo.clients.select.select', return_value=([], [], []))
+    request.addfinalizer(select_patcher.stop)
+    select_patcher.start()
+    mock_class = patcher.start()
+    response = mock_class.return_value.getresponse.return_value
+    response.status = 200
+    response.read.return_value = 'content'
+    response.will_close = False
+    return mock_class
+
+
+
+class TestPersistentConnection(object):
+    def test_reuses_connection(self, https):
+        """Any number of requests are made over a single connection."""
+        conn = clients.PersistentConnection('example.com')
+        assert conn.request('GET', '/one') == (200, 'content')
+        assert conn.request('POST', '/two', 'body', {'X-Foo': 'bar'}) == (
+            200, 'content')
+
+        https.assert_called_once_with(
+            'example.com', 443, timeout=clients.TIMEOUT_SECONDS)
+        assert https.return_value.request.call_args_list == [
+            mock.call('GET', '/one', None, {}),
+            mock.call('POST', '/two', 'body', {'X-Foo': 'bar'}),
+            ]
+        assert conn.stats.requests == 2
+        assert conn.stats.connects == 1
+
+
+    def test_server_closes(self, https):
+        """If the server closes the connection, the next request reopens it."""
+        response = https.return_value.getresponse.return_value
+        response.will_close = True
+        conn = clients.PersistentConnection('example.com')
+        conn.request('GET', '/one')
+        conn.request('GET', '/two')
+
+        assert https.call_count == 2
+
+
+    def test_reopens_closed_connection(self, https):
+        """An idle connection closed by the server is reopened first."""
+        conn = clients.PersistentConnection('example.com')
+        conn.request('GET', '/one')
+        sock = https.return_value.sock
+        with mock.patch('portfoliyo.clients.select.select') as mock_select:
+            mock_select.side_effect = [([sock], [], []), ([], [], [])]
+            assert conn.request('GET', '/two') == (200, 'content')
+
+        assert conn.stats.connects == 2
+        assert conn.stats.failures == 0
+        assert https.return_value.request.call_count == 2
+
+
+    def test_retries_unsent(self, https):
+        """A request that failed to send on a reused connection is retried."""
+        conn = clients.PersistentConnection('example.com')
+        conn.request('GET', '/one')
+        https.return_value.request.side_effect = [
+            socket.error(errno.EPIPE, 'Broken pipe'), None]
+
+        assert conn.request('POST', '/two') == (200, 'content')
+        assert https.return_value.request.call_count == 3
+
+
+    def test_no_retry_on_reset_reading(self, https):
+        """A reset while reading the response is not retried."""
+        conn = clients.PersistentConnection('example.com')
+        conn.request('GET', '/one')
+        https.return_value.getresponse.side_effect = socket.error(
+            errno.ECONNRESET, 'Connection reset by peer')
+
+        with pytest.raises(socket.error):
+            conn.request('POST', '/two')
+
+        assert https.return_value.request.call_count == 2
+        assert conn.stats.failures == 1
+
+
+    def test_no_retry_on_empty_response(self, https):
+        """An empty response may come after the request was acted on."""
+        conn = clients.PersistentConnection('example.com')
+        conn.request('GET', '/one')
+        https.return_value.getresponse.side_effect = httplib.BadStatusLine(
+            '')
+
+        with pytest.raises(httplib.BadStatusLine):
+            conn.request('POST', '/two')
+
+        assert https.return_value.request.call_count == 2
+
+
+    def test_no_retry_on_timeout(self, https):
+        """A timed-out request may have reached the server; not retried."""
+        conn = clients.PersistentConnection('example.com')
+        conn.request('GET', '/one')
+        https.return_value.getresponse.side_effect = socket.timeout()
+
+        with pytest.raises(socket.timeout):
+            conn.request('POST', '/two')
+
+        assert https.return_value.request.call_count == 2
+        assert conn.stats.failures == 1
+
+
+    def test_no_retry_after_sent(self, https):
+        """A request failing after it was sent is not retried."""
+        conn = clients.PersistentConnection('example.com')
+        conn.request('GET', '/one')
+        https.return_value.getresponse.side_effect = httplib.IncompleteRead(
+            'partial')
+
+        with pytest.raises(httplib.IncompleteRead):
+            conn.request('POST', '/two')
+
+        assert https.return_value.request.call_count == 2
+
+
+    def test_no_retry_on_new_connection(self, https):
+        """A request failing on a new connection is not retried."""
+        https.return_value.request.side_effect = socket.error()
+        conn = clients.PersistentConnection('example.com')
+
+        with pytest.raises(socket.error):
+            conn.request('GET', '/one')
+
+        assert https.return_value.request.call_count == 1
+        assert conn.stats.failures == 1
+        assert not conn.stats.healthy
@@ -0,0 +1,55 @@
+"""Tests for calls deferred until transaction commit."""
+import mock
+
+from portfoliyo import deferred, xact
+
+
+
+def test_no_transaction():
+    """With no transaction in progress, the call is made immediately."""
+    func = mock.Mock()
+    deferred.on_commit(func, 1, 2)
+
+    func.assert_called_once_with(1, 2)
+
+
+
+def test_called_on_commit():
+    """Calls are made in order once the transaction commits."""
+    func = mock.Mock()
+    with xact.xact():
+        deferred.on_commit(func, 1)
+        deferred.on_commit(func, 2)
+        assert func.call_count == 0
+
+    assert func.call_args_list == [mock.call(1), mock.call(2)]
+
+
+
+def test_discarded_on_rollback():
+    """If the transaction is rolled back, pending calls are discarded."""
+    class TestException(Exception):
+        pass
+    func = mock.Mock()
+    try:
+        with xact.xact():
+            deferred.on_commit(func, 1)
+            raise TestException()
+    except TestException:
+        pass
+
+    assert func.call_count == 0
+
+
+
+def test_failure_logged():
+    """A failing call is logged and doesn't prevent later calls."""
+    failing = mock.Mock(side_effect=ValueError())
+    func = mock.Mock()
+    with mock.patch('portfoliyo.deferred.logger') as mock_logger:
+        with xact.xact():
+            deferred.on_commit(failing)
+            deferred.on_commit(func)
+
+    assert mock_logger.warning.call_count == 1
+    func.assert_called_once_with()
@@ -21,3 +21,38 @@ def test_send_templated_multipart():
     assert msg.subject == 'third here'
     assert msg.body == 'first'
     assert msg.alternatives == [('second', 'text/html')]
+
+
+
+def test_send_messages():
+    """Sends all messages over a single connection; returns those sent."""
+    messages = [
+        email.make_multipart('subj', 'text', 'html', ['%s@example.com' % i])
+        for i in range(3)
+        ]
+    with mock.patch('portfoliyo.email.get_connection') as mock_get_conn:
+        conn = mock_get_conn.return_value
+        conn.open.return_value = True
+        conn.send_messages.side_effect = [1, 0, 1]
+        assert email.send_messages(messages) == [messages[0], messages[2]]
+
+    assert conn.send_messages.call_args_list == [
+        mock.call([m]) for m in messages]
+    conn.close.assert_called_once_with()
+
+
+
+def test_send_messages_no_connection():
+    """If no connection can be opened (failing silently), none are sent."""
+    messages = [
+        email.make_multipart('subj', 'text', 'html', ['%s@example.com' % i])
+        for i in range(3)
+        ]
+    with mock.patch('portfoliyo.email.get_connection') as mock_get_conn:
+        conn = mock_get_conn.return_value
+        conn.open.return_value = None
+        conn.send_messages.return_value = None
+        assert email.send_messages(messages, fail_silently=True) == []
+
+    assert conn.send_messages.call_count == 1
+    assert conn.close.call_count == 0
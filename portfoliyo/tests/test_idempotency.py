@@ -0,0 +1,40 @@
+"""Tests for idempotency keys."""
+import mock
+
+from portfoliyo import idempotency
+
+
+
+def test_once(redis):
+    """A side effect is only done once per key."""
+    func = mock.Mock()
+
+    assert idempotency.once('foo', func, 1, a=2)
+    assert not idempotency.once('foo', func, 1, a=2)
+
+    func.assert_called_once_with(1, a=2)
+    assert idempotency.is_done('foo')
+
+
+
+def test_once_failure(redis):
+    """A side effect that fails isn't marked done."""
+    func = mock.Mock(side_effect=ValueError())
+
+    try:
+        idempotency.once('foo', func)
+    except ValueError:
+        pass
+
+    assert not idempotency.is_done('foo')
+
+
+
+def test_once_no_key():
+    """A side effect with no key is always done (and Redis isn't touched)."""
+    func = mock.Mock()
+
+    assert idempotency.once(None, func)
+    assert idempotency.once(None, func)
+
+    assert func.call_count == 2
@@ -0,0 +1,77 @@
+"""Tests for Celery task queues and latency probes."""
+from django.test.utils import override_settings
+import mock
+
+from portfoliyo import queues
+from portfoliyo.celery import celery
+
+
+
+def test_routes():
+    """Tasks are routed to their configured queues."""
+    assert celery.conf.CELERY_ROUTES['portfoliyo.tasks.send_sms'] == {
+        'queue': 'sms'}
+
+
+
+@override_settings(PORTFOLIYO_TASK_QUEUES={'a': 'foo', 'b': 'bar', 'c': 'foo'})
+def test_all_queues():
+    """All configured queues, plus the default queue."""
+    assert queues.all_queues() == ['bar', 'celery', 'foo']
+
+
+
+@override_settings(PORTFOLIYO_TASK_QUEUES={'a': 'foo'})
+def test_probe():
+    """Sends a latency probe stamped with the current time into each queue."""
+    target = 'portfoliyo.tasks.record_queue_latency.apply_async'
+    with mock.patch(target) as mock_apply_async:
+        with mock.patch('portfoliyo.queues.time.time') as mock_time:
+            mock_time.return_value = 10.0
+            queues.probe()
+
+    assert mock_apply_async.call_args_list == [
+        mock.call(('celery', 10.0), queue='celery'),
+        mock.call(('foo', 10.0), queue='foo'),
+        ]
+
+
+
+def test_record(redis):
+    """Records latency of probe, and when it was measured."""
+    with mock.patch('portfoliyo.queues.time.time') as mock_time:
+        mock_time.return_value = 12.5
+        queues.record('foo', 10.0)
+
+    assert queues.latencies() == {'foo': (2.5, 12)}
+
+
+
+def test_task_timings(redis):
+    """Task timings are aggregated into histograms over the given hours."""
+    with mock.patch('portfoliyo.queues.time.time') as mock_time:
+        mock_time.return_value = 3600 * 10
+        queues.record_task('some.task', pending=0, wait=0.02, run=1000)
+        mock_time.return_value = 3600 * 11
+        queues.record_task('some.task', pending=0, wait=0.02, run=3)
+        timings = queues.task_timings(hours=2)
+        assert queues.task_timings(hours=1)['some.task']['run'] == {10.0: 1}
+
+    assert timings == {
+        'some.task': {
+            'pending': {0.01: 2},
+            'wait': {0.025: 2},
+            'run': {10.0: 1, queues.OVERFLOW: 1},
+            },
+        }
+
+
+
+def test_percentile():
+    """Percentile is upper bound of the bucket it falls in."""
+    histogram = {0.1: 5, 1.0: 4, queues.OVERFLOW: 1}
+
+    assert queues.percentile(histogram, 50) == 0.1
+    assert queues.percentile(histogram, 90) == 1.0
+    assert queues.percentile(histogram, 99) == queues.OVERFLOW
+    assert queues.percentile({}, 50) is None
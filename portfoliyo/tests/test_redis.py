@@ -33,6 +33,14 @@ def test_sets_convert_to_str(redis):
     assert redis.smembers('foo') == set()
 
 
+def test_sets_multiple_values(redis):
+    """Can add/remove multiple set values at once; returns number changed."""
+    assert redis.sadd('foo', 'bar', 'baz') == 2
+    assert redis.sadd('foo', 'bar', 'qux') == 1
+    assert redis.srem('foo', 'bar', 'quux') == 1
+    assert redis.smembers('foo') == {'baz', 'qux'}
+
+
 def test_delete(redis):
     """Test in-memory implementation of Redis delete."""
     redis.delete('foo')
@@ -46,6 +54,7 @@ def test_incr(redis):
     """Test in-memory implementation of Redis incr."""
     assert redis.incr('foo') == 1
     assert redis.incr('foo') == 2
+    assert redis.incr('foo', 3) == 5
 
 
 def test_pipeline(redis):
@@ -60,6 +69,31 @@ def test_pipeline(redis):
     assert redis.incr('bar') == 2
 
 
+def test_transaction(redis):
+    """Test in-memory implementation of Redis WATCH/MULTI transactions."""
+    redis.incr('foo')
+    def _transaction(p):
+        # commands before MULTI are executed immediately
+        val = int(p.get('foo'))
+        p.multi()
+        p.incr('bar', val + 1)
+
+    assert redis.transaction(_transaction, 'foo') == [2]
+    assert int(redis.get('bar')) == 2
+
+
+def test_script(redis):
+    """Scripts run as Lua on real Redis, or as their emulation in-memory."""
+    from portfoliyo.redis import Script
+    def _emulation(client, keys, args):
+        return client.incr(keys[0], int(args[0]))
+    script = Script(
+        "return redis.call('INCRBY', KEYS[1], ARGV[1])", _emulation)
+
+    assert script(keys=['foo'], args=[2]) == 2
+    assert int(redis.get('foo')) == 2
+
+
 def test_hashes(redis):
     """Test in-memory implementation of Redis hashes."""
     redis.hmset('foo', {'one': 'two', 'two': 2})
@@ -68,6 +102,23 @@ def test_hashes(redis):
     assert redis.hgetall('foo') == {'one': 'three', 'two': '2', 'four': 'five'}
 
 
+def test_hash_fields(redis):
+    """Test in-memory implementation of single-field Redis hash commands."""
+    assert redis.hset('foo', 'one', 1) == 1
+    assert redis.hset('foo', 'one', 2) == 0
+    assert redis.hsetnx('foo', 'one', 3) == 0
+    assert redis.hsetnx('foo', 'two', 3) == 1
+    assert redis.hincrby('foo', 'two', 4) == 7
+    assert redis.hincrby('foo', 'three', -1) == -1
+
+    assert redis.hget('foo', 'one') == '2'
+    assert redis.hget('foo', 'four') is None
+    assert redis.hgetall('foo') == {'one': '2', 'two': '7', 'three': '-1'}
+    assert redis.hmget('foo', ['one', 'four'], 'two') == ['2', None, '7']
+    assert redis.hdel('foo', 'one', 'four') == 1
+    assert redis.hgetall('foo') == {'two': '7', 'three': '-1'}
+
+
 def test_sorted_sets(redis):
     """Test in-memory implementation of Redis sorted sets."""
     redis.zadd('foo', 7, 'five')
@@ -82,6 +133,25 @@ def test_sorted_sets(redis):
         '0', 'three', 'five', 'eight']
 
 
+def test_sorted_set_ties(redis):
+    """Members with equal scores are ordered lexicographically."""
+    redis.zadd('foo', 1, 'b')
+    redis.zadd('foo', 1, 'a')
+
+    assert redis.zrangebyscore('foo', '-inf', '+inf') == ['a', 'b']
+
+
+def test_sorted_set_remove_range(redis):
+    """Can remove by score range, with exclusive bounds."""
+    redis.zadd('foo', 1, 'one')
+    redis.zadd('foo', 2, 'two')
+    redis.zadd('foo', 3, 'three')
+
+    assert redis.zrangebyscore('foo', '(1', 3) == ['two', 'three']
+    assert redis.zremrangebyscore('foo', '-inf', '(3') == 2
+    assert redis.zrangebyscore('foo', '-inf', '+inf') == ['three']
+
+
 def test_expireat(redis):
     """Test in-memory implementation of expireat."""
     with mock.patch('portfoliyo.redis.time') as mock_time:
@@ -101,6 +171,24 @@ def test_expireat_timestamp_must_be_integer(redis):
         redis.expireat('foo', 10.231)
 
 
+def test_setex(redis):
+    """Test in-memory implementation of setex."""
+    redis.setex('foo', 60, 1)
+
+    assert redis.get('foo') == '1'
+
+
+def test_ttl(redis):
+    """Test in-memory implementation of ttl."""
+    redis.setnx('foo', 1)
+    assert redis.ttl('foo') is None
+    redis.expire('foo', 60)
+    assert 0 < redis.ttl('foo') <= 60
+    redis.delete('foo')
+    redis.setnx('foo', 1)
+    assert redis.ttl('foo') is None
+
+
 def test_copies(redis):
     """hgetall returned dictionaries are copies of stored data."""
     redis.hmset('foo', {'one': 'one'})
@@ -1,17 +1,73 @@
 """Tests for Celery tasks."""
+from django.conf import settings
 import mock
+import pytest
 
 from portfoliyo import tasks
 
 
 
 def test_check_for_pending_notifications():
-    """Triggers send_notification_email task for all pending profile IDs."""
-    target1 = 'portfoliyo.tasks.send_notification_email'
+    """Triggers send_notification_emails task in batches of pending IDs."""
+    target1 = 'portfoliyo.tasks.send_notification_emails'
     target2 = 'portfoliyo.notifications.store.pending_profile_ids'
-    with mock.patch(target1) as mock_send_notification:
+    with mock.patch(target1) as mock_send_notifications:
         with mock.patch(target2) as mock_pending_profile_ids:
-            mock_pending_profile_ids.return_value = [5]
-            tasks.check_for_pending_notifications.delay()
+            with mock.patch.object(settings, 'NOTIFICATION_BATCH_SIZE', 2):
+                mock_pending_profile_ids.return_value = [5, 6, 7]
+                tasks.check_for_pending_notifications.delay()
 
-    mock_send_notification.delay.assert_called_once_with(5)
+    assert mock_send_notifications.delay.call_args_list == [
+        mock.call([5, 6]), mock.call([7])]
+
+
+
+def test_send_sms_batch():
+    """Hands the batch of messages to the SMS scheduler."""
+    messages = [('+13216540987', '+13336660000', 'hi')]
+    with mock.patch('portfoliyo.sms.scheduler.schedule') as mock_schedule:
+        tasks.send_sms_batch.delay(messages)
+
+    mock_schedule.assert_called_once_with(messages, idempotency_key=None)
+
+
+
+def test_send_sms_retries():
+    """If the SMS provider can't be reached, retries with backoff."""
+    import socket
+    task = tasks.send_sms
+    error = socket.error('connection refused')
+    error.unsent = True
+    task.push_request(id='some-id', retries=2, called_directly=False)
+    try:
+        with mock.patch('portfoliyo.sms.send') as mock_send:
+            mock_send.side_effect = error
+            with mock.patch.object(task, 'retry') as mock_retry:
+                mock_retry.return_value = Exception()
+                try:
+                    task('+13216540987', '+13336660000', 'hi')
+                except Exception as e:
+                    assert e is mock_retry.return_value
+    finally:
+        task.pop_request()
+
+    mock_retry.assert_called_once_with(exc=error, countdown=40)
+
+
+
+def test_send_sms_no_retry_on_timeout():
+    """If the SMS may have been sent (e.g. timeout), it is not resent."""
+    import socket
+    task = tasks.send_sms
+    task.push_request(id='some-id', retries=0, called_directly=False)
+    try:
+        with mock.patch('portfoliyo.sms.send') as mock_send:
+            mock_send.side_effect = socket.timeout()
+            with mock.patch.object(task, 'retry') as mock_retry:
+                with pytest.raises(socket.timeout):
+                    task('+13216540987', '+13336660000', 'hi')
+    finally:
+        task.pop_request()
+
+    assert mock_send.call_count == 1
+    assert mock_retry.call_count == 0
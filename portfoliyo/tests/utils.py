@@ -64,3 +64,18 @@ def assert_num_calls(redis, num):
     total_calls = redis.num_calls - start_calls
     assert total_calls == num, 'Expected %s redis quer%s, saw %s' % (
         num, 'y' if num == 1 else 'ies', total_calls)
+
+
+
+class count_queries(object):
+    """Context manager: count queries executed within block (``num``)."""
+    def __enter__(self):
+        self.old_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        self.start = len(connection.queries)
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.num = len(connection.queries) - self.start
+        connection.use_debug_cursor = self.old_debug_cursor
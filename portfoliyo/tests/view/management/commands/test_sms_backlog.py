@@ -0,0 +1,43 @@
+from cStringIO import StringIO
+
+from django.core.management import call_command
+import mock
+
+from portfoliyo.sms import scheduler
+
+
+
+def test_reports_backlogs(redis):
+    mock_stdout = StringIO()
+    messages = [
+        ('+13216540001', '+13336660000', 'one'),
+        ('+13216540002', '+13336660000', 'two'),
+        ('+13216540003', '+13336661111', 'three'),
+        ]
+    with mock.patch('time.time') as mock_time:
+        mock_time.return_value = 1000000.0
+        with mock.patch('portfoliyo.sms.scheduler.tasks.send_sms'):
+            scheduler.schedule(messages)
+        mock_time.return_value = 1000001.0
+
+        call_command('sms_backlog', stdout=mock_stdout)
+
+    mock_stdout.seek(0)
+    assert mock_stdout.read().splitlines() == [
+        "SMS backlog per source number:",
+        "  +13336660000          1 segments, done in 1s",
+        "  +13336661111          0 segments, done in 0s",
+        ]
+
+
+
+def test_nothing_scheduled(redis):
+    mock_stdout = StringIO()
+
+    call_command('sms_backlog', stdout=mock_stdout)
+
+    mock_stdout.seek(0)
+    assert mock_stdout.read().splitlines() == [
+        "SMS backlog per source number:",
+        "  No SMS scheduled.",
+        ]
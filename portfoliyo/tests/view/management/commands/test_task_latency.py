@@ -0,0 +1,36 @@
+from cStringIO import StringIO
+
+from django.core.management import call_command
+from django.test.utils import override_settings
+import mock
+
+from portfoliyo import queues
+
+
+
+@override_settings(PORTFOLIYO_TASK_QUEUES={'a': 'foo'})
+def test_reports_percentiles(redis):
+    mock_stdout = StringIO()
+    with mock.patch('time.time') as mock_time:
+        mock_time.return_value = 1000000.0
+        for i in range(9):
+            queues.record_task('some.task', pending=0.001, wait=0.2, run=1.5)
+        queues.record_task('some.task', pending=0.001, wait=0.2, run=2000)
+        queues.record('foo', 999999.5)
+        mock_time.return_value = 1000030.0
+
+        call_command('task_latency', stdout=mock_stdout)
+
+    mock_stdout.seek(0)
+    assert mock_stdout.read().splitlines() == [
+        "Task timings over the last 1 hour(s), in seconds:",
+        "some.task",
+        "                  count      p50      p90      p99",
+        "  pending            10   <=0.01   <=0.01   <=0.01",
+        "  wait               10   <=0.25   <=0.25   <=0.25",
+        "  run                10    <=2.5    <=2.5     >900",
+        "",
+        "Queue latency, in seconds:",
+        "  celery        unknown",
+        "  foo             0.500 (measured 30s ago)",
+        ]
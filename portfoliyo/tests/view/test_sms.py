@@ -6,6 +6,7 @@ from django.test import RequestFactory
 from django.test.utils import override_settings
 import mock
 
+from portfoliyo import model
 from portfoliyo.view import sms
 
 
@@ -93,6 +94,42 @@ def test_splits_long_reply(mock_receive_sms, mock_validate):
     assert xml[1].text == '...' + ("a" * 4)
 
 
+@override_settings(TWILIO_AUTH_TOKEN='foo', SMS_ASYNC_RECEIVE=True)
+@mock.patch('portfoliyo.view.sms.RequestValidator.validate')
+@mock.patch('portfoliyo.view.sms.tasks.receive_sms')
+@mock.patch('portfoliyo.sms.hook.receive_sms')
+def test_async_receive(
+        mock_receive_sms, mock_receive_task, mock_validate, db):
+    """In async mode, stores SMS for a worker and responds empty."""
+    mock_validate.return_value = True
+
+    response = sms.twilio_receive(signed_request(data(MessageSid='SM1')))
+    xml = ElementTree.XML(response.content)
+    inbound = model.InboundSms.objects.get()
+
+    assert response.status_code == 200
+    assert not list(xml)
+    assert (inbound.sid, inbound.source, inbound.to, inbound.body) == (
+        'SM1', 'from', 'to', 'body')
+    mock_receive_task.delay.assert_called_once_with(inbound.id)
+    assert not mock_receive_sms.called
+
+
+@override_settings(TWILIO_AUTH_TOKEN='foo', SMS_ASYNC_RECEIVE=True)
+@mock.patch('portfoliyo.view.sms.RequestValidator.validate')
+@mock.patch('portfoliyo.view.sms.tasks.receive_sms')
+def test_async_receive_duplicate(mock_receive_task, mock_validate, db):
+    """A retried request for an already-stored SMS is dropped."""
+    mock_validate.return_value = True
+
+    sms.twilio_receive(signed_request(data(MessageSid='SM1')))
+    response = sms.twilio_receive(signed_request(data(MessageSid='SM1')))
+
+    assert response.status_code == 200
+    assert model.InboundSms.objects.count() == 1
+    assert mock_receive_task.delay.call_count == 1
+
+
 def test_requires_TWILIO_AUTH_TOKEN(monkeypatch):
     """If TWILIO_AUTH_TOKEN setting is not set, returns 403."""
     if hasattr(settings, 'TWILIO_AUTH_TOKEN'):
@@ -1056,7 +1056,7 @@ class TestCreatePost(object):
             from_profile__user__is_active=True,
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             response = no_csrf_client.post(
                 self.url(rel.student),
@@ -1068,7 +1068,7 @@ class TestCreatePost(object):
         post = response.json['objects'][0]
         assert post['sms_recipients'] == ['Recipient']
         mock_send_sms.assert_called_with(
-            "+13216540987", "+13336660000", "foo --Mr. Doe")
+            [("+13216540987", "+13336660000", "foo --Mr. Doe")])
 
 
     def test_create_meeting_with_present_and_extra_names(self, no_csrf_client):
@@ -1110,7 +1110,7 @@ class TestCreatePost(object):
             from_profile__user__is_active=True,
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             response = no_csrf_client.post(
                 self.url(group=group),
@@ -1122,7 +1122,7 @@ class TestCreatePost(object):
         post = response.json['objects'][0]
         assert post['sms_recipients'] == ['Recipient']
         mock_send_sms.assert_called_with(
-            "+13216540987", "+13336660000", "foo --Mr. Doe")
+            [("+13216540987", "+13336660000", "foo --Mr. Doe")])
 
 
     def test_all_students_post_sms_all(self, no_csrf_client):
@@ -1137,7 +1137,7 @@ class TestCreatePost(object):
             from_profile__user__is_active=True,
             )
 
-        target = 'portfoliyo.model.village.models.tasks.send_sms.delay'
+        target = 'portfoliyo.model.village.models.tasks.send_sms_batch.delay'
         with mock.patch(target) as mock_send_sms:
             response = no_csrf_client.post(
                 self.url(),
@@ -1149,7 +1149,7 @@ class TestCreatePost(object):
         post = response.json['objects'][0]
         assert post['sms_recipients'] == ['Recipient']
         mock_send_sms.assert_called_with(
-            "+13216540987", "+13336660000", "foo --Mr. Doe")
+            [("+13216540987", "+13336660000", "foo --Mr. Doe")])
 
 
     def test_create_group_post(self, no_csrf_client):
@@ -1225,6 +1225,26 @@ class TestCreatePost(object):
             }
 
 
+    def test_length_limit_unicode(self, no_csrf_client):
+        """Posts requiring UCS-2 SMS encoding have a lower length limit."""
+        rel = factories.RelationshipFactory.create(
+            from_profile__name='Fred')
+
+        response = no_csrf_client.post(
+            self.url(rel.student),
+            {'text': u'¿Qué tú? ' + 'f' * 60},
+            user=rel.elder.user,
+            headers={'X-Requested-With': 'XMLHttpRequest'},
+            status=400,
+            )
+
+        # length limit is 70 - len(' --Fred')
+        assert response.json == {
+            'success': False,
+            'error': "Posts are limited to 63 characters."
+            }
+
+
     def test_note_with_attachments(self, no_csrf_client):
         """Can create a note type post with attachments."""
         rel = factories.RelationshipFactory.create()
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management import BaseCommand
+
+from portfoliyo.sms import scheduler
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Report queued SMS segments and projected completion time for each "
+        "source number."
+        )
+
+
+    def handle(self, *args, **options):
+        now = time.time()
+        backlogs = scheduler.backlogs()
+        self.stdout.write("SMS backlog per source number:\n")
+        for source in sorted(backlogs):
+            backlog = backlogs[source]
+            self.stdout.write(
+                "  %-16s %6s segments, done in %ds\n" % (
+                    source,
+                    backlog.queued,
+                    max(backlog.completes_at - now, 0),
+                    )
+                )
+        if not backlogs:
+            self.stdout.write("  No SMS scheduled.\n")
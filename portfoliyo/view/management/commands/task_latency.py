@@ -0,0 +1,74 @@
+from optparse import make_option
+import time
+
+from django.core.management import BaseCommand
+
+from portfoliyo import queues
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Report percentiles of Celery task timings (time pending transaction "
+        "commit, waiting in queue, and running) and latest queue latencies."
+        )
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--hours',
+            type='int',
+            default=1,
+            help="Report task timings over this many past hours (default 1).",
+            ),
+        )
+    percentiles = [50, 90, 99]
+
+
+    def handle(self, *args, **options):
+        hours = options['hours']
+        timings = queues.task_timings(hours)
+        self.stdout.write(
+            "Task timings over the last %s hour(s), in seconds:\n" % hours)
+        header = "  %-12s %8s" + " %8s" * len(self.percentiles) + "\n"
+        for task_name in sorted(timings):
+            self.stdout.write("%s\n" % task_name)
+            self.stdout.write(
+                header % (
+                    ("", "count") +
+                    tuple("p%s" % pct for pct in self.percentiles)
+                    )
+                )
+            for metric in queues.METRICS:
+                histogram = timings[task_name].get(metric, {})
+                self.stdout.write(
+                    header % (
+                        (metric, sum(histogram.values())) +
+                        tuple(
+                            _format_bound(queues.percentile(histogram, pct))
+                            for pct in self.percentiles
+                            )
+                        )
+                    )
+        if not timings:
+            self.stdout.write("  No tasks recorded.\n")
+
+        self.stdout.write("\nQueue latency, in seconds:\n")
+        now = time.time()
+        latencies = queues.latencies()
+        for queue in queues.all_queues():
+            if queue in latencies:
+                latency, measured_at = latencies[queue]
+                self.stdout.write(
+                    "  %-12s %8.3f (measured %ds ago)\n" % (
+                        queue, latency, now - measured_at))
+            else:
+                self.stdout.write("  %-12s %8s\n" % (queue, "unknown"))
+
+
+
+def _format_bound(bound):
+    """Format histogram bucket upper bound for display."""
+    if bound is None:
+        return "-"
+    if bound == queues.OVERFLOW:
+        return ">%s" % queues.BUCKETS[-1]
+    return "<=%s" % bound
@@ -9,8 +9,8 @@ from django.views.decorators import http, csrf
 from twilio import twiml
 from twilio.util import RequestValidator
 
-from portfoliyo import xact
-from portfoliyo.sms import hook
+from portfoliyo import model, tasks, xact
+from portfoliyo.sms import encoding, hook
 from portfoliyo.sms.base import split_sms
 
 
@@ -47,10 +47,25 @@ def twilio(viewfunc):
 @http.require_POST
 @twilio
 def twilio_receive(request):
-    """Receive an SMS via Twilio."""
+    """
+    Receive an SMS via Twilio.
+
+    With ``SMS_ASYNC_RECEIVE``, just store the SMS (ignoring Twilio's retries
+    of a message already stored) for a worker to process, and acknowledge it
+    with an empty response; any reply is sent as an outbound SMS.
+
+    """
     source = request.POST['From']
     to = request.POST['To']
     body = request.POST['Body']
+    sid = request.POST.get('MessageSid')
+
+    if settings.SMS_ASYNC_RECEIVE and sid:
+        with xact.xact():
+            inbound = model.InboundSms.record(sid, source, to, body)
+            if inbound is not None:
+                tasks.receive_sms.delay(inbound.id)
+        return twiml.Response()
 
     with xact.xact():
         reply = hook.receive_sms(source, to, body)
@@ -58,7 +73,7 @@ def twilio_receive(request):
     response = twiml.Response()
 
     if reply:
-        for chunk in split_sms(reply):
+        for chunk in split_sms(encoding.prepare(reply)):
             response.sms(chunk)
 
     return response
@@ -6,6 +6,7 @@ from django.views.generic.simple import direct_to_template
 from .. import admin
 from ..api.versions import api_v1
 from ..pusher import auth as pusher_views
+from ..pusher import webhooks as pusher_webhooks
 from .decorators import login_required
 from . import home as home_views
 from . import notifications as notifications_views
@@ -18,6 +19,7 @@ admin.autodiscover()
 urlpatterns = patterns(
     '',
     url(r'^pusher/auth$', pusher_views.pusher_auth),
+    url(r'^pusher/webhook$', pusher_webhooks.pusher_webhook),
     url(r'^_twilio_hook/$', sms_views.twilio_receive),
     url(r'^_twilio_voice/$', sms_views.twilio_voice),
     url(r'^$', home_views.home, name='home'),
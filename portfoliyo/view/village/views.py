@@ -14,6 +14,7 @@ from django.views.decorators.http import require_POST
 from unidecode import unidecode
 
 from portfoliyo import formats, model, pdf, serializers, xact
+from portfoliyo.sms import encoding as sms_encoding
 from portfoliyo.view import tracking
 from .. import home
 from ..ajax import ajax
@@ -396,22 +397,20 @@ def village(request, student_id):
     if rel and not request.impersonating:
         model.unread.mark_village_read(rel.student, rel.elder)
 
-    return TemplateResponse(
-        request,
-        'village/post_list/village.html',
-        {
-            'student': student,
-            'group': group,
-            'relationship': rel,
-            'elders': model.contextualized_elders(
-                student.elder_relationships).order_by('school_staff', 'name'),
-            'read_only': rel is None,
-            'posts': posts,
-            'post_char_limit': model.post_char_limit(rel) if rel else 0,
-            'posting_url': reverse(
-                'create_post', kwargs={'student_id': student.id}),
-            },
-        )
+    context = {
+        'student': student,
+        'group': group,
+        'relationship': rel,
+        'elders': model.contextualized_elders(
+            student.elder_relationships).order_by('school_staff', 'name'),
+        'read_only': rel is None,
+        'posts': posts,
+        'posting_url': reverse(
+            'create_post', kwargs={'student_id': student.id}),
+        }
+    context.update(_char_limit_context(rel))
+
+    return TemplateResponse(request, 'village/post_list/village.html', context)
 
 
 
@@ -429,18 +428,39 @@ def group(request, group_id=None):
             )
         posting_url = reverse('create_post', kwargs={'group_id': group.id})
 
-    return TemplateResponse(
-        request,
-        'village/post_list/group.html',
-        {
-            'group': group,
-            'elders': model.contextualized_elders(
-                group.all_elders).order_by('school_staff', 'name'),
-            'posts': _get_posts(request.user.profile, group=group),
-            'post_char_limit': model.post_char_limit(request.user.profile),
-            'posting_url': posting_url,
-            },
-        )
+    context = {
+        'group': group,
+        'elders': model.contextualized_elders(
+            group.all_elders).order_by('school_staff', 'name'),
+        'posts': _get_posts(request.user.profile, group=group),
+        'posting_url': posting_url,
+        }
+    context.update(_char_limit_context(request.user.profile))
+
+    return TemplateResponse(request, 'village/post_list/group.html', context)
+
+
+
+def _char_limit_context(elder_or_rel):
+    """
+    Template context for the post form's character counter.
+
+    The limit for posts needing UCS-2 SMS encoding is given separately, as are
+    the character transliterations (as JSON) if ``SMS_TRANSLITERATE`` is on,
+    so the counter can tell which limit applies as the user types. With no
+    ``elder_or_rel`` (read-only view), the limits are zero.
+
+    """
+    if elder_or_rel is None:
+        return {'post_char_limit': 0, 'post_unicode_char_limit': 0}
+    transliterations = (
+        sms_encoding.transliterations() if settings.SMS_TRANSLITERATE else {})
+    return {
+        'post_char_limit': model.post_char_limit(elder_or_rel),
+        'post_unicode_char_limit': model.post_char_limit(
+            elder_or_rel, encoding=sms_encoding.UCS2),
+        'sms_transliterations': json.dumps(transliterations),
+        }
 
 
 
@@ -541,8 +561,8 @@ def create_post(request, student_id=None, group_id=None):
 
     text = request.POST['text']
     sequence_id = request.POST.get('author_sequence_id')
-    limit = model.post_char_limit(rel or request.user.profile)
-    if len(text) > limit:
+    limit = model.post_char_limit(rel or request.user.profile, text)
+    if model.post_length(rel or request.user.profile, text) > limit:
         return http.HttpResponseBadRequest(
             json.dumps(
                 {
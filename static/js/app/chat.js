@@ -287,17 +287,60 @@ var PYO = (function (PYO, $) {
         PYO.addPostTimeout(post, author_sequence_id, count);
     };
 
+    // GSM-7 SMS alphabet; any other character requires UCS-2 encoding
+    PYO.GSM7_CHARS = '@\u00a3$\u00a5\u00e8\u00e9\u00f9\u00ec\u00f2\u00c7\n\u00d8\u00f8\r\u00c5\u00e5' +
+        '\u0394_\u03a6\u0393\u039b\u03a9\u03a0\u03a8\u03a3\u0398\u039e\u00c6\u00e6\u00df\u00c9' +
+        ' !"#\u00a4%&\'()*+,-./0123456789:;<=>?' +
+        '\u00a1ABCDEFGHIJKLMNOPQRSTUVWXYZ\u00c4\u00d6\u00d1\u00dc\u00a7' +
+        '\u00bfabcdefghijklmnopqrstuvwxyz\u00e4\u00f6\u00f1\u00fc\u00e0';
+    // GSM-7 extension characters each take two characters of an SMS
+    PYO.GSM7_EXTENDED_CHARS = '\f^{}\\[~]|\u20ac';
+
+    // Return SMS length of text, and whether it requires UCS-2 encoding.
+    // Mirrors portfoliyo.sms.encoding; transliterations (if given) map
+    // characters to GSM-7 replacements, used only if all can be replaced.
+    PYO.smsLength = function (text, transliterations) {
+        var gsm7Length = function (str) {
+            var len = 0;
+            for (var i = 0; i < str.length; i++) {
+                var chr = str.charAt(i);
+                if (PYO.GSM7_CHARS.indexOf(chr) !== -1) {
+                    len = len + 1;
+                } else if (PYO.GSM7_EXTENDED_CHARS.indexOf(chr) !== -1) {
+                    len = len + 2;
+                } else {
+                    return null;
+                }
+            }
+            return len;
+        };
+        var len = gsm7Length(text);
+        if (len === null && transliterations) {
+            var replaced = text.replace(/[^\x00-\x7f]/g, function (chr) {
+                return transliterations.hasOwnProperty(chr) ? transliterations[chr] : chr;
+            });
+            len = gsm7Length(replaced);
+        }
+        if (len === null) {
+            return { length: text.length, unicode: true };
+        }
+        return { length: len, unicode: false };
+    };
+
     PYO.characterCount = function (container) {
         if ($(container).length) {
             var context = $(container);
             var form = context.find('form.message-form');
             var textarea = form.find('#message-text');
-            var limit = form.data('char-limit');
+            var gsm7Limit = form.data('char-limit');
+            var unicodeLimit = form.data('unicode-char-limit');
+            var transliterations = form.data('sms-transliterations');
             var count = form.find('.charcount');
             var button = form.find('.action-post');
             var updateCount = function () {
-                var chars = $.trim(textarea.val()).length;
-                var remain = limit - chars;
+                var sms = PYO.smsLength($.trim(textarea.val()), transliterations);
+                var limit = sms.unicode ? unicodeLimit : gsm7Limit;
+                var remain = limit - sms.length;
                 if (remain < 0) {
                     count.addClass('overlimit');
                     button.not('.disabled').attr('disabled', 'disabled');
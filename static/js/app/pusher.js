@@ -53,6 +53,8 @@ var PYO = (function (PYO, $) {
         PYO.channel.bind('message_posted', function (data) {
             if (data && data.objects && data.objects.length) {
                 $.each(data.objects, function () {
+                    // the same event data is sent to all users
+                    this.mine = this.author_id === PYO.activeUserId;
                     if (this.student_id) {
                         if (PYO.feed.length && PYO.activeStudentId && this.student_id === PYO.activeStudentId) {
                             addNewPost(this, true);